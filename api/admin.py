@@ -34,12 +34,12 @@ class DepartmentAdminConfig(admin.ModelAdmin):
 
 class QuestionAdminConfig(admin.ModelAdmin):
     model = Question
-    list_display = ('title', 'scope',)
+    list_display = ('title', 'scope', 'is_hidden',)
 
 
 class AnswerAdminConfig(admin.ModelAdmin):
     model = Answer
-    list_display = ('question',)
+    list_display = ('question', 'is_hidden',)
 
 
 class AnswerFlagAdminConfig(admin.ModelAdmin):
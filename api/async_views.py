@@ -0,0 +1,159 @@
+"""
+Async variants of the read endpoints, for deployments served through
+askvce.asgi.
+
+Under ASGI a DRF view holds a worker thread for the whole request. These
+views run on the event loop instead and leave it only for queries,
+through the async ORM, and for serialization, which may still query for
+tags, has_voted and vote counts. They share querysets, pagination, row
+serializers, rendering and ETags with their counterparts in api.views, so
+both return the same responses.
+
+The async queryset API needs Django 4.1 or newer.
+"""
+import functools
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed
+from rest_framework import exceptions, status
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import exception_handler
+from api import cache, fast_serializers
+from api.cache import etag_matches, not_modified, question_etag, question_version, versioned
+from api.models import Answer, Department, Question
+from api.pagination import KeysetPagination
+from api.renderers import FastJSONRenderer
+from api.views import ANSWER_SORTS, QUESTION_SORTS, filter_ranked, filter_tags, sort_ordering
+
+
+def handle_exception(request, exc):
+    """
+    Turns `exc` into the error response a DRF view would have sent.
+    """
+    if isinstance(exc, ObjectDoesNotExist):
+        exc = Http404()
+    if isinstance(exc, ValidationError):
+        # invalid input reaching the ORM, such as a malformed lookup value
+        exc = exceptions.ValidationError(exc.messages)
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        header = request.authenticators[0].authenticate_header(
+            request) if request.authenticators else None
+        if header:
+            exc.auth_header = header
+        else:
+            exc.status_code = status.HTTP_403_FORBIDDEN
+    return exception_handler(exc, {'request': request})
+
+
+def render(response):
+    content = b'' if response.data is None else FastJSONRenderer().render(response.data)
+    rendered = HttpResponse(content, status=response.status_code,
+                            content_type='application/json')
+    for name, value in response.items():
+        if name.lower() != 'content-type':
+            rendered[name] = value
+    return rendered
+
+
+def read_view(authenticated=True):
+    """
+    Wraps an async view taking a DRF Request and returning a DRF Response:
+    GET only, DRF authentication and error responses, JSON rendering.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return HttpResponseNotAllowed(['GET', 'HEAD'])
+            request = Request(request, authenticators=[
+                auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+            try:
+                user = await sync_to_async(lambda: request.user)()
+                if authenticated and not user.is_authenticated:
+                    raise exceptions.NotAuthenticated()
+                response = await view(request, **kwargs)
+            except (exceptions.APIException, Http404, ObjectDoesNotExist, ValidationError) as exc:
+                response = handle_exception(request, exc)
+            return render(response)
+        return wrapper
+    return decorator
+
+
+async def serialize(row_serializer, queryset, request, paginator=None, plan=None):
+    """
+    Fetches the rows of `queryset` (the requested page of it with a
+    paginator) and serializes them.
+    """
+    plan = plan or row_serializer.plan
+    if paginator is None:
+        rows = [row async for row in row_serializer.values(queryset, plan=plan)]
+    else:
+        ordering = [name.lstrip('-') for name in paginator.get_ordering(None)]
+        rows = paginator.paginate_results([row async for row in paginator.get_page_queryset(
+            row_serializer.values(queryset, *ordering, plan=plan), request)])
+    return await sync_to_async(row_serializer.serialize)(rows, request, plan)
+
+
+@read_view(authenticated=False)
+async def department_list(request):
+    reference = cache.departments
+    version = await sync_to_async(reference.version)()
+    etag = reference.etag(version)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    data = reference.peek(version)
+    if data is None:
+        rows = await serialize(fast_serializers.departments, Department.objects.all(), request)
+        data = reference.get(version, lambda: rows)
+    return Response(data, headers={'ETag': etag})
+
+
+@read_view()
+async def question_list(request):
+    queryset = filter_ranked(filter_tags(Question.objects.visible_to(
+        request.user).for_display(), request.query_params), request.query_params)
+    paginator = KeysetPagination()
+    paginator.ordering = sort_ordering(QUESTION_SORTS, request.query_params)
+    return paginator.get_paginated_response(
+        await serialize(fast_serializers.questions, queryset, request, paginator,
+                        fast_serializers.questions.plan_for(request)))
+
+
+@read_view()
+async def question_detail(request, pk):
+    etag = question_etag(request, await question_version(request, pk).afirst())
+    if etag is None:
+        raise Http404
+    if not versioned(request):
+        etag = None
+    elif etag_matches(request, etag):
+        return not_modified(etag)
+    rows = await serialize(fast_serializers.questions,
+                           Question.objects.visible_to(request.user).filter(pk=pk), request,
+                           plan=fast_serializers.questions.plan_for(request))
+    if not rows:
+        raise Http404
+    return Response(rows[0], headers={'ETag': etag} if etag else None)
+
+
+@read_view()
+async def answer_list(request, pk):
+    etag = question_etag(request, await question_version(request, pk).afirst())
+    if etag is None:
+        raise Http404
+    if not versioned(request):
+        etag = None
+    elif etag_matches(request, etag):
+        return not_modified(etag)
+    queryset = Answer.objects.for_display().filter(
+        question_id=pk, is_active=True, is_hidden=False)
+    paginator = KeysetPagination()
+    paginator.ordering = sort_ordering(ANSWER_SORTS, request.query_params)
+    response = paginator.get_paginated_response(
+        await serialize(fast_serializers.answers, queryset, request, paginator,
+                        fast_serializers.answers.plan_for(request)))
+    if etag:
+        response['ETag'] = etag
+    return response
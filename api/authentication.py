@@ -0,0 +1,105 @@
+"""
+JWT authentication resolving users from a short-lived in-process cache.
+
+SIMPLE_JWT identifies users by htno, so plain JWTAuthentication selects
+the user on every request. Here the user is kept per htno for
+AUTH_USER_CACHE_TTL seconds, tagged with the `users` version stamp of
+api.cache. Saving or deleting a user moves the stamp once the write
+commits, which drops every cached user in every worker process; bulk
+updates, which send no signals, are covered by the TTL alone. Cached
+users still go through the token checks of JWTAuthentication.get_user.
+"""
+import copy
+import threading
+import time
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from api.cache import VersionStamp
+
+
+class UserCache:
+    """
+    Users by htno, each kept for AUTH_USER_CACHE_TTL seconds or until the
+    version stamp moves. Dead entries are pruned at most once per TTL,
+    when a user is added.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stamp = VersionStamp('users')
+        self.clear()
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'AUTH_USER_CACHE_TTL', 30)
+
+    def version(self):
+        return self.stamp.version()
+
+    def get(self, htno, version):
+        entry = self.entries.get(htno)
+        if entry is None or entry[0] < time.monotonic() or entry[1] != version:
+            return None
+        # requests may set attributes on their user, so each gets a copy
+        return copy.copy(entry[2])
+
+    def set(self, htno, user, version):
+        now = time.monotonic()
+        with self.lock:
+            if now >= self.next_prune:
+                self.entries = {key: entry for key, entry in self.entries.items()
+                                if entry[0] >= now and entry[1] == version}
+                self.next_prune = now + self.ttl
+            self.entries[htno] = (now + self.ttl, version, user)
+
+    def invalidate(self):
+        """
+        Drops every cached user, in all workers, once the current
+        transaction commits.
+        """
+        self.stamp.bump()
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+            self.next_prune = 0
+
+
+users = UserCache()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that only queries for users missing from the cache.
+    """
+
+    def get_user(self, validated_token):
+        htno = validated_token.get(api_settings.USER_ID_CLAIM)
+        if htno is None:
+            return super().get_user(validated_token)
+        # read before the select, so a user changed meanwhile is cached
+        # under the stamp the change replaces
+        version = users.version()
+        user = users.get(htno, version)
+        if user is None:
+            # raises for unknown and inactive users, so those are not cached
+            user = super().get_user(validated_token)
+            users.set(htno, user, version)
+            return copy.copy(user)
+        self.check_user(user, validated_token)
+        return user
+
+    def check_user(self, user, validated_token):
+        """
+        The checks JWTAuthentication.get_user makes on the user it selected.
+        """
+        if getattr(api_settings, 'CHECK_USER_IS_ACTIVE', True) and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(
+                _("The user's password has been changed."), code='password_changed')
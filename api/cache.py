@@ -0,0 +1,193 @@
+"""
+HTTP revalidation support: an in-process cache for reference data that
+almost never changes, and version based ETags for question pages.
+
+Every kind of reference data has a version stamp in the shared Django
+cache, so all worker processes agree on it. Writes replace the stamp once their
+transaction commits; each worker keeps its own serialized copy and only
+rebuilds it after the stamp moves. Responses carry the stamp as a strong
+ETag so clients can revalidate without any query or serialization.
+"""
+import hashlib
+import threading
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.http import Http404
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+from api import votes
+from api.models import PendingVote, Question
+
+
+def etag_matches(request, etag):
+    """
+    Weak comparison of `etag` against the request's If-None-Match header.
+    """
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return '*' in etags or any(
+        (candidate[2:] if candidate.startswith('W/') else candidate) == etag for candidate in etags)
+
+
+def not_modified(etag):
+    return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+
+class VersionStamp:
+    """
+    A version stamp in the shared Django cache, the same for every worker
+    process, that changes whenever the data it stands for does.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.key = 'reference-version:%s' % name
+
+    @property
+    def store(self):
+        return caches[getattr(settings, 'REFERENCE_CACHE_ALIAS', 'default')]
+
+    def version(self):
+        version = self.store.get(self.key)
+        if version is None:
+            # first worker to get here decides the stamp for everyone
+            self.store.add(self.key, uuid.uuid4().hex, timeout=None)
+            version = self.store.get(self.key)
+        return version
+
+    def bump(self):
+        """
+        Invalidates every worker's copy once the current transaction
+        commits, so no worker can rebuild from uncommitted data.
+        """
+        transaction.on_commit(lambda: self.store.set(
+            self.key, uuid.uuid4().hex, timeout=None))
+
+
+class ReferenceCache(VersionStamp):
+    """
+    Versioned in-process copy of one kind of reference data.
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.lock = threading.Lock()
+        self.entry = None
+
+    def etag(self, version):
+        return quote_etag('%s-%s' % (self.name, version))
+
+    def peek(self, version):
+        """
+        Returns the cached data if it is still at `version`, else None.
+        """
+        entry = self.entry
+        return entry[1] if entry is not None and entry[0] == version else None
+
+    def get(self, version, build):
+        entry = self.entry
+        if entry is None or entry[0] != version:
+            with self.lock:
+                entry = self.entry
+                if entry is None or entry[0] != version:
+                    entry = self.entry = (version, build())
+        return entry[1]
+
+
+departments = ReferenceCache('departments')
+tags = ReferenceCache('tags')
+
+
+class ReferenceListMixin:
+    """
+    Serves a list view from a ReferenceCache with ETag revalidation.
+    """
+
+    reference_cache = None
+    # a fast_serializers.RowSerializer to build the list with instead of
+    # the serializer_class
+    row_serializer = None
+
+    def list(self, request, *args, **kwargs):
+        version = self.reference_cache.version()
+        etag = self.reference_cache.etag(version)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        data = self.reference_cache.get(version, self.reference_data)
+        return Response(data, headers={'ETag': etag})
+
+    def reference_data(self):
+        if self.row_serializer is not None:
+            return self.row_serializer.serialize(self.row_serializer.values(self.get_queryset()))
+        return list(self.get_serializer(self.get_queryset(), many=True).data)
+
+
+def question_version(request, pk):
+    """
+    Query for what the ETags of question `pk`'s pages are built from: its
+    content_version, which is bumped by every write that changes what the
+    pages show, and the newest vote still queued against it when votes are
+    written behind.
+    """
+    questions = Question.objects.visible_to(request.user).filter(pk=pk)
+    fields = ['content_version']
+    if votes.write_behind():
+        questions = questions.annotate(pending=Subquery(PendingVote.objects.filter(
+            question_id=OuterRef('pk')).order_by('-id').values('id')[:1]))
+        fields.append('pending')
+    return questions.values_list(*fields)
+
+
+def versioned(request):
+    """
+    Whether the requested question page only changes with the question's
+    version. Expanded users change with their own rows, which it does not
+    follow.
+    """
+    return 'user' not in request.query_params.get('expand', '').replace(' ', '').split(',')
+
+
+def question_etag(request, version):
+    """
+    ETag for the requested page given the question_version row, or None
+    if the question is not visible.
+    """
+    if version is None:
+        return None
+    # has_voted differs per user and pages differ per cursor
+    key = '%s:%s:%s' % (':'.join(map(str, version)),
+                        request.user.pk, request.get_full_path())
+    return quote_etag(hashlib.sha1(key.encode()).hexdigest()[:24])
+
+
+class QuestionVersionMixin:
+    """
+    Answers conditional GETs for a question's pages, see question_version.
+    """
+
+    def version_etag(self, request):
+        return question_etag(request, question_version(request, self.kwargs['pk']).first())
+
+    # set once the version query has found the question visible, so the
+    # view need not check again
+    question_visible = False
+
+    def get(self, request, *args, **kwargs):
+        etag = self.version_etag(request)
+        if etag is None:
+            raise Http404
+        self.question_visible = True
+        if not versioned(request):
+            return super().get(request, *args, **kwargs)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            response['ETag'] = etag
+        return response
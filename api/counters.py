@@ -0,0 +1,82 @@
+"""
+Keeps the denormalized counters in step with the writes that affect them.
+"""
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from api import cache
+from api.models import Answer, Question, QuestionTag, Tag, TagCount
+
+
+def adjust_tag_counts(tag_ids, delta):
+    if tag_ids:
+        TagCount.objects.filter(tag_id__in=tag_ids).update(
+            question_count=F('question_count') + delta)
+        cache.tags.bump()
+
+
+def rebuild_tag_counts(tag_ids=None):
+    """
+    Recomputes the question counts of the given tags, or of all tags,
+    from the through table. Returns the number of counters fixed.
+    """
+    tags = Tag.objects.all() if tag_ids is None else Tag.objects.filter(
+        slug__in=tag_ids)
+    TagCount.objects.bulk_create(
+        [TagCount(tag_id=slug) for slug in tags.values_list('slug', flat=True)], ignore_conflicts=True)
+    counters = TagCount.objects.filter(tag__in=tags)
+    total = Coalesce(Subquery(QuestionTag.objects.filter(
+        tag_id=OuterRef('tag_id'), question__is_active=True, question__is_hidden=False).order_by(
+    ).values('tag_id').annotate(total=Count('*')).values('total')), 0)
+    stale = counters.exclude(question_count=total).count()
+    counters.update(question_count=total)
+    cache.tags.bump()
+    return stale
+
+
+def question_visibility_changed(question_id, visible):
+    """
+    Call after a question became visible, or stopped being visible.
+    """
+    tag_ids = list(QuestionTag.objects.filter(
+        question_id=question_id).values_list('tag_id', flat=True))
+    adjust_tag_counts(tag_ids, 1 if visible else -1)
+
+
+def bump_content_version(question_id):
+    """
+    Call after anything shown on the question's page or answer list changed.
+    """
+    Question.objects.filter(id=question_id).update(
+        content_version=F('content_version') + 1, rank_stale=True)
+
+
+def flag_question(question_id):
+    """
+    Counts a new flag against the question and hides it.
+    """
+    changes = {'flag_count': F('flag_count') + 1, 'is_hidden': True,
+               'content_version': F('content_version') + 1, 'rank_stale': True}
+    if Question.objects.filter(id=question_id, is_active=True, is_hidden=False).update(**changes):
+        question_visibility_changed(question_id, False)
+    else:
+        Question.objects.filter(id=question_id).update(**changes)
+
+
+def flag_answer(answer_id):
+    """
+    Counts a new flag against the answer, hides it and bumps the
+    content_version of its question.
+    """
+    Answer.objects.filter(id=answer_id).update(
+        flag_count=F('flag_count') + 1, is_hidden=True)
+    Question.objects.filter(id=Subquery(Answer.objects.filter(id=answer_id).values('question_id'))).update(
+        content_version=F('content_version') + 1, rank_stale=True)
+
+
+def deactivate_question(question_id):
+    changes = {'is_active': False,
+               'content_version': F('content_version') + 1, 'rank_stale': True}
+    if Question.objects.filter(id=question_id, is_active=True, is_hidden=False).update(**changes):
+        question_visibility_changed(question_id, False)
+    else:
+        Question.objects.filter(id=question_id).update(**changes)
@@ -0,0 +1,96 @@
+"""
+Bulk export of the Q&A corpus as NDJSON, one question per line with its
+answers, tags, vote and flag counts.
+
+Questions are read in keyset chunks on (created_at, id) with the answers
+and tags of each chunk fetched alongside, so memory stays bounded by the
+chunk size however large the tables are, and no transaction or cursor
+is held open between chunks while a slow client consumes the stream.
+"""
+import datetime
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from api.models import Answer, Question, QuestionTag
+
+CHUNK_SIZE = 1000
+
+QUESTION_FIELDS = ('id', 'title', 'body', 'user_id', 'scope', 'created_at',
+                   'is_active', 'is_hidden', 'vote_count', 'flag_count')
+ANSWER_FIELDS = ('id', 'question_id', 'user_id', 'body', 'created_at',
+                 'is_active', 'is_hidden', 'vote_count', 'flag_count')
+
+
+def parse_since(value):
+    """
+    Parses a --since / ?since= watermark, an ISO 8601 date or datetime.
+    Naive values are taken in the current time zone. Raises ValueError.
+    """
+    since = parse_datetime(value)
+    if since is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValueError('Enter a valid ISO 8601 date or datetime.')
+        since = datetime.datetime.combine(date, datetime.time())
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+def _record(row, fields):
+    record = dict(zip(fields, row))
+    record['user'] = record.pop('user_id')
+    record['votes'] = record.pop('vote_count')
+    record['flags'] = record.pop('flag_count')
+    return record
+
+
+def export_questions(since=None, chunk_size=CHUNK_SIZE):
+    """
+    Yields every question created after `since` (all of them if None) as
+    a dict, oldest first, with its tags and answers.
+    """
+    questions = Question.objects.order_by('created_at', 'id')
+    if since is not None:
+        questions = questions.filter(created_at__gt=since)
+    position = None
+    while True:
+        chunk = questions
+        if position is not None:
+            chunk = chunk.filter(Q(created_at__gt=position[0]) | Q(
+                created_at=position[0], id__gt=position[1]))
+        rows = list(chunk.values_list(*QUESTION_FIELDS)[:chunk_size])
+        if not rows:
+            return
+        ids = [row[0] for row in rows]
+
+        tags = {}
+        for question_id, tag_id in QuestionTag.objects.filter(
+                question_id__in=ids).order_by('tag_id').values_list('question_id', 'tag_id'):
+            tags.setdefault(question_id, []).append(tag_id)
+        answers = {}
+        for row in Answer.objects.filter(question_id__in=ids).order_by(
+                'created_at', 'id').values_list(*ANSWER_FIELDS):
+            answer = _record(row, ANSWER_FIELDS)
+            answers.setdefault(answer.pop('question_id'), []).append(answer)
+
+        for row in rows:
+            question = _record(row, QUESTION_FIELDS)
+            question['tags'] = tags.get(question['id'], [])
+            question['answers'] = answers.get(question['id'], [])
+            yield question
+        position = (rows[-1][QUESTION_FIELDS.index('created_at')], rows[-1][0])
+
+
+def to_line(question):
+    return json.dumps(question, cls=DjangoJSONEncoder) + '\n'
+
+
+def export_lines(since=None, chunk_size=CHUNK_SIZE):
+    """
+    Yields the export as NDJSON lines.
+    """
+    for question in export_questions(since, chunk_size):
+        yield to_line(question)
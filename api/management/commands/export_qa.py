@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.export import CHUNK_SIZE, export_questions, parse_since, to_line
+
+
+class Command(BaseCommand):
+    """
+    Streams the questions with their answers, tags and counters as NDJSON.
+    """
+
+    help = 'Export questions and answers as NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since',
+                            help='Only questions created after this ISO 8601 date or datetime.')
+        parser.add_argument('--output', '-o',
+                            help='File to write to, defaults to stdout.')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='Questions read per query.')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = parse_since(options['since'])
+            except ValueError as e:
+                raise CommandError('--since: %s' % e)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as out:
+                count, last = self.export(out, since, options['chunk_size'])
+        else:
+            count, last = self.export(self.stdout, since, options['chunk_size'])
+        # the newest created_at exported is the --since of the next run
+        self.stderr.write('Exported %d questions%s' % (
+            count, ' up to %s' % last.isoformat() if last else ''))
+
+    def export(self, out, since, chunk_size):
+        count, last = 0, None
+        for question in export_questions(since, chunk_size):
+            out.write(to_line(question))
+            count, last = count + 1, question['created_at']
+        return count, last
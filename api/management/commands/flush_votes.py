@@ -0,0 +1,36 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api.votes import flush_pending
+
+
+class Command(BaseCommand):
+    """
+    Applies votes queued by the write-behind vote path.
+    """
+
+    help = 'Apply queued votes to the vote tables and counters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Queued votes applied per transaction.')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep flushing instead of exiting once the queue is empty.')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to wait after finding the queue empty, with --loop.')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            with transaction.atomic():
+                flushed = flush_pending(options['batch_size'])
+            total += flushed
+            if flushed == options['batch_size']:
+                continue
+            if not options['loop']:
+                break
+            if total:
+                self.stdout.write('Flushed %d votes' % total)
+                total = 0
+            time.sleep(options['interval'])
+        self.stdout.write('Flushed %d votes' % total)
@@ -0,0 +1,176 @@
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from api.models import Department
+
+REQUIRED_COLUMNS = ('email', 'user_name', 'first_name', 'last_name', 'dob',
+                    'grad_year', 'htno', 'phone', 'password')
+OPTIONAL_COLUMNS = ('middle_name', 'department')
+UNIQUE_FIELDS = ('htno', 'phone', 'email', 'user_name')
+LOOKUP_SIZE = 1000
+
+
+def setup_worker(settings_module):
+    # pool workers are forked on Linux, but spawned on macOS and Windows
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+
+
+class Command(BaseCommand):
+    """
+    Creates student accounts from a CSV roster in bulk. Every row is
+    validated before anything is written, passwords are hashed across a
+    process pool, and the accounts are inserted with bulk_create.
+    """
+
+    help = 'Import students from a CSV roster.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'roster', help='CSV file with a header row naming the columns: %s, and optionally %s.' % (
+                ', '.join(REQUIRED_COLUMNS), ', '.join(OPTIONAL_COLUMNS)))
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows per INSERT.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Processes hashing passwords; 1 hashes in this process.')
+        parser.add_argument('--active', action='store_true',
+                            help='Create the accounts already activated.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only validate the roster.')
+
+    def handle(self, *args, **options):
+        rows = self.read(options['roster'])
+        accepted, errors = self.validate(rows, options['active'])
+        accepted, duplicates = self.check_unique(accepted)
+        errors = sorted(errors + duplicates)
+        for line, problems in errors:
+            for problem in problems:
+                self.stderr.write('line %d: %s' % (line, problem))
+
+        if options['dry_run']:
+            self.stdout.write('%d students valid, %d rows rejected' %
+                              (len(accepted), len(errors)))
+            return
+
+        hashes = self.hash_passwords(
+            [password for _, _, password in accepted], options['workers'])
+        users = []
+        for (_, user, _), password in zip(accepted, hashes):
+            user.password = password
+            users.append(user)
+        try:
+            with transaction.atomic():
+                get_user_model().objects.bulk_create(
+                    users, batch_size=options['batch_size'])
+        except IntegrityError as e:
+            raise CommandError(
+                'Nothing imported, an account was created concurrently (%s). '
+                'Re-run the import.' % e)
+        self.stdout.write('Imported %d students, %d rows rejected' %
+                          (len(users), len(errors)))
+
+    def read(self, path):
+        try:
+            with open(path, newline='', encoding='utf-8-sig') as f:
+                reader = csv.DictReader(f)
+                columns = set(reader.fieldnames or ())
+                missing = set(REQUIRED_COLUMNS) - columns
+                if missing:
+                    raise CommandError('Missing columns: %s' %
+                                       ', '.join(sorted(missing)))
+                unknown = columns - set(REQUIRED_COLUMNS) - \
+                    set(OPTIONAL_COLUMNS)
+                if unknown:
+                    raise CommandError('Unknown columns: %s' %
+                                       ', '.join(sorted(unknown)))
+                return [(reader.line_num, row) for row in reader]
+        except OSError as e:
+            raise CommandError(e)
+
+    def validate(self, rows, active):
+        """
+        Runs the model's field validation on every row. Returns the
+        accepted (line, user, password) triples and the rejected rows as
+        (line, problems) pairs.
+        """
+        model = get_user_model()
+        departments = dict(Department.objects.values_list('code', 'id'))
+        accepted, errors = [], []
+        for line, row in rows:
+            problems = []
+            if None in row:
+                problems.append('More values than columns')
+                row.pop(None)
+            row = {key: (value or '').strip() for key, value in row.items()}
+            department_id = None
+            if row.get('department'):
+                department_id = departments.get(row['department'].upper())
+                if department_id is None:
+                    problems.append('department: Unknown department %s' %
+                                    row['department'])
+            if not row['password']:
+                problems.append('password: This field cannot be blank.')
+            user = model(
+                email=model.objects.normalize_email(row['email']), user_name=row['user_name'],
+                first_name=row['first_name'], middle_name=row.get('middle_name', ''),
+                last_name=row['last_name'], dob=row['dob'] or None, grad_year=row['grad_year'] or None,
+                htno=row['htno'], phone=row['phone'], department_id=department_id, is_active=active)
+            try:
+                user.full_clean(
+                    exclude=['password', 'department'], validate_unique=False)
+            except ValidationError as e:
+                problems += ['%s: %s' % (field, ' '.join(messages))
+                             for field, messages in e.message_dict.items()]
+            if problems:
+                errors.append((line, problems))
+            else:
+                accepted.append((line, user, row['password']))
+        return accepted, errors
+
+    def check_unique(self, accepted):
+        """
+        Rejects rows clashing with an existing account or an earlier row,
+        with one query per unique field and thousand rows.
+        """
+        model = get_user_model()
+        taken = {}
+        for field in UNIQUE_FIELDS:
+            values = [getattr(user, field) for _, user, _ in accepted]
+            taken[field] = set()
+            for i in range(0, len(values), LOOKUP_SIZE):
+                taken[field].update(model.objects.filter(**{
+                    field + '__in': values[i:i + LOOKUP_SIZE]}).values_list(field, flat=True))
+
+        seen = {field: {} for field in UNIQUE_FIELDS}
+        unique, errors = [], []
+        for line, user, password in accepted:
+            problems = []
+            for field in UNIQUE_FIELDS:
+                value = getattr(user, field)
+                if value in taken[field]:
+                    problems.append('%s: %s already exists' % (field, value))
+                elif value in seen[field]:
+                    problems.append('%s: %s is also on line %d' %
+                                    (field, value, seen[field][value]))
+                else:
+                    seen[field][value] = line
+            if problems:
+                errors.append((line, problems))
+            else:
+                unique.append((line, user, password))
+        return unique, errors
+
+    def hash_passwords(self, passwords, workers):
+        if workers <= 1 or len(passwords) < 2:
+            return [make_password(password) for password in passwords]
+        with ProcessPoolExecutor(workers, initializer=setup_worker,
+                                 initargs=(settings.SETTINGS_MODULE,)) as pool:
+            return list(pool.map(make_password, passwords,
+                                 chunksize=max(1, len(passwords) // (workers * 4))))
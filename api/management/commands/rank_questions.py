@@ -0,0 +1,55 @@
+import time
+from django.core.management.base import BaseCommand
+from api.models import Question
+from api.ranking import drop_hidden, rank, stale_questions
+
+
+class Command(BaseCommand):
+    """
+    Keeps the hot scores of questions current, see api.ranking.
+    """
+
+    help = 'Recompute the hot scores of questions whose votes or answers changed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Questions scored per transaction.')
+        parser.add_argument('--full', action='store_true',
+                            help='Rescore every question, e.g. after changing the weights.')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep scoring instead of exiting once no score is stale.')
+        parser.add_argument('--interval', type=float, default=10.0,
+                            help='Seconds to wait after finding no stale score, with --loop.')
+
+    def rank_all(self, batch_size):
+        total, last = 0, 0
+        visible = Question.objects.filter(is_active=True, is_hidden=False)
+        while True:
+            pks = rank(visible.filter(pk__gt=last), batch_size)
+            total += len(pks)
+            if len(pks) < batch_size:
+                return total
+            last = pks[-1]
+
+    def rank_stale(self, batch_size):
+        total = 0
+        while True:
+            pks = rank(stale_questions(), batch_size)
+            total += len(pks)
+            if len(pks) < batch_size:
+                return total
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        while True:
+            removed = drop_hidden()
+            if options['full']:
+                ranked = self.rank_all(batch_size)
+                options['full'] = False
+            else:
+                ranked = self.rank_stale(batch_size)
+            if ranked or removed or not options['loop']:
+                self.stdout.write('Ranked %d questions, removed %d' % (ranked, removed))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
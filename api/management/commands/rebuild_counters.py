@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from api.counters import rebuild_tag_counts
+from api.models import Question, QuestionFlag, Answer, AnswerFlag
+
+
+class Command(BaseCommand):
+    """
+    Recomputes the denormalized counters from their source tables.
+    """
+
+    help = 'Rebuild the stored vote, flag and tag counters.'
+
+    def rebuild(self, model, field, source, fk):
+        total = source.objects.filter(**{fk: OuterRef('pk')}).order_by(
+        ).values(fk).annotate(total=Count('*')).values('total')
+        stale = model.objects.exclude(
+            **{field: Coalesce(Subquery(total), 0)}).count()
+        model.objects.update(**{field: Coalesce(Subquery(total), 0)})
+        return stale
+
+    def handle(self, *args, **options):
+        counters = (
+            (Question, 'vote_count', Question.votes.through, 'question'),
+            (Answer, 'vote_count', Answer.votes.through, 'answer'),
+            (Question, 'flag_count', QuestionFlag, 'question'),
+            (Answer, 'flag_count', AnswerFlag, 'answer'),
+        )
+        with transaction.atomic():
+            for model, field, source, fk in counters:
+                stale = self.rebuild(model, field, source, fk)
+                self.stdout.write('%s: fixed %d %s' %
+                                  (model.__name__, stale, field.replace('_', ' ')))
+            self.stdout.write('Tag: fixed %d question count' %
+                              rebuild_tag_counts())
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from api.reputation import reconcile
+
+
+class Command(BaseCommand):
+    """
+    Checks the incrementally kept reputations against the vote, answer
+    and flag tables, see api.reputation.
+    """
+
+    help = 'Recompute user reputations and fix the ones that drifted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report, and fail if any reputation drifted.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            stale = reconcile(fix=not options['check'])
+        if not options['check']:
+            self.stdout.write('User: fixed %d usefullness score' % stale)
+        elif stale:
+            raise CommandError('%d usefullness scores drifted' % stale)
+        else:
+            self.stdout.write('User: no usefullness score drifted')
@@ -1,4 +1,5 @@
 from django.contrib.auth.models import BaseUserManager
+from django.db import models
 from django.utils.translation import gettext_lazy as _
 from askvce.settings import EMAIL_FORMAT
 import re
@@ -45,3 +46,69 @@ class UserManager(BaseUserManager):
         if other_fields.get('is_staff') is not True:
             raise ValueError('Superuser must be assigned to is_staff=True.')
         return self.create_user(email, user_name, first_name, last_name, dob, grad_year, htno, phone, password, **other_fields)
+
+
+class QuestionQuerySet(models.QuerySet):
+    """
+    Custom QuerySet for questions to filter by visibility
+    """
+
+    def visible(self):
+        return self.filter(is_active=True, is_hidden=False)
+
+    def for_display(self):
+        """
+        Only the columns QuestionSerializer and the keyset pagination read,
+        with the tag slugs prefetched; the author is shown by user_id.
+        """
+        tags = self.model._meta.get_field('tags').related_model.objects.only('pk').order_by('pk')
+        return self.only('id', 'title', 'body', 'user', 'scope', 'vote_count', 'created_at',
+                         ).prefetch_related(models.Prefetch('tags', queryset=tags))
+
+    def visible_to(self, user):
+        """
+        Questions the user may see given each question's scope, matched on
+        the audience stored with the question rather than on its author.
+
+        Each branch pins both leading columns of question_audience_idx and
+        repeats its condition, so every branch is a range scan on the
+        partial index; planners only match a partial index to an OR branch
+        that implies its condition by itself.
+        """
+        shown = {'is_active': True, 'is_hidden': False}
+        return self.filter(
+            models.Q(**shown, audience_grad_year=None, audience_department=None) |
+            models.Q(**shown, audience_grad_year=user.grad_year, audience_department=None) |
+            models.Q(**shown, audience_grad_year=user.grad_year, audience_department=user.department_id))
+
+    def tagged(self, tags, match_all=True):
+        """
+        Questions carrying all (or with match_all=False, any) of the given
+        tag slugs, through the (tag, question) index of the through table.
+        """
+        tagged = self.model.tags.through.objects.filter(tag_id__in=tags)
+        if match_all:
+            tagged = tagged.order_by().values('question_id').annotate(
+                matched=models.Count('tag_id')).filter(matched=len(set(tags)))
+        return self.filter(id__in=tagged.values('question_id'))
+
+
+class AnswerQuerySet(models.QuerySet):
+    """
+    Custom QuerySet for answers
+    """
+
+    def for_display(self):
+        """
+        Only the columns AnswerSerializer and the keyset pagination read.
+        """
+        return self.only('id', 'question', 'user', 'body', 'vote_count', 'created_at')
+
+    def visible_to(self, user):
+        """
+        Answers the user may see: shown answers to questions visible to
+        them.
+        """
+        questions = self.model._meta.get_field('question').related_model.objects
+        return self.filter(is_active=True, is_hidden=False,
+                           question__in=questions.visible_to(user).values('pk'))
@@ -0,0 +1,250 @@
+"""
+Per-view request metrics: request counts, a latency histogram, and the
+number and duration of the SQL queries, keyed by the resolved URL name.
+
+Every worker process aggregates into its own in-memory registry, under a
+lock held only for a few dict updates per request. When METRICS_DIR is
+set, each process also writes a snapshot of its registry to
+<METRICS_DIR>/<pid>.json at most every METRICS_FLUSH_INTERVAL seconds,
+and /metrics sums the snapshots of all the processes, so it reports the
+whole server whichever gunicorn worker answers the scrape. The snapshots
+of exited workers are kept so the counters never go down; clear the
+directory when deploying.
+"""
+import bisect
+import json
+import os
+import tempfile
+import threading
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UNRESOLVED = '<unresolved>'
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+class Registry:
+    """
+    The metrics of this process, by (view, method).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.series = {}
+        self.flushed_at = time.monotonic()
+
+    def observe(self, view, method, status, seconds, queries, db_seconds):
+        bucket = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        with self.lock:
+            if self.pid != os.getpid():
+                # forked from a process that already served requests
+                self.reset()
+            series = self.series.get((view, method))
+            if series is None:
+                series = self.series[(view, method)] = {
+                    'statuses': {}, 'buckets': [0] * (len(LATENCY_BUCKETS) + 1),
+                    'seconds': 0.0, 'queries': 0, 'db_seconds': 0.0}
+            series['statuses'][status] = series['statuses'].get(status, 0) + 1
+            series['buckets'][bucket] += 1
+            series['seconds'] += seconds
+            series['queries'] += queries
+            series['db_seconds'] += db_seconds
+            due = time.monotonic() - self.flushed_at >= settings.METRICS_FLUSH_INTERVAL
+        if due:
+            self.flush()
+
+    def snapshot(self):
+        with self.lock:
+            if self.pid != os.getpid():
+                self.reset()
+            self.flushed_at = time.monotonic()
+            return [{'view': view, 'method': method, 'statuses': dict(series['statuses']),
+                     'buckets': list(series['buckets']), 'seconds': series['seconds'],
+                     'queries': series['queries'], 'db_seconds': series['db_seconds']}
+                    for (view, method), series in self.series.items()]
+
+    def flush(self):
+        """
+        Writes this process's snapshot to METRICS_DIR, atomically.
+        """
+        directory = settings.METRICS_DIR
+        if not directory:
+            return
+        snapshot = self.snapshot()
+        os.makedirs(directory, exist_ok=True)
+        fd, path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(path, os.path.join(directory, '%d.json' % os.getpid()))
+
+    def collect(self):
+        """
+        The series of every process, summed.
+        """
+        directory = settings.METRICS_DIR
+        if directory:
+            self.flush()
+            snapshots = []
+            for name in os.listdir(directory):
+                if name.endswith('.json'):
+                    try:
+                        with open(os.path.join(directory, name)) as f:
+                            snapshots.append(json.load(f))
+                    except (OSError, ValueError):
+                        continue
+        else:
+            snapshots = [self.snapshot()]
+
+        merged = {}
+        for snapshot in snapshots:
+            for series in snapshot:
+                total = merged.get((series['view'], series['method']))
+                if total is None:
+                    merged[(series['view'], series['method'])] = series
+                    continue
+                for status, count in series['statuses'].items():
+                    total['statuses'][status] = total['statuses'].get(status, 0) + count
+                total['buckets'] = [a + b for a, b in zip(total['buckets'], series['buckets'])]
+                for field in ('seconds', 'queries', 'db_seconds'):
+                    total[field] += series[field]
+        return [merged[key] for key in sorted(merged)]
+
+
+registry = Registry()
+
+
+def _labels(**labels):
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('\\', r'\\').replace(
+        '"', r'\"').replace('\n', r'\n')) for name, value in labels.items())
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def exposition(series_list):
+    """
+    Renders collected series in the Prometheus text exposition format.
+    """
+    lines = [
+        '# HELP askvce_requests_total Requests served, by URL name, method and status.',
+        '# TYPE askvce_requests_total counter',
+    ]
+    for series in series_list:
+        for status, count in sorted(series['statuses'].items()):
+            lines.append('askvce_requests_total%s %d' % (_labels(
+                view=series['view'], method=series['method'], status=status), count))
+    lines += [
+        '# HELP askvce_request_duration_seconds Time to respond, by URL name and method.',
+        '# TYPE askvce_request_duration_seconds histogram',
+    ]
+    for series in series_list:
+        count = 0
+        for bound, observed in zip(LATENCY_BUCKETS + ('+Inf',), series['buckets']):
+            count += observed
+            lines.append('askvce_request_duration_seconds_bucket%s %d' % (_labels(
+                view=series['view'], method=series['method'], le=bound), count))
+        labels = _labels(view=series['view'], method=series['method'])
+        lines.append('askvce_request_duration_seconds_sum%s %s' % (labels, _number(series['seconds'])))
+        lines.append('askvce_request_duration_seconds_count%s %d' % (labels, count))
+    for name, field, description in (
+            ('askvce_db_queries_total', 'queries', 'SQL queries run'),
+            ('askvce_db_duration_seconds_total', 'db_seconds', 'Time spent in SQL queries')):
+        lines += ['# HELP %s %s, by URL name and method.' % (name, description),
+                  '# TYPE %s counter' % name]
+        for series in series_list:
+            lines.append('%s%s %s' % (name, _labels(
+                view=series['view'], method=series['method']), _number(series[field])))
+    return '\n'.join(lines) + '\n'
+
+
+class QueryCounter:
+    """
+    Database execute wrapper counting the queries of a request and the
+    time spent in them.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.queries += 1
+
+
+def install(execute_wrapper):
+    """
+    Enters `execute_wrapper` on every database connection of this thread
+    and returns the contexts, for uninstall().
+    """
+    contexts = [connection.execute_wrapper(execute_wrapper) for connection in connections.all()]
+    for context in contexts:
+        context.__enter__()
+    return contexts
+
+
+def uninstall(contexts):
+    for context in reversed(contexts):
+        context.__exit__(None, None, None)
+
+
+class MetricsMiddleware:
+    """
+    Records every request in the registry. Keep it first in MIDDLEWARE so
+    the time of the other middleware is included.
+
+    Under ASGI the queries of a request run on the thread that Django
+    dedicates to its sync_to_async calls, so the counter is installed
+    there, and the rest of the chain stays async.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        counter = QueryCounter()
+        start = time.perf_counter()
+        contexts = install(counter)
+        try:
+            response = self.get_response(request)
+        finally:
+            uninstall(contexts)
+        self.observe(request, response, start, counter)
+        return response
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        start = time.perf_counter()
+        contexts = await sync_to_async(install)(counter)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(uninstall)(contexts)
+        self.observe(request, response, start, counter)
+        return response
+
+    def observe(self, request, response, start, counter):
+        # a streamed response is timed up to its first byte
+        match = getattr(request, 'resolver_match', None)
+        method = request.method if request.method in METHODS else 'other'
+        registry.observe(match.view_name if match else UNRESOLVED, method,
+                         response.status_code, time.perf_counter() - start,
+                         counter.queries, counter.seconds)
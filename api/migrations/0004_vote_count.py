@@ -0,0 +1,35 @@
+# Generated by Django 3.2.4 on 2026-10-18 09:12
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_vote_count(apps, schema_editor):
+    for model_name, fk in (('Question', 'question'), ('Answer', 'answer')):
+        model = apps.get_model('api', model_name)
+        through = model.votes.through
+        votes = through.objects.filter(**{fk: OuterRef('pk')}).order_by(
+        ).values(fk).annotate(total=Count('*')).values('total')
+        model.objects.update(vote_count=Coalesce(Subquery(votes), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_alter_questionflag_reason'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='vote_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='vote_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_vote_count, migrations.RunPython.noop),
+    ]
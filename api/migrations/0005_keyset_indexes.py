@@ -0,0 +1,21 @@
+# Generated by Django 3.2.4 on 2026-10-18 11:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_vote_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(fields=['question', '-created_at', '-id'], name='answer_question_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['-created_at', '-id'], name='question_created_idx'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 3.2.4 on 2026-10-18 11:25
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_flag_state(apps, schema_editor):
+    for model_name, flag_name, fk in (('Question', 'QuestionFlag', 'question'), ('Answer', 'AnswerFlag', 'answer')):
+        model = apps.get_model('api', model_name)
+        flag = apps.get_model('api', flag_name)
+        flags = flag.objects.filter(**{fk: OuterRef('pk')}).order_by(
+        ).values(fk).annotate(total=Count('*')).values('total')
+        model.objects.update(flag_count=Coalesce(Subquery(flags), 0))
+        model.objects.filter(flag_count__gt=0).update(is_hidden=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='answer',
+            name='answer_question_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='question',
+            name='question_created_idx',
+        ),
+        migrations.AddField(
+            model_name='answer',
+            name='flag_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='answer',
+            name='is_hidden',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='flag_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='is_hidden',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(populate_flag_state, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_hidden', False)), fields=['question', '-created_at', '-id'], name='answer_visible_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_hidden', False)), fields=['-created_at', '-id'], name='question_visible_idx'),
+        ),
+    ]
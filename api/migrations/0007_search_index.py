@@ -0,0 +1,114 @@
+# Generated by Django 3.2.4 on 2026-10-18 11:40
+
+from django.db import migrations
+
+# The search index as of this migration, kept here rather than imported
+# from api.search so later changes there cannot change what it does.
+
+POSTGRES_INSTALL = (
+    """ALTER TABLE api_question ADD COLUMN IF NOT EXISTS search_vector tsvector
+       GENERATED ALWAYS AS (
+           setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+           setweight(to_tsvector('english', coalesce(body, '')), 'B')) STORED""",
+    """CREATE INDEX IF NOT EXISTS question_search_idx
+       ON api_question USING gin (search_vector)""",
+    """ALTER TABLE api_answer ADD COLUMN IF NOT EXISTS search_vector tsvector
+       GENERATED ALWAYS AS (
+           setweight(to_tsvector('english', coalesce(body, '')), 'B')) STORED""",
+    """CREATE INDEX IF NOT EXISTS answer_search_idx
+       ON api_answer USING gin (search_vector)""",
+)
+
+POSTGRES_UNINSTALL = (
+    "DROP INDEX IF EXISTS question_search_idx",
+    "ALTER TABLE api_question DROP COLUMN IF EXISTS search_vector",
+    "DROP INDEX IF EXISTS answer_search_idx",
+    "ALTER TABLE api_answer DROP COLUMN IF EXISTS search_vector",
+)
+
+SQLITE_TABLES = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS api_question_fts USING fts5(
+           title, body, content='api_question', content_rowid='id',
+           tokenize='porter unicode61')""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS api_answer_fts USING fts5(
+           body, content='api_answer', content_rowid='id',
+           tokenize='porter unicode61')""",
+)
+
+# api.search.repair_search_index re-creates these after table rebuilds
+SQLITE_TRIGGERS = {
+    'api_question_fts_ai': """
+        CREATE TRIGGER IF NOT EXISTS api_question_fts_ai AFTER INSERT ON api_question BEGIN
+            INSERT INTO api_question_fts(rowid, title, body)
+            VALUES (new.id, new.title, new.body);
+        END""",
+    'api_question_fts_ad': """
+        CREATE TRIGGER IF NOT EXISTS api_question_fts_ad AFTER DELETE ON api_question BEGIN
+            INSERT INTO api_question_fts(api_question_fts, rowid, title, body)
+            VALUES ('delete', old.id, old.title, old.body);
+        END""",
+    'api_question_fts_au': """
+        CREATE TRIGGER IF NOT EXISTS api_question_fts_au AFTER UPDATE OF title, body ON api_question BEGIN
+            INSERT INTO api_question_fts(api_question_fts, rowid, title, body)
+            VALUES ('delete', old.id, old.title, old.body);
+            INSERT INTO api_question_fts(rowid, title, body)
+            VALUES (new.id, new.title, new.body);
+        END""",
+    'api_answer_fts_ai': """
+        CREATE TRIGGER IF NOT EXISTS api_answer_fts_ai AFTER INSERT ON api_answer BEGIN
+            INSERT INTO api_answer_fts(rowid, body) VALUES (new.id, new.body);
+        END""",
+    'api_answer_fts_ad': """
+        CREATE TRIGGER IF NOT EXISTS api_answer_fts_ad AFTER DELETE ON api_answer BEGIN
+            INSERT INTO api_answer_fts(api_answer_fts, rowid, body)
+            VALUES ('delete', old.id, old.body);
+        END""",
+    'api_answer_fts_au': """
+        CREATE TRIGGER IF NOT EXISTS api_answer_fts_au AFTER UPDATE OF body ON api_answer BEGIN
+            INSERT INTO api_answer_fts(api_answer_fts, rowid, body)
+            VALUES ('delete', old.id, old.body);
+            INSERT INTO api_answer_fts(rowid, body) VALUES (new.id, new.body);
+        END""",
+}
+
+SQLITE_REBUILD = (
+    "INSERT INTO api_question_fts(api_question_fts) VALUES ('rebuild')",
+    "INSERT INTO api_answer_fts(api_answer_fts) VALUES ('rebuild')",
+)
+
+SQLITE_UNINSTALL = tuple(
+    'DROP TRIGGER IF EXISTS %s' % name for name in SQLITE_TRIGGERS) + (
+    'DROP TABLE IF EXISTS api_question_fts',
+    'DROP TABLE IF EXISTS api_answer_fts',
+)
+
+
+INSTALL = {
+    'postgresql': POSTGRES_INSTALL,
+    'sqlite': SQLITE_TABLES + tuple(SQLITE_TRIGGERS.values()) + SQLITE_REBUILD,
+}
+
+UNINSTALL = {
+    'postgresql': POSTGRES_UNINSTALL,
+    'sqlite': SQLITE_UNINSTALL,
+}
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        # other databases go without a search index
+        with schema_editor.connection.cursor() as cursor:
+            for sql in statements.get(schema_editor.connection.vendor, ()):
+                cursor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_flag_state'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(INSTALL), run(UNINSTALL)),
+    ]
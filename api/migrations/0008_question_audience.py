@@ -0,0 +1,40 @@
+# Generated by Django 3.2.4 on 2026-10-18 11:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def populate_audience(apps, schema_editor):
+    Question = apps.get_model('api', 'Question')
+    User = apps.get_model('api', 'User')
+    author = User.objects.filter(pk=OuterRef('user_id'))
+    Question.objects.exclude(scope='college').update(
+        audience_grad_year=Subquery(author.values('grad_year')))
+    Question.objects.filter(scope='branch_grad_year').update(
+        audience_department=Subquery(author.values('department_id')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='audience_department',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.department'),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='audience_grad_year',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(populate_audience, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_hidden', False)), fields=['audience_grad_year', 'audience_department', '-created_at', '-id'], name='question_audience_idx'),
+        ),
+    ]
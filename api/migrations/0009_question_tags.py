@@ -0,0 +1,63 @@
+# Generated by Django 3.2.4 on 2026-10-18 11:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_tag_counts(apps, schema_editor):
+    Tag = apps.get_model('api', 'Tag')
+    TagCount = apps.get_model('api', 'TagCount')
+    QuestionTag = apps.get_model('api', 'QuestionTag')
+    TagCount.objects.bulk_create(
+        [TagCount(tag_id=slug) for slug in Tag.objects.values_list('slug', flat=True)])
+    questions = QuestionTag.objects.filter(
+        tag_id=OuterRef('tag_id'), question__is_active=True, question__is_hidden=False).order_by(
+    ).values('tag_id').annotate(total=Count('*')).values('total')
+    TagCount.objects.update(question_count=Coalesce(Subquery(questions), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_question_audience'),
+    ]
+
+    operations = [
+        # The auto-created through table is kept as is; only the state
+        # learns about the explicit model so an index can be added to it.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='QuestionTag',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.question')),
+                        ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.tag')),
+                    ],
+                    options={
+                        'db_table': 'api_question_tags',
+                        'unique_together': {('question', 'tag')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='question',
+                    name='tags',
+                    field=models.ManyToManyField(through='api.QuestionTag', to='api.Tag'),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='questiontag',
+            index=models.Index(fields=['tag', 'question'], name='question_tag_idx'),
+        ),
+        migrations.CreateModel(
+            name='TagCount',
+            fields=[
+                ('tag', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counter', serialize=False, to='api.tag')),
+                ('question_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(populate_tag_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.4 on 2026-10-18 11:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_question_tags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='content_version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.4 on 2026-10-18 11:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_content_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingVote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('question', 'Question'), ('answer', 'Answer')], max_length=8)),
+                ('object_id', models.BigIntegerField()),
+                ('upvote', models.BooleanField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.question')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'object_id', 'user'], name='pending_vote_object_idx'), models.Index(fields=['question'], name='pending_vote_question_idx')],
+            },
+        ),
+    ]
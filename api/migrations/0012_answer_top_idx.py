@@ -0,0 +1,17 @@
+# Generated by Django 3.2.4 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_pending_vote'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_hidden', False)), fields=['question', '-vote_count', '-created_at', '-id'], name='answer_top_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.4 on 2026-10-18 12:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_answer_top_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionRank',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rank', serialize=False, to='api.question')),
+                ('score', models.FloatField()),
+                ('content_version', models.PositiveIntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-score', '-question'], name='question_rank_score_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.2.4 on 2026-10-18 13:10
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_usefullness_score(apps, schema_editor):
+    # api.reputation.expected_score() with the weights of this migration
+    User = apps.get_model('api', 'User')
+    Question = apps.get_model('api', 'Question')
+    Answer = apps.get_model('api', 'Answer')
+    QuestionFlag = apps.get_model('api', 'QuestionFlag')
+    AnswerFlag = apps.get_model('api', 'AnswerFlag')
+
+    def count(queryset, user_field):
+        return Coalesce(Subquery(queryset.filter(**{user_field: OuterRef('pk')}).order_by(
+        ).values(user_field).annotate(total=Count('*')).values('total')), 0)
+
+    User.objects.update(usefullness_score=(
+        Value(3)
+        + 2 * count(Question.votes.through.objects, 'question__user')
+        + 5 * count(Answer.votes.through.objects, 'answer__user')
+        + 1 * count(Answer.objects, 'user')
+        - 5 * count(QuestionFlag.objects, 'question__user')
+        - 5 * count(AnswerFlag.objects, 'answer__user')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_question_rank'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['department', '-usefullness_score', '-id'], name='user_leaderboard_idx'),
+        ),
+        migrations.RunPython(populate_usefullness_score, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:20
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def clear_current_ranks(apps, schema_editor):
+    # questions ranked as of their content_version start out clean
+    Question = apps.get_model('api', 'Question')
+    QuestionRank = apps.get_model('api', 'QuestionRank')
+    Question.objects.filter(content_version=Subquery(QuestionRank.objects.filter(
+        question_id=OuterRef('pk')).values('content_version'))).update(rank_stale=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_user_leaderboard_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='rank_stale',
+            field=models.BooleanField(default=True, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_hidden', False), ('rank_stale', True)), fields=['id'], name='question_rank_stale_idx'),
+        ),
+        migrations.RunPython(clear_current_ranks, migrations.RunPython.noop),
+    ]
@@ -4,7 +4,7 @@ from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
 from django.core.validators import RegexValidator
-from .managers import UserManager
+from .managers import UserManager, QuestionQuerySet, AnswerQuerySet
 
 
 class Department(models.Model):
@@ -63,6 +63,8 @@ class User(AbstractBaseUser, PermissionsMixin):
         indexes = [
             models.Index(fields=['htno'], name='htno_idx'),
             models.Index(fields=['phone'], name='phone_idx'),
+            models.Index(fields=['department', '-usefullness_score', '-id'], name='user_leaderboard_idx',
+                         condition=models.Q(is_active=True)),
         ]
 
 
@@ -100,19 +102,113 @@ class Question(models.Model):
     user = models.ForeignKey(User, on_delete=models.PROTECT)
     is_active = models.BooleanField(default=True)
     scope = models.CharField(max_length=50, choices=scope, default='college')
-    tags = models.ManyToManyField(Tag)
+    tags = models.ManyToManyField(Tag, through='QuestionTag')
     users_flagged = models.ManyToManyField(
         User, related_name='questions_flagged', through='QuestionFlag')
     votes = models.ManyToManyField(
         User, related_name='questions_upvoted', blank=True)
+    vote_count = models.PositiveIntegerField(default=0)
+    flag_count = models.PositiveIntegerField(default=0)
+    is_hidden = models.BooleanField(default=False)
+    audience_department = models.ForeignKey(
+        Department, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='+')
+    audience_grad_year = models.IntegerField(
+        null=True, blank=True, editable=False)
+    content_version = models.PositiveIntegerField(default=1, editable=False)
+    # set with every content_version bump, cleared by api.ranking once the
+    # hot score is current, so rank_questions finds its work by index
+    rank_stale = models.BooleanField(default=True, editable=False)
+
+    objects = QuestionQuerySet.as_manager()
 
     def __str__(self):
         return str(self.title)
 
+    @staticmethod
+    def audience(scope, user):
+        """
+        Returns the audience columns for a question with the given scope
+        asked by user. Both are None for the entire college.
+        """
+        return {
+            'audience_grad_year': None if scope == 'college' else user.grad_year,
+            'audience_department_id': user.department_id if scope == 'branch_grad_year' else None,
+        }
+
+    def save(self, *args, **kwargs):
+        """
+        Derives the audience columns from scope and user, so questions
+        saved from the admin or the ORM are filtered like those asked
+        through the API. bulk_create() and update() skip this and must
+        set them themselves.
+        """
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'scope', 'user'} & set(update_fields):
+            for field, value in self.audience(self.scope, self.user).items():
+                setattr(self, field, value)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'audience_grad_year', 'audience_department'}
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ('-created_at',)
         indexes = [
             models.Index(fields=['user'], name='question_user_idx'),
+            models.Index(fields=['-created_at', '-id'], name='question_visible_idx',
+                         condition=models.Q(is_active=True, is_hidden=False)),
+            models.Index(fields=['audience_grad_year', 'audience_department', '-created_at', '-id'],
+                         name='question_audience_idx', condition=models.Q(is_active=True, is_hidden=False)),
+            models.Index(fields=['id'], name='question_rank_stale_idx',
+                         condition=models.Q(rank_stale=True, is_active=True, is_hidden=False)),
+        ]
+
+
+class QuestionTag(models.Model):
+    """
+    Links a question to a tag.
+    """
+
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE)
+
+    class Meta:
+        db_table = 'api_question_tags'
+        unique_together = ('question', 'tag')
+        indexes = [
+            models.Index(fields=['tag', 'question'], name='question_tag_idx'),
+        ]
+
+
+class TagCount(models.Model):
+    """
+    Number of visible questions carrying a tag, maintained on write.
+    """
+
+    tag = models.OneToOneField(
+        Tag, on_delete=models.CASCADE, primary_key=True, related_name='counter')
+    question_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return str(self.tag_id)
+
+
+class QuestionRank(models.Model):
+    """
+    Hot score of a visible question, maintained by `manage.py rank_questions`
+    (api.ranking) from the question as of content_version.
+    """
+
+    question = models.OneToOneField(
+        Question, on_delete=models.CASCADE, primary_key=True, related_name='rank')
+    score = models.FloatField()
+    content_version = models.PositiveIntegerField()
+
+    def __str__(self):
+        return str(self.question_id)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score', '-question'], name='question_rank_score_idx'),
         ]
 
 
@@ -158,6 +254,11 @@ class Answer(models.Model):
 
     votes = models.ManyToManyField(
         User, related_name='answers_upvoted', blank=True)
+    vote_count = models.PositiveIntegerField(default=0)
+    flag_count = models.PositiveIntegerField(default=0)
+    is_hidden = models.BooleanField(default=False)
+
+    objects = AnswerQuerySet.as_manager()
 
     def __str__(self):
         return str(self.question)
@@ -167,6 +268,42 @@ class Answer(models.Model):
         indexes = [
             models.Index(fields=['user'], name='answer_user_idx'),
             models.Index(fields=['question'], name='answer_question_idx'),
+            models.Index(fields=['question', '-created_at', '-id'], name='answer_visible_idx',
+                         condition=models.Q(is_active=True, is_hidden=False)),
+            models.Index(fields=['question', '-vote_count', '-created_at', '-id'], name='answer_top_idx',
+                         condition=models.Q(is_active=True, is_hidden=False)),
+        ]
+
+
+class PendingVote(models.Model):
+    """
+    A vote acknowledged to the user but not yet applied to the vote tables
+    and counters, used when VOTE_WRITE_BEHIND is on.
+    """
+
+    kinds = (
+        ('question', 'Question'),
+        ('answer', 'Answer'),
+    )
+
+    kind = models.CharField(max_length=8, choices=kinds)
+    object_id = models.BigIntegerField()
+    question = models.ForeignKey(
+        Question, on_delete=models.CASCADE, related_name='+')
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='+')
+    upvote = models.BooleanField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return '%s %s' % (self.kind, self.object_id)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'object_id', 'user'],
+                         name='pending_vote_object_idx'),
+            models.Index(fields=['question'],
+                         name='pending_vote_question_idx'),
         ]
 
 
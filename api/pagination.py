@@ -0,0 +1,167 @@
+import base64
+import binascii
+import json
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.encoding import force_str
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a unique composite ordering.
+
+    Each page is fetched with a range condition on the ordering columns
+    instead of an OFFSET, so deep pages cost the same as the first one as
+    long as an index covers the ordering. The last column of the ordering
+    must be unique (usually the primary key).
+    """
+
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_ordering(self, view):
+        return getattr(view, 'keyset_ordering', self.ordering)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def encode_cursor(self, position, reverse):
+        data = json.dumps({'p': position, 'r': int(reverse)},
+                          separators=(',', ':'), default=str)
+        cursor = force_str(base64.urlsafe_b64encode(data.encode('ascii')))
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(
+                encoded.encode('ascii')).decode('ascii'))
+            position, reverse = data['p'], bool(data['r'])
+        except (TypeError, ValueError, KeyError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.fields):
+            raise NotFound(self.invalid_cursor_message)
+        # the values go into lookups, so a forged cursor must not fail there
+        try:
+            position = [field.to_python(value) for field, value in zip(self.model_fields, position)]
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in position:
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def get_model_field(self, model, name):
+        """
+        The field `name` refers to, following `__` through relations.
+        """
+        for part in name.split('__'):
+            field = model._meta.get_field(part)
+            model = field.related_model
+        return field
+
+    def position_filter(self, position, reverse):
+        """
+        Builds the lexicographic "comes after `position`" condition for the
+        ordering, e.g. `a < x OR (a = x AND b < y)` for ('-a', '-b').
+        """
+        condition = Q()
+        for i, (name, descending) in enumerate(self.fields):
+            lookup = 'lt' if descending != reverse else 'gt'
+            term = Q(**{'%s__%s' % (name, lookup): position[i]})
+            for prev_name, _ in self.fields[:i]:
+                term &= Q(**{prev_name: position[self.field_index[prev_name]]})
+            condition |= term
+        return condition
+
+    def get_position(self, item):
+        if isinstance(item, dict):
+            return [item[name] for name, _ in self.fields]
+        return [getattr(item, name) for name, _ in self.fields]
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """
+        Returns the (unevaluated) queryset for the requested page, plus one
+        row to tell whether there is more. Evaluate it and pass the rows to
+        paginate_results, e.g. from async code.
+        """
+        self.request = request
+        self.base_url = remove_query_param(
+            request.build_absolute_uri(), self.cursor_query_param)
+        ordering = self.get_ordering(view)
+        self.fields = [(name.lstrip('-'), name.startswith('-'))
+                       for name in ordering]
+        self.field_index = {name: i for i, (name, _) in enumerate(self.fields)}
+        self.model_fields = [self.get_model_field(queryset.model, name) for name, _ in self.fields]
+        self.size = self.get_page_size(request)
+
+        self.position, self.reverse = self.decode_cursor(request)
+        if self.reverse:
+            ordering = [name[1:] if name.startswith('-') else '-' + name
+                        for name in ordering]
+        queryset = queryset.order_by(*ordering)
+        if self.position is not None:
+            queryset = queryset.filter(
+                self.position_filter(self.position, self.reverse))
+        return queryset[:self.size + 1]
+
+    def paginate_results(self, results):
+        results = list(results)
+        has_more = len(results) > self.size
+        results = results[:self.size]
+        if self.reverse:
+            results.reverse()
+
+        self.next = self.previous = None
+        if results:
+            has_next = has_more if not self.reverse else True
+            has_previous = has_more if self.reverse else self.position is not None
+            if has_next:
+                self.next = self.encode_cursor(
+                    self.get_position(results[-1]), False)
+            if has_previous:
+                self.previous = self.encode_cursor(
+                    self.get_position(results[0]), True)
+        return results
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginate_results(self.get_page_queryset(queryset, request, view))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.next,
+            'previous': self.previous,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class TopAnswersPagination(KeysetPagination):
+    """
+    The answers of a question thread, best voted first.
+    """
+
+    page_size = 5
+    ordering = ('-vote_count', '-created_at', '-id')
@@ -10,7 +10,8 @@ class EditPermission(BasePermission):
         if request.method in SAFE_METHODS:
             return True
 
-        return obj.user == request.user
+        # compares ids so neither user has to be loaded
+        return obj.user_id == request.user.pk
 
 
 class UserEditPermission(BasePermission):
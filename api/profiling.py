@@ -0,0 +1,236 @@
+"""
+In-place profiling of single requests. A request sent with
+`X-Profile: 1` by a staff user is run under cProfile with its SQL
+statements recorded, from when its view has authenticated it until the
+response is finalized. The capture is saved to PROFILE_DIR and its id
+returned in the X-Profile-Id response header. Only the newest
+PROFILE_KEEP captures are kept.
+
+A capture is <id>.json, with the request, the SQL statements and their
+timings and the top of the profile, and <id>.prof, the full profile for
+pstats or snakeviz. Other requests only pay for a header lookup, and
+the profiler is never started for anonymous or non-staff users.
+Class-based views get this from ProfilingMixin, function views from
+the profiled decorator.
+"""
+import cProfile
+import datetime
+import functools
+import io
+import json
+import os
+import pstats
+import re
+import tempfile
+import time
+from django.conf import settings
+from api.metrics import install, uninstall
+
+HEADER = 'HTTP_X_PROFILE'
+CAPTURE_ID = re.compile(r'^\d{8}T\d{12}-\d+$')
+TOP_FUNCTIONS = 30
+
+
+def _path(capture_id, extension):
+    if not CAPTURE_ID.match(capture_id):
+        raise FileNotFoundError(capture_id)
+    return os.path.join(settings.PROFILE_DIR, capture_id + extension)
+
+
+def _write(path, data, mode):
+    # written aside and renamed, so a listing never sees half a capture
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, mode) as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def captures():
+    """
+    The saved captures, newest first, without their queries and profile.
+    """
+    try:
+        names = os.listdir(settings.PROFILE_DIR)
+    except FileNotFoundError:
+        return []
+    results = []
+    for name in sorted(names, reverse=True):
+        capture_id, extension = os.path.splitext(name)
+        if extension != '.json' or not CAPTURE_ID.match(capture_id):
+            continue
+        try:
+            capture = load(capture_id)
+        except (OSError, ValueError):
+            # removed by a concurrent save
+            continue
+        capture.pop('queries')
+        capture.pop('top')
+        results.append(capture)
+    return results
+
+
+def load(capture_id):
+    """
+    A saved capture. Raises FileNotFoundError.
+    """
+    with open(_path(capture_id, '.json')) as f:
+        return json.load(f)
+
+
+def profile_path(capture_id):
+    """
+    The path of the pstats file of a capture. Raises FileNotFoundError.
+    """
+    path = _path(capture_id, '.prof')
+    if not os.path.exists(path):
+        raise FileNotFoundError(capture_id)
+    return path
+
+
+def save(profiler, request, response, seconds, queries):
+    """
+    Stores a capture and drops the oldest ones over PROFILE_KEEP. Returns
+    the capture id.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    capture_id = '%s-%d' % (now.strftime('%Y%m%dT%H%M%S%f'), os.getpid())
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+    match = getattr(request, 'resolver_match', None)
+    capture = {
+        'id': capture_id,
+        'created_at': now.isoformat(),
+        'method': request.method,
+        'path': request.get_full_path(),
+        'view': match.view_name if match else None,
+        'user': request.user.pk,
+        'status': response.status_code,
+        'duration_ms': round(seconds * 1000, 3),
+        'query_count': len(queries),
+        'db_ms': round(sum(query['ms'] for query in queries), 3),
+        'queries': queries,
+        'top': stream.getvalue(),
+    }
+
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    profile = _path(capture_id, '.prof')
+    stats.dump_stats(profile)
+    _write(_path(capture_id, '.json'), json.dumps(capture), 'w')
+
+    stale = sorted(name for name in os.listdir(settings.PROFILE_DIR)
+                   if name.endswith('.json'))[:-settings.PROFILE_KEEP or None]
+    for name in stale:
+        for extension in ('.json', '.prof'):
+            try:
+                os.remove(os.path.join(settings.PROFILE_DIR, name[:-5] + extension))
+            except FileNotFoundError:
+                pass
+    return capture_id
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper recording each statement and its duration.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql, 'many': many,
+                'ms': round((time.perf_counter() - start) * 1000, 3)})
+
+
+class Capture:
+    """
+    A profile being taken of one request.
+    """
+
+    def __init__(self):
+        self.recorder = QueryRecorder()
+        self.profiler = cProfile.Profile()
+        self.contexts = install(self.recorder)
+        self.started = time.perf_counter()
+        self.seconds = None
+        try:
+            self.profiler.enable()
+        except ValueError:
+            # another profiler is already running in this thread
+            self.profiler = None
+
+    def stop(self):
+        if self.seconds is not None:
+            return
+        if self.profiler is not None:
+            self.profiler.disable()
+        uninstall(self.contexts)
+        self.seconds = time.perf_counter() - self.started
+
+    def finish(self, request, response):
+        """
+        Stops and saves the capture, and tells its id in the response.
+        """
+        self.stop()
+        if self.profiler is not None:
+            response['X-Profile-Id'] = save(
+                self.profiler, request, response, self.seconds, self.recorder.queries)
+
+
+def start(request):
+    """
+    Starts a Capture if the request asks for one and comes from a staff
+    user, else returns None. Call once the request is authenticated.
+    """
+    if request.META.get(HEADER, '0') in ('', '0') or not request.user.is_staff:
+        return None
+    return Capture()
+
+
+class ProfilingMixin:
+    """
+    Profiles the requests of an APIView that ask for it, see start().
+    """
+    capture = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.capture = start(request)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.capture is not None:
+            self.capture.finish(request, response)
+        return response
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            # an exception DRF did not handle skips finalize_response
+            if self.capture is not None:
+                self.capture.stop()
+
+
+def profiled(view):
+    """
+    ProfilingMixin for a function view, put under @api_view and
+    @permission_classes.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        capture = start(request)
+        if capture is None:
+            return view(request, *args, **kwargs)
+        try:
+            response = view(request, *args, **kwargs)
+        finally:
+            capture.stop()
+        capture.finish(request, response)
+        return response
+    return wrapper
@@ -0,0 +1,73 @@
+"""
+The hot ordering of questions. A question scores
+
+    log10(max(votes + HOT_ANSWER_WEIGHT * answers, 1)) + age / HOT_DECAY
+
+where age is the seconds from EPOCH to when it was asked, so ten times
+the votes are worth HOT_DECAY seconds of recency. As a newer question
+always gains on an older one, instead of the older one losing score, a
+score only changes with the question's votes and answers, which bump
+its content_version. The scores are stored in QuestionRank with the
+content_version they were computed from, and `manage.py rank_questions`
+only recomputes those that are stale. Every content_version bump also
+sets Question.rank_stale, which rank() clears, so finding them reads a
+partial index of the stale questions rather than every visible one.
+"""
+import datetime
+import math
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from api.models import Answer, Question, QuestionRank
+
+EPOCH = datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def hot_score(votes, answers, created_at):
+    weight = votes + settings.HOT_ANSWER_WEIGHT * answers
+    age = (created_at - EPOCH).total_seconds()
+    return math.log10(max(weight, 1)) + age / settings.HOT_DECAY
+
+
+def drop_hidden():
+    """
+    Removes the ranks of questions no longer visible. Returns how many.
+    """
+    removed, _ = QuestionRank.objects.exclude(
+        question__is_active=True, question__is_hidden=False).delete()
+    return removed
+
+
+def stale_questions():
+    """
+    The visible questions whose rank is missing or older than their
+    content_version.
+    """
+    return Question.objects.filter(is_active=True, is_hidden=False, rank_stale=True)
+
+
+def rank(questions, batch_size=500):
+    """
+    Scores the first `batch_size` of `questions` by pk. Returns their pks.
+    """
+    answers = Answer.objects.filter(
+        question_id=OuterRef('pk'), is_active=True, is_hidden=False).order_by(
+    ).values('question_id').annotate(total=Count('*')).values('total')
+    # the version is read with the counts, so a vote landing meanwhile
+    # leaves the rank stale for the next run
+    rows = list(questions.annotate(answers=Coalesce(Subquery(answers), 0)).order_by('pk').values_list(
+        'pk', 'vote_count', 'created_at', 'content_version', 'answers')[:batch_size])
+    pks = [row[0] for row in rows]
+    if not rows:
+        return pks
+    with transaction.atomic():
+        QuestionRank.objects.filter(question_id__in=pks).delete()
+        QuestionRank.objects.bulk_create([
+            QuestionRank(question_id=pk, score=hot_score(votes, answers, created_at),
+                         content_version=version)
+            for pk, votes, created_at, version, answers in rows])
+        # a question bumped since it was read keeps its flag
+        Question.objects.filter(pk__in=pks, content_version=Subquery(QuestionRank.objects.filter(
+            question_id=OuterRef('pk')).values('content_version'))).update(rank_stale=False)
+    return pks
@@ -0,0 +1,64 @@
+import json
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # optional, DRF's encoder is used without it
+    orjson = None
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Newline delimited JSON. The export streams its own lines, so this only
+    renders error responses for clients asking for NDJSON.
+    """
+
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data).encode() + b'\n'
+
+
+class PrometheusRenderer(BaseRenderer):
+    """
+    The Prometheus text exposition format. Error responses are rendered
+    as their detail message.
+    """
+
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = '%s\n' % data.get('detail', data)
+        return (data or '').encode(self.charset)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer encoding with orjson, when it is installed, into the same
+    bytes. Indented output, non-default JSON settings and data orjson
+    cannot encode go through DRF's encoder. Meant for views whose data has
+    no floats, which the two encoders may format differently.
+    """
+
+    encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or self.ensure_ascii or not self.compact or
+                self.encoder_class is not JSONEncoder or
+                self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder.default,
+                               option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # escaped by JSONRenderer, as they end lines in JavaScript
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
@@ -0,0 +1,92 @@
+"""
+User.usefullness_score, kept up to date on write. A user scores
+
+    BASE + QUESTION_VOTE * votes on their questions
+         + ANSWER_VOTE * votes on their answers
+         + ANSWER * answers they wrote
+         + FLAG * flags on their questions and answers
+
+counting what the tables hold, whether or not the question or answer was
+deleted since. Each write applies its delta to the author's score in the
+same transaction, and reconcile() recomputes every score from the tables
+in one statement. Votes queued by the write-behind path count once
+flushed.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from api.models import Answer, AnswerFlag, Question, QuestionFlag
+
+BASE = 3
+QUESTION_VOTE = 2
+ANSWER_VOTE = 5
+ANSWER = 1
+FLAG = -5
+
+VOTE_WEIGHTS = {Question: QUESTION_VOTE, Answer: ANSWER_VOTE}
+
+
+def adjust(deltas):
+    """
+    Adds `{user_id: delta}` to the users' scores, in one query.
+    """
+    deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    if len(deltas) == 1:
+        (user_id, delta), = deltas.items()
+        change = Value(delta)
+    else:
+        change = Case(*[When(id=user_id, then=Value(delta)) for user_id, delta in deltas.items()],
+                      output_field=IntegerField())
+    get_user_model().objects.filter(id__in=deltas).update(
+        usefullness_score=F('usefullness_score') + change)
+
+
+def credit_author(model, pk, delta):
+    """
+    Adds `delta` to the score of the author of question or answer `pk`.
+    """
+    get_user_model().objects.filter(id=Subquery(
+        model.objects.filter(id=pk).values('user_id')[:1])).update(
+        usefullness_score=F('usefullness_score') + delta)
+
+
+def add_vote_deltas(deltas, model, authors, votes):
+    """
+    Adds to the score `deltas` those of `{pk: votes added}` on objects
+    written by `{pk: user_id}`.
+    """
+    for pk, count in votes.items():
+        deltas[authors[pk]] = deltas.get(authors[pk], 0) + VOTE_WEIGHTS[model] * count
+    return deltas
+
+
+def _count(queryset, user_field):
+    return Coalesce(Subquery(queryset.filter(**{user_field: OuterRef('pk')}).order_by(
+    ).values(user_field).annotate(total=Count('*')).values('total')), 0)
+
+
+def expected_score():
+    """
+    The score of each user computed from the tables, as an expression.
+    """
+    return (Value(BASE)
+            + QUESTION_VOTE * _count(Question.votes.through.objects, 'question__user')
+            + ANSWER_VOTE * _count(Answer.votes.through.objects, 'answer__user')
+            + ANSWER * _count(Answer.objects, 'user')
+            + FLAG * _count(QuestionFlag.objects, 'question__user')
+            + FLAG * _count(AnswerFlag.objects, 'answer__user'))
+
+
+def reconcile(fix=True):
+    """
+    Counts the users whose stored score differs from expected_score()
+    and, with `fix`, stores the expected ones. Must run inside a
+    transaction.
+    """
+    users = get_user_model().objects.all()
+    stale = users.exclude(usefullness_score=expected_score()).count()
+    if stale and fix:
+        users.update(usefullness_score=expected_score())
+    return stale
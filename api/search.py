@@ -0,0 +1,214 @@
+"""
+Full-text search over questions and answers.
+
+On PostgreSQL each table carries a generated, stored tsvector column with
+a GIN index, so the index is maintained by the database on every write.
+On SQLite an FTS5 inverted index mirrors the searchable columns and is
+kept in sync by triggers.
+"""
+import re
+from django.db import DEFAULT_DB_ALIAS, connections
+
+MAX_TERMS = 10
+
+POSTGRES_INSTALL = (
+    """ALTER TABLE api_question ADD COLUMN IF NOT EXISTS search_vector tsvector
+       GENERATED ALWAYS AS (
+           setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+           setweight(to_tsvector('english', coalesce(body, '')), 'B')) STORED""",
+    """CREATE INDEX IF NOT EXISTS question_search_idx
+       ON api_question USING gin (search_vector)""",
+    """ALTER TABLE api_answer ADD COLUMN IF NOT EXISTS search_vector tsvector
+       GENERATED ALWAYS AS (
+           setweight(to_tsvector('english', coalesce(body, '')), 'B')) STORED""",
+    """CREATE INDEX IF NOT EXISTS answer_search_idx
+       ON api_answer USING gin (search_vector)""",
+)
+
+POSTGRES_UNINSTALL = (
+    "DROP INDEX IF EXISTS question_search_idx",
+    "ALTER TABLE api_question DROP COLUMN IF EXISTS search_vector",
+    "DROP INDEX IF EXISTS answer_search_idx",
+    "ALTER TABLE api_answer DROP COLUMN IF EXISTS search_vector",
+)
+
+SQLITE_TABLES = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS api_question_fts USING fts5(
+           title, body, content='api_question', content_rowid='id',
+           tokenize='porter unicode61')""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS api_answer_fts USING fts5(
+           body, content='api_answer', content_rowid='id',
+           tokenize='porter unicode61')""",
+)
+
+# Django rebuilds SQLite tables on most schema changes, which drops their
+# triggers, so these are re-created by repair_search_index after migrate.
+SQLITE_TRIGGERS = {
+    'api_question_fts_ai': """
+        CREATE TRIGGER IF NOT EXISTS api_question_fts_ai AFTER INSERT ON api_question BEGIN
+            INSERT INTO api_question_fts(rowid, title, body)
+            VALUES (new.id, new.title, new.body);
+        END""",
+    'api_question_fts_ad': """
+        CREATE TRIGGER IF NOT EXISTS api_question_fts_ad AFTER DELETE ON api_question BEGIN
+            INSERT INTO api_question_fts(api_question_fts, rowid, title, body)
+            VALUES ('delete', old.id, old.title, old.body);
+        END""",
+    'api_question_fts_au': """
+        CREATE TRIGGER IF NOT EXISTS api_question_fts_au AFTER UPDATE OF title, body ON api_question BEGIN
+            INSERT INTO api_question_fts(api_question_fts, rowid, title, body)
+            VALUES ('delete', old.id, old.title, old.body);
+            INSERT INTO api_question_fts(rowid, title, body)
+            VALUES (new.id, new.title, new.body);
+        END""",
+    'api_answer_fts_ai': """
+        CREATE TRIGGER IF NOT EXISTS api_answer_fts_ai AFTER INSERT ON api_answer BEGIN
+            INSERT INTO api_answer_fts(rowid, body) VALUES (new.id, new.body);
+        END""",
+    'api_answer_fts_ad': """
+        CREATE TRIGGER IF NOT EXISTS api_answer_fts_ad AFTER DELETE ON api_answer BEGIN
+            INSERT INTO api_answer_fts(api_answer_fts, rowid, body)
+            VALUES ('delete', old.id, old.body);
+        END""",
+    'api_answer_fts_au': """
+        CREATE TRIGGER IF NOT EXISTS api_answer_fts_au AFTER UPDATE OF body ON api_answer BEGIN
+            INSERT INTO api_answer_fts(api_answer_fts, rowid, body)
+            VALUES ('delete', old.id, old.body);
+            INSERT INTO api_answer_fts(rowid, body) VALUES (new.id, new.body);
+        END""",
+}
+
+SQLITE_REBUILD = (
+    "INSERT INTO api_question_fts(api_question_fts) VALUES ('rebuild')",
+    "INSERT INTO api_answer_fts(api_answer_fts) VALUES ('rebuild')",
+)
+
+SQLITE_UNINSTALL = tuple(
+    'DROP TRIGGER IF EXISTS %s' % name for name in SQLITE_TRIGGERS) + (
+    'DROP TABLE IF EXISTS api_question_fts',
+    'DROP TABLE IF EXISTS api_answer_fts',
+)
+
+POSTGRES_SEARCH = """
+    WITH query AS (SELECT plainto_tsquery('english', %s) AS tsq)
+    SELECT 'question', q.id, q.id, q.title, q.body, q.vote_count,
+           ts_rank(q.search_vector, query.tsq) AS rank
+    FROM api_question q, query
+    WHERE q.search_vector @@ query.tsq
+      AND q.is_active AND NOT q.is_hidden
+      AND (q.audience_grad_year IS NULL OR (q.audience_grad_year = %s AND (
+           q.audience_department_id IS NULL OR q.audience_department_id = %s)))
+    UNION ALL
+    SELECT 'answer', a.id, q.id, q.title, a.body, a.vote_count,
+           ts_rank(a.search_vector, query.tsq) AS rank
+    FROM api_answer a JOIN api_question q ON q.id = a.question_id, query
+    WHERE a.search_vector @@ query.tsq
+      AND a.is_active AND NOT a.is_hidden
+      AND q.is_active AND NOT q.is_hidden
+      AND (q.audience_grad_year IS NULL OR (q.audience_grad_year = %s AND (
+           q.audience_department_id IS NULL OR q.audience_department_id = %s)))
+    ORDER BY rank DESC, 2 DESC
+    LIMIT %s OFFSET %s
+"""
+
+# bm25() is lower for better matches, so it is negated to keep "higher is
+# better" on both backends.
+SQLITE_SEARCH = """
+    SELECT 'question', q.id, q.id, q.title, q.body, q.vote_count,
+           -bm25(api_question_fts, 2.0, 1.0) AS rank
+    FROM api_question_fts JOIN api_question q ON q.id = api_question_fts.rowid
+    WHERE api_question_fts MATCH %s
+      AND q.is_active AND NOT q.is_hidden
+      AND (q.audience_grad_year IS NULL OR (q.audience_grad_year = %s AND (
+           q.audience_department_id IS NULL OR q.audience_department_id = %s)))
+    UNION ALL
+    SELECT 'answer', a.id, q.id, q.title, a.body, a.vote_count,
+           -bm25(api_answer_fts) AS rank
+    FROM api_answer_fts JOIN api_answer a ON a.id = api_answer_fts.rowid
+         JOIN api_question q ON q.id = a.question_id
+    WHERE api_answer_fts MATCH %s
+      AND a.is_active AND NOT a.is_hidden
+      AND q.is_active AND NOT q.is_hidden
+      AND (q.audience_grad_year IS NULL OR (q.audience_grad_year = %s AND (
+           q.audience_department_id IS NULL OR q.audience_department_id = %s)))
+    ORDER BY rank DESC, 2 DESC
+    LIMIT %s OFFSET %s
+"""
+
+
+def tokenize(text):
+    """
+    Splits a user query into plain search terms, dropping any operator
+    syntax so the query cannot be interpreted by the search backend.
+    """
+    return re.findall(r'\w+', text.lower())[:MAX_TERMS]
+
+
+def install_search_index(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for sql in POSTGRES_INSTALL:
+                cursor.execute(sql)
+        elif connection.vendor == 'sqlite':
+            for sql in SQLITE_TABLES + tuple(SQLITE_TRIGGERS.values()) + SQLITE_REBUILD:
+                cursor.execute(sql)
+
+
+def uninstall_search_index(connection):
+    statements = {
+        'postgresql': POSTGRES_UNINSTALL,
+        'sqlite': SQLITE_UNINSTALL,
+    }.get(connection.vendor, ())
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def repair_search_index(using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    post_migrate receiver re-creating SQLite triggers lost to table
+    rebuilds, and re-indexing if any were missing.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        names = ['api_question_fts'] + list(SQLITE_TRIGGERS)
+        cursor.execute("SELECT name FROM sqlite_master WHERE name IN (%s)" % (
+            ', '.join(['%s'] * len(names))), names)
+        existing = {row[0] for row in cursor.fetchall()}
+        if 'api_question_fts' not in existing:
+            return
+        if set(SQLITE_TRIGGERS) <= existing:
+            return
+        for sql in tuple(SQLITE_TRIGGERS.values()) + SQLITE_REBUILD:
+            cursor.execute(sql)
+
+
+def search(terms, user, limit, offset, using=DEFAULT_DB_ALIAS):
+    """
+    Returns ranked hits for all `terms` over the questions and answers
+    visible to `user`.
+    """
+    connection = connections[using]
+    audience = [user.grad_year, user.department_id]
+    if connection.vendor == 'postgresql':
+        sql, params = POSTGRES_SEARCH, [' '.join(terms)] + audience * 2
+    elif connection.vendor == 'sqlite':
+        query = ' '.join('"%s"' % term for term in terms)
+        sql, params = SQLITE_SEARCH, [query] + audience + [query] + audience
+    else:
+        raise NotImplementedError(
+            'Search is not supported on %s' % connection.vendor)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + [limit, offset])
+        rows = cursor.fetchall()
+    return [{
+        'type': kind,
+        'id': pk,
+        'question': question_id,
+        'title': title,
+        'body': body,
+        'votes': votes,
+        'rank': rank,
+    } for kind, pk, question_id, title, body, votes, rank in rows]
@@ -1,8 +1,10 @@
 from django.urls.conf import path
 from django.views.decorators.csrf import requires_csrf_token
+from django.db import models
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import Answer, Department, Question, QuestionFlag, AnswerFlag
+from .models import Answer, Department, Question, QuestionFlag, AnswerFlag, Tag
+from .votes import pending_deltas, voted_ids, write_behind
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -24,6 +26,12 @@ class UserSerializer(serializers.ModelSerializer):
         }
 
 
+class LeaderSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = get_user_model()
+        fields = ('id', 'user_name', 'usefullness_score')
+
+
 class DepartmentSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -31,28 +39,76 @@ class DepartmentSerializer(serializers.ModelSerializer):
         fields = ('id', 'code', 'name', )
 
 
-class QuestionSerializer(serializers.ModelSerializer):
-    user = serializers.ReadOnlyField(source='user.id')
+class TagSerializer(serializers.ModelSerializer):
+    question_count = serializers.ReadOnlyField()
+
+    class Meta:
+        model = Tag
+        fields = ('slug', 'description', 'question_count', )
+
+
+class VotedListSerializer(serializers.ListSerializer):
+    """
+    Resolves has_voted (and pending vote deltas) for the whole page with
+    a single query instead of one query per serialized object.
+    """
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        objs = list(iterable)
+        ids = [obj.pk for obj in objs]
+        self.context['voted_ids'] = voted_ids(
+            self.child.Meta.model, self.context['request'].user, ids)
+        if write_behind():
+            self.context['vote_deltas'] = pending_deltas(
+                self.child.Meta.model, ids)
+        return super().to_representation(objs)
+
+
+class VotableSerializer(serializers.ModelSerializer):
     votes = serializers.SerializerMethodField()
     has_voted = serializers.SerializerMethodField()
 
     def get_votes(self, obj):
-        return obj.votes.count()
+        if not write_behind():
+            return obj.vote_count
+        deltas = self.context.get('vote_deltas')
+        if deltas is None:
+            deltas = pending_deltas(self.Meta.model, [obj.pk])
+        return obj.vote_count + deltas.get(obj.pk, 0)
 
     def get_has_voted(self, obj):
-        user = self.context['request'].user
-        if user in obj.votes.all():
-            return True
-        return False
+        ids = self.context.get('voted_ids')
+        if ids is None:
+            ids = voted_ids(self.Meta.model,
+                            self.context['request'].user, [obj.pk])
+        return obj.pk in ids
+
+
+class QuestionSerializer(VotableSerializer):
+    user = serializers.ReadOnlyField(source='user_id')
+    tags = serializers.PrimaryKeyRelatedField(
+        many=True, allow_empty=False, queryset=Tag.objects.all())
 
     class Meta:
         model = Question
         fields = ('id', 'title', 'body', 'user', 'scope',
                   'tags', 'votes', 'has_voted', )
+        list_serializer_class = VotedListSerializer
+
+
+class VisibleRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Only accepts the questions or answers the requesting user may see.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().visible_to(self.context['request'].user)
 
 
 class QuestionFlagSerializer(serializers.ModelSerializer):
-    user = serializers.ReadOnlyField(source='user.id')
+    user = serializers.ReadOnlyField(source='user_id')
+    question = VisibleRelatedField(queryset=Question.objects.all())
 
     class Meta:
         model = QuestionFlag
@@ -64,31 +120,22 @@ class QuestionFlagSerializer(serializers.ModelSerializer):
         }
 
 
-class AnswerSerializer(serializers.ModelSerializer):
-    user = serializers.ReadOnlyField(source='user.id')
-    question = serializers.ReadOnlyField(source='question.id')
-    has_voted = serializers.SerializerMethodField()
-    votes = serializers.SerializerMethodField()
-
-    def get_votes(self, obj):
-        return obj.votes.count()
-
-    def get_has_voted(self, obj):
-        user = self.context['request'].user
-        if user in obj.votes.all():
-            return True
-        return False
+class AnswerSerializer(VotableSerializer):
+    user = serializers.ReadOnlyField(source='user_id')
+    question = serializers.ReadOnlyField(source='question_id')
 
     class Meta:
         model = Answer
         fields = ('id', 'question', 'user', 'body', 'votes', 'has_voted',)
+        list_serializer_class = VotedListSerializer
         extra_kwargs = {
             'body': {'required': True},
         }
 
 
 class AnswerFlagSerializer(serializers.ModelSerializer):
-    user = serializers.ReadOnlyField(source='user.id')
+    user = serializers.ReadOnlyField(source='user_id')
+    answer = VisibleRelatedField(queryset=Answer.objects.all())
 
     class Meta:
         model = AnswerFlag
@@ -98,3 +145,9 @@ class AnswerFlagSerializer(serializers.ModelSerializer):
             'user': {'required': True},
             'question': {'required': True}
         }
+
+
+class VoteSerializer(serializers.Serializer):
+    type = serializers.ChoiceField(choices=('question', 'answer'))
+    id = serializers.IntegerField(min_value=1)
+    upvote = serializers.BooleanField()
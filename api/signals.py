@@ -0,0 +1,50 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from api import authentication, cache
+from api.counters import adjust_tag_counts, rebuild_tag_counts
+from api.models import Department, QuestionTag, Tag, TagCount, User
+
+
+@receiver(post_save, sender=Department)
+@receiver(post_delete, sender=Department)
+def bump_departments(sender, **kwargs):
+    cache.departments.bump()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_tags(sender, **kwargs):
+    cache.tags.bump()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_user(sender, instance, created=False, **kwargs):
+    # a new user is in no cache yet
+    if not created:
+        authentication.users.invalidate()
+
+
+@receiver(post_save, sender=Tag)
+def create_tag_count(sender, instance, created, **kwargs):
+    if created:
+        TagCount.objects.get_or_create(tag=instance)
+
+
+@receiver(m2m_changed, sender=QuestionTag)
+def update_tag_counts(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # changed from the tag's side, so only one counter is affected
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            rebuild_tag_counts([instance.pk])
+        return
+    if action == 'pre_clear':
+        instance._cleared_tag_ids = list(
+            instance.tags.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action == 'post_clear':
+        pk_set = instance.__dict__.pop('_cleared_tag_ids', ())
+    if instance.is_active and not instance.is_hidden:
+        adjust_tag_counts(pk_set, 1 if action == 'post_add' else -1)
@@ -1,2 +1,3 @@
 from api.tests.test_models import *
-from api.tests.test_views import *
\ No newline at end of file
+from api.tests.test_views import *
+from api.tests.test_performance import *
\ No newline at end of file
@@ -1,4 +1,8 @@
+import os
+import tempfile
+from io import StringIO
 from django.test import TestCase
+from django.core.management import CommandError, call_command
 from django.contrib.auth import get_user_model
 from django.db import IntegrityError
 from api.models import Department, Question, Answer, QuestionFlag, AnswerFlag, Tag
@@ -92,6 +96,29 @@ class QuestionTests(TestCase):
         self.assertEqual(question.body, 'now what?')
         self.assertTrue(question.is_active)
 
+    def test_audience(self):
+        db = get_user_model()
+        department = Department.objects.create(
+            code='CSE', name='Computer Science and Engineering')
+        user = db.objects.create_user(*user_data, department=department)
+        question = Question.objects.create(
+            user=user, title='q1?', scope='branch_grad_year')
+        question.refresh_from_db()
+        self.assertEqual(question.audience_grad_year, 2022)
+        self.assertEqual(question.audience_department, department)
+
+        question.scope = 'grad_year'
+        question.save(update_fields=['scope'])
+        question.refresh_from_db()
+        self.assertEqual(question.audience_grad_year, 2022)
+        self.assertIsNone(question.audience_department)
+
+        question.scope = 'college'
+        question.save()
+        question.refresh_from_db()
+        self.assertIsNone(question.audience_grad_year)
+        self.assertIsNone(question.audience_department)
+
 
 class QuestionFlagTests(TestCase):
 
@@ -160,3 +187,100 @@ class AnswerFlagTests(TestCase):
         self.assertEqual(answer_flag.answer, answer)
         self.assertEqual(str(answer_flag), 'nsfw')
         self.assertEqual(answer_flag.reason, 'nsfw')
+
+
+class RebuildCountersTests(TestCase):
+
+    def test_counts(self):
+        db = get_user_model()
+        user = db.objects.create_user(*user_data)
+        question = Question.objects.create(
+            user=user,
+            title='q1?',
+            body='now what?'
+        )
+        answer = Answer.objects.create(
+            question=question,
+            user=user,
+            body='nothing much'
+        )
+        question.votes.add(user)
+        QuestionFlag.objects.create(user=user, question=question, reason='hurt')
+        Answer.objects.filter(pk=answer.pk).update(vote_count=7, flag_count=2)
+
+        out = StringIO()
+        call_command('rebuild_counters', stdout=out)
+        question.refresh_from_db()
+        answer.refresh_from_db()
+        self.assertEqual(question.vote_count, 1)
+        self.assertEqual(answer.vote_count, 0)
+        self.assertEqual(question.flag_count, 1)
+        self.assertEqual(answer.flag_count, 0)
+        self.assertIn('Question: fixed 1 vote count', out.getvalue())
+        self.assertIn('Answer: fixed 1 vote count', out.getvalue())
+        self.assertIn('Question: fixed 1 flag count', out.getvalue())
+        self.assertIn('Answer: fixed 1 flag count', out.getvalue())
+
+
+class ImportStudentsTests(TestCase):
+
+    header = 'email,user_name,first_name,last_name,dob,grad_year,htno,phone,password,department\n'
+
+    def roster(self, rows):
+        f = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False)
+        f.write(self.header + ''.join(rows))
+        f.close()
+        self.addCleanup(os.remove, f.name)
+        return f.name
+
+    def test_import(self):
+        db = get_user_model()
+        db.objects.create_user(*user_data)
+        path = self.roster([
+            '1602-18-733-101@vce.ac.in,s101,Stu,One,2000-01-01,2022,1602-18-733-101,9000000101,pw101,cse\n',
+            '1602-18-733-102@VCE.AC.IN,s102,Stu,Two,2000-01-02,2022,1602-18-733-102,9000000102,pw102,\n',
+            'someone@gmail.com,s103,Stu,Three,2000-01-03,2022,1602-18-733-103,9000000103,pw103,cse\n',
+            '1602-18-733-104@vce.ac.in,s104,Stu,Four,2000-01-04,2022,1602-18-733-101,9000000104,pw104,cse\n',
+            '1602-18-733-105@vce.ac.in,s105,Stu,Five,2000-01-05,2022,1602-18-733-105,1234567890,pw105,cse\n',
+            '1602-18-733-106@vce.ac.in,s106,Stu,Six,not a date,2022,1602-18-733-106,9000000106,,xyz\n',
+        ])
+
+        out, err = StringIO(), StringIO()
+        call_command('import_students', path, dry_run=True, stdout=out, stderr=err)
+        self.assertEqual(out.getvalue(), '2 students valid, 4 rows rejected\n')
+        self.assertEqual(db.objects.count(), 1)
+
+        out, err = StringIO(), StringIO()
+        # departments, one lookup per unique field, one INSERT in a savepoint
+        with self.assertNumQueries(1 + 4 + 3):
+            call_command('import_students', path, workers=2,
+                         active=True, stdout=out, stderr=err)
+        self.assertEqual(out.getvalue(), 'Imported 2 students, 4 rows rejected\n')
+        errors = err.getvalue()
+        self.assertIn('line 4: email: Enter valid organization email', errors)
+        self.assertIn('line 5: htno: 1602-18-733-101 is also on line 2', errors)
+        self.assertIn('line 7: department: Unknown department xyz', errors)
+        self.assertIn('line 6: phone: 1234567890 already exists', errors)
+        self.assertIn('line 7: password: This field cannot be blank.', errors)
+        self.assertIn('line 7: dob:', errors)
+
+        student = db.objects.get(htno='1602-18-733-101')
+        self.assertTrue(student.check_password('pw101'))
+        self.assertTrue(student.is_active)
+        self.assertEqual(student.department.code, 'CSE')
+        student = db.objects.get(htno='1602-18-733-102')
+        self.assertEqual(student.email, '1602-18-733-102@vce.ac.in')
+        self.assertIsNone(student.department)
+        self.assertTrue(student.check_password('pw102'))
+
+        # importing again rejects every row already there
+        out = StringIO()
+        call_command('import_students', path, workers=1, stdout=out, stderr=StringIO())
+        self.assertEqual(out.getvalue(), 'Imported 0 students, 6 rows rejected\n')
+
+    def test_columns(self):
+        path = self.roster([])
+        with open(path, 'w') as f:
+            f.write('email,user_name,nickname\n')
+        with self.assertRaisesMessage(CommandError, 'Missing columns: dob'):
+            call_command('import_students', path)
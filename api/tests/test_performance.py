@@ -0,0 +1,62 @@
+import os
+import time
+from unittest import skipUnless
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from api.models import Question
+from api.tests.test_setup import TestSetUp
+
+# Seeding these volumes takes a while, so they only run on request:
+#   ASKVCE_PERF_TESTS=1 python manage.py test api.tests.test_performance
+PERF_TESTS = bool(os.environ.get('ASKVCE_PERF_TESTS'))
+
+
+@skipUnless(PERF_TESTS, 'set ASKVCE_PERF_TESTS=1 to run performance tests')
+class TestFeedPerformance(TestSetUp):
+    questions = 100000
+    requests = 50
+    max_p95_ms = 250
+
+    def seed(self, author):
+        # a third of the questions each for the college, another year and
+        # another branch of the reader's year
+        audiences = [
+            {'scope': 'college'},
+            {'scope': 'grad_year', 'audience_grad_year': 2021},
+            {'scope': 'branch_grad_year', 'audience_grad_year': 2022,
+             'audience_department': self.civ_dept},
+        ]
+        batch = []
+        for i in range(self.questions):
+            batch.append(Question(user=author, title='q%d' %
+                         i, **audiences[i % 3]))
+            if len(batch) == 5000:
+                Question.objects.bulk_create(batch)
+                batch = []
+        Question.objects.bulk_create(batch)
+
+    def test_scoped_feed_latency(self):
+        author = self.make_user(department=self.civ_dept)
+        reader = self.make_user(self.user_data_2)
+        self.seed(author)
+
+        timings = []
+        with self.Auth(reader) as client:
+            url = reverse(self.question_LC)
+            for _ in range(self.requests):
+                with CaptureQueriesContext(connection) as ctx:
+                    start = time.perf_counter()
+                    res = client.get(url)
+                    timings.append((time.perf_counter() - start) * 1000)
+                self.assertEqual(res.status_code, 200)
+                self.assertTrue(
+                    all(q['scope'] == 'college' for q in res.data['results']))
+                url = res.data['next']
+                queries = len(ctx.captured_queries)
+
+        timings.sort()
+        p50 = timings[len(timings) // 2]
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.assertLess(p95, self.max_p95_ms, 'scoped feed over %d questions: p50 %.1fms p95 %.1fms, %d queries per page' % (
+            self.questions, p50, p95, queries))
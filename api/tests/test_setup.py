@@ -1,7 +1,15 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import override_settings
 from rest_framework.test import APITestCase, APIClient
+from api import authentication
 from api.models import Department, Tag
 
 
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'reference': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'reference'},
+})
 class TestSetUp(APITestCase):
 
     class Auth(object):
@@ -24,6 +32,9 @@ class TestSetUp(APITestCase):
             return True
 
     def setUp(self):
+        for alias in ('default', 'reference'):
+            caches[alias].clear()
+        authentication.users.clear()
         self.user_data_1 = {
             'email': '1602-18-733-010@vce.ac.in',
             'dob': '2000-10-19',
@@ -60,19 +71,46 @@ class TestSetUp(APITestCase):
         self.civ_dept = Department.objects.get(code='CIV')
 
         self.dept_L = 'departments'
+        self.leaderboard = 'department-leaderboard'
+        self.tag_L = 'tags'
         self.user_C = 'users'
         self.user_RUD = 'user'
         self.question_LC = 'questions'
         self.question_RUD = 'question'
         self.answer_LC = 'question-answers'
         self.answer_RUD = 'question-answer'
+        self.question_thread = 'question-thread'
         self.question_vote = 'question-vote'
         self.answer_vote = 'answer-vote'
+        self.vote_batch = 'votes-batch'
         self.question_flag = 'question-flag'
         self.answer_flag = 'answer-flag'
+        self.search = 'search'
+        self.export = 'export'
+        self.metrics = 'metrics'
+        self.profiles = 'profiles'
+        self.profile = 'profile'
         self.client = APIClient(enforce_csrf_checks=True)
         self.invalid_id = 999
         return super().setUp()
 
+    def make_user(self, user_data=None, department=None, **extra_fields):
+        """
+        Creates an active user straight through the manager, from
+        user_data_1 and in CSE unless told otherwise.
+        """
+        return get_user_model().objects.create_user(
+            **(user_data or self.user_data_1), department=department or self.cse_dept,
+            is_active=True, **extra_fields)
+
+    def user_data(self, n, **changes):
+        """
+        user_data_1 with its unique fields numbered, for the n-th of any
+        further users.
+        """
+        return {**self.user_data_1, 'email': '1602-18-733-%03d@vce.ac.in' % (100 + n),
+                'user_name': 'user%d' % n, 'phone': '98765432%02d' % n,
+                'htno': '1602-18-733-%03d' % (100 + n), **changes}
+
     def tearDown(self):
         return super().tearDown()
@@ -1,8 +1,49 @@
-from django.utils.functional import new_method_proxy
+import base64
+import datetime
+import decimal
+import json
+import logging
+import os
+import pstats
+import tempfile
+import threading
+import time
+import types
+from asgiref.sync import SyncToAsync
+from io import StringIO
+from unittest import mock, skipIf, skipUnless
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import CommandError, call_command
 from api.tests.test_setup import *
-from api.models import Department, Question, Tag
+from api import async_views, authentication, fast_serializers, metrics, profiling, ranking, reputation
+from api.counters import bump_content_version
+from api.models import Department, Question, QuestionRank, Answer, PendingVote, Tag, TagCount
 from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import F
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.test import RequestFactory, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+from api.pagination import TopAnswersPagination
+from api.renderers import FastJSONRenderer
+from api.serializers import AnswerSerializer, DepartmentSerializer, QuestionSerializer, VoteSerializer
+from api.votes import MAX_BATCH, vote
+
+FORGED_POSITIONS = [['garbage', 1], [{'a': 1}, 1], [None, None], ['2020-01-01', 'abc'], [[1], 1]]
+
+
+def forge_cursor(position, reverse=False):
+    """
+    A cursor as KeysetPagination encodes them, for any position.
+    """
+    data = json.dumps({'p': position, 'r': int(reverse)})
+    return base64.urlsafe_b64encode(data.encode('ascii')).decode('ascii')
 
 
 # TODO find a better way to test with dummy data
@@ -178,9 +219,52 @@ class TestViews(TestSetUp):
 
             # make sure no questions are there
             res = client.get(reverse(self.question_LC))
-            self.assertEqual(len(res.data), 0)
+            self.assertEqual(len(res.data['results']), 0)
+
+    def flag_fixtures(self):
+        user = self.make_user()
+        question = Question.objects.create(user=user, title='q1?')
+        answer = Answer.objects.create(
+            question=question, user=user, body='nothing much')
+        return self.make_user(self.user_data_2), question, answer
+
+    def test_flag_answer(self):
+        user2, question, answer = self.flag_fixtures()
+        with self.Auth(user2) as client:
+            # answer should not be visible if any user flags it.
+            res = client.post(reverse(self.answer_flag, args=(answer.pk,)), {
+                'answer': answer.pk, 'reason': 'less'})
+            self.assertEqual(res.status_code, 201)
+            res = client.get(reverse(self.answer_LC, args=(question.pk,)))
+            self.assertEqual(len(res.data['results']), 0)
 
-        # question should not be visible if a user flags it.
+            # flagging twice is rejected and not counted
+            res = client.post(reverse(self.answer_flag, args=(answer.pk,)), {
+                'answer': answer.pk, 'reason': 'less'})
+            self.assertEqual(res.status_code, 400)
+        answer.refresh_from_db()
+        self.assertEqual(answer.flag_count, 1)
+        self.assertTrue(answer.is_hidden)
+        # the question's pages changed with it
+        question.refresh_from_db()
+        self.assertEqual(question.content_version, 2)
+        self.assertTrue(question.rank_stale)
+
+    def test_flag_question(self):
+        user2, question, _ = self.flag_fixtures()
+        with self.Auth(user2) as client:
+            # question should not be visible if a user flags it.
+            res = client.get(reverse(self.question_RUD, args=(question.pk,)))
+            self.assertEqual(res.status_code, 200)
+            res = client.post(reverse(self.question_flag, args=(question.pk,)), {
+                'question': question.pk, 'reason': 'prom'})
+            self.assertEqual(res.status_code, 201)
+            res = client.get(reverse(self.question_RUD, args=(question.pk,)))
+            self.assertEqual(res.status_code, 404)
+            res = client.get(reverse(self.question_LC))
+            self.assertEqual(len(res.data['results']), 0)
+        question.refresh_from_db()
+        self.assertEqual(question.flag_count, 1)
 
     def test_answer(self):
         self.create_user(self.user_data_1, self.cse_dept)
@@ -224,3 +308,1592 @@ class TestViews(TestSetUp):
 
         # answer should not be visible if any user flags it.
         pass
+
+
+class TestQueryCounts(TestSetUp):
+
+    def seed(self, user, rows):
+        questions = Question.objects.bulk_create(
+            [Question(user=user, title='q%d' % i) for i in range(rows)])
+        Question.tags.through.objects.bulk_create(
+            [Question.tags.through(question=q, tag=self.general_tag) for q in questions])
+        Question.votes.through.objects.bulk_create(
+            [Question.votes.through(question=q, user=user) for q in questions[::2]])
+        answers = Answer.objects.bulk_create(
+            [Answer(question=questions[0], user=user, body='a%d' % i) for i in range(rows)])
+        Answer.votes.through.objects.bulk_create(
+            [Answer.votes.through(answer=a, user=user) for a in answers[::2]])
+        return questions[0]
+
+    def count_queries(self, user, url):
+        with self.Auth(user) as client:
+            with CaptureQueriesContext(connection) as ctx:
+                res = client.get(url)
+            self.assertEqual(res.status_code, 200)
+        return res, len(ctx.captured_queries)
+
+    def test_has_voted_list_queries(self):
+        user = self.make_user()
+        question = self.seed(user, 10)
+        res, small_questions = self.count_queries(
+            user, reverse(self.question_LC))
+        self.assertEqual(sum(q['has_voted'] for q in res.data['results']), 5)
+        res, small_answers = self.count_queries(
+            user, reverse(self.answer_LC, args=(question.pk,)))
+        self.assertEqual(sum(a['has_voted'] for a in res.data['results']), 5)
+
+        other = self.make_user(self.user_data_2)
+        question = self.seed(other, 1000)
+        _, large_questions = self.count_queries(
+            user, reverse(self.question_LC))
+        res, large_answers = self.count_queries(
+            user, reverse(self.answer_LC, args=(question.pk,)))
+        self.assertFalse(any(a['has_voted'] for a in res.data['results']))
+
+        self.assertEqual(small_questions, large_questions)
+        self.assertEqual(small_answers, large_answers)
+
+    def test_endpoint_query_counts(self):
+        # fixed per request, whatever the number of rows, tags and votes;
+        # writes include the savepoints of their atomic blocks
+        user = self.make_user()
+        staff = self.make_user(self.user_data_2, is_staff=True)
+        question = self.seed(staff, 30)
+        question.tags.add(self.cse_tag)
+        answer = Answer.objects.create(question=question, user=user, body='mine')
+        other = question.answer_set.exclude(user=user).first()
+        unanswered = Question.objects.create(user=user, title='mine?')
+        call_command('rebuild_counters', stdout=StringIO())
+        call_command('rank_questions', stdout=StringIO())
+        q, a = question.pk, answer.pk
+        expected = [
+            (user, 'get', reverse(self.dept_L), None, 200, 1),
+            (user, 'get', reverse(self.tag_L), None, 200, 1),
+            (user, 'get', reverse(self.leaderboard, args=(self.cse_dept.pk,)), None, 200, 2),
+            (None, 'post', reverse(self.user_C), {
+                **self.user_data_1, 'email': '1602-18-733-012@vce.ac.in', 'user_name': 'new',
+                'phone': '1234567892', 'htno': '1602-18-733-959',
+                'department': self.cse_dept.pk}, 201, 6),
+            (user, 'get', reverse(self.user_RUD, args=(user.pk,)), None, 200, 1),
+            (user, 'get', reverse(self.question_LC), None, 200, 3),
+            (user, 'get', reverse(self.question_LC) + '?tags=general,cse', None, 200, 3),
+            (user, 'get', reverse(self.question_LC) + '?sort=hot', None, 200, 3),
+            (user, 'post', reverse(self.question_LC), {
+                **self.question_data_1, 'tags': ['general', 'cse']}, 201, 9),
+            (user, 'get', reverse(self.question_RUD, args=(q,)), None, 200, 4),
+            (user, 'patch', reverse(self.question_RUD, args=(unanswered.pk,)),
+             {'title': 'changed?'}, 200, 9),
+            (user, 'delete', reverse(self.question_RUD, args=(unanswered.pk,)), None, 204, 3),
+            (user, 'get', reverse(self.question_thread, args=(q,)), None, 200, 6),
+            (user, 'get', reverse(self.answer_LC, args=(q,)), None, 200, 3),
+            (user, 'post', reverse(self.answer_LC, args=(q,)), self.answer_data_1, 201, 7),
+            (user, 'get', reverse(self.answer_RUD, args=(q, a)), None, 200, 2),
+            (user, 'patch', reverse(self.answer_RUD, args=(q, a)), {'body': 'b'}, 200, 4),
+            (user, 'delete', reverse(self.answer_RUD, args=(q, a)), None, 204, 3),
+            (user, 'post', reverse(self.question_vote, args=(q,)), {'upvote': True}, 200, 7),
+            (user, 'post', reverse(self.answer_vote, args=(other.pk,)), {'upvote': True}, 200, 8),
+            (user, 'post', reverse(self.vote_batch), [
+                {'type': 'answer', 'id': pk, 'upvote': True}
+                for pk in question.answer_set.values_list('pk', flat=True)[:20]], 200, 8),
+            (user, 'post', reverse(self.question_flag, args=(q,)),
+             {'reason': 'less', 'question': q}, 201, 8),
+            (user, 'post', reverse(self.answer_flag, args=(other.pk,)),
+             {'reason': 'less', 'answer': other.pk}, 201, 7),
+            (user, 'get', reverse(self.search), {'q': 'q1'}, 200, 1),
+            (staff, 'get', reverse(self.export), None, 200, 4),
+        ]
+        for user, method, url, data, status, queries in expected:
+            with self.subTest(method=method, url=url), transaction.atomic():
+                client = APIClient()
+                if user is not None:
+                    client.force_authenticate(user)
+                with self.assertNumQueries(queries):
+                    res = getattr(client, method)(url, data)
+                    if res.streaming:
+                        b''.join(res.streaming_content)
+                self.assertEqual(res.status_code, status)
+                transaction.set_rollback(True)
+
+
+class TestPagination(TestSetUp):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+
+    def test_question_cursor_pagination(self):
+        Question.objects.bulk_create(
+            [Question(user=self.user, title='q%d' % i) for i in range(45)])
+        expected = list(Question.objects.order_by(
+            '-created_at', '-id').values_list('id', flat=True))
+
+        with self.Auth(self.user) as client:
+            res = client.get(reverse(self.question_LC))
+            self.assertIsNone(res.data['previous'])
+            pages = [res.data]
+            while pages[-1]['next']:
+                pages.append(client.get(pages[-1]['next']).data)
+            self.assertEqual([len(p['results']) for p in pages], [20, 20, 5])
+            seen = [q['id'] for p in pages for q in p['results']]
+            self.assertEqual(seen, expected)
+
+            # walking back yields the same pages
+            res = client.get(pages[-1]['previous'])
+            self.assertEqual(res.data['results'], pages[1]['results'])
+            res = client.get(res.data['previous'])
+            self.assertEqual(res.data['results'], pages[0]['results'])
+            self.assertIsNone(res.data['previous'])
+
+            res = client.get(reverse(self.question_LC), {'cursor': 'junk'})
+            self.assertEqual(res.status_code, 404)
+
+    def test_forged_cursors(self):
+        question = Question.objects.create(user=self.user, title='q1?')
+        Answer.objects.create(question=question, user=self.user, body='a1')
+        urls = [reverse(self.question_LC), reverse(self.answer_LC, args=(question.pk,))]
+
+        with self.Auth(self.user) as client:
+            for url in urls:
+                for position in FORGED_POSITIONS:
+                    with self.subTest(url=url, position=position):
+                        res = client.get(url, {'cursor': forge_cursor(position)})
+                        self.assertEqual(res.status_code, 404)
+                        res = client.get(url, {'cursor': forge_cursor(position, reverse=True)})
+                        self.assertEqual(res.status_code, 404)
+                # a well formed position of the right types still pages
+                res = client.get(url, {'cursor': forge_cursor(['2020-01-01T00:00:00+00:00', 1], reverse=True)})
+                self.assertEqual(res.status_code, 200)
+
+
+class TestSearch(TestSetUp):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.exams = Question.objects.create(
+            user=self.user, title='When do the semester exams start?', body='Asking for a friend')
+        self.library = Question.objects.create(
+            user=self.user, title='Library timings', body='Is it open during exams?')
+        self.answer = Answer.objects.create(
+            question=self.library, user=self.user, body='Open till 9pm on exam days')
+        self.hidden = Question.objects.create(
+            user=self.user, title='Exams are cancelled', is_hidden=True)
+
+    def hits(self, client, q):
+        res = client.get(reverse(self.search), {'q': q})
+        self.assertEqual(res.status_code, 200)
+        return [(hit['type'], hit['id']) for hit in res.data['results']]
+
+    def test_search(self):
+        with self.Auth(self.user) as client:
+            res = client.get(reverse(self.search))
+            self.assertEqual(res.status_code, 400)
+
+            hits = self.hits(client, 'exams')
+            # title matches outrank body matches, hidden rows are excluded
+            self.assertEqual(hits[0], ('question', self.exams.pk))
+            self.assertCountEqual(hits, [('question', self.exams.pk), (
+                'question', self.library.pk), ('answer', self.answer.pk)])
+            self.assertNotIn(('question', self.hidden.pk), hits)
+
+    def test_edits_are_indexed(self):
+        self.library.title = 'Reading room'
+        self.library.body = ''
+        self.library.save()
+        self.answer.is_active = False
+        self.answer.save()
+        with self.Auth(self.user) as client:
+            self.assertEqual(self.hits(client, 'exams*'), [('question', self.exams.pk)])
+
+    def test_search_pages(self):
+        Question.objects.bulk_create(
+            [Question(user=self.user, title='exam %d' % i) for i in range(25)])
+        with self.Auth(self.user) as client:
+            res = client.get(reverse(self.search), {'q': 'exam'})
+            self.assertEqual(len(res.data['results']), 20)
+            res = client.get(res.data['next'])
+            self.assertEqual(len(res.data['results']), 8)
+            self.assertIsNone(res.data['next'])
+            self.assertIsNotNone(res.data['previous'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'the tsvector index needs PostgreSQL')
+    def test_postgres_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute("""SELECT table_name, is_generated FROM information_schema.columns
+                              WHERE column_name = 'search_vector' AND data_type = 'tsvector'""")
+            self.assertCountEqual(cursor.fetchall(), [('api_question', 'ALWAYS'), ('api_answer', 'ALWAYS')])
+            cursor.execute("""SELECT indexname FROM pg_indexes
+                              WHERE indexdef LIKE '%USING gin (search_vector)%'""")
+            self.assertCountEqual([row[0] for row in cursor.fetchall()],
+                                  ['question_search_idx', 'answer_search_idx'])
+
+        # the generated column follows edits, stemmed
+        Question.objects.filter(pk=self.exams.pk).update(body='Rescheduled examinations')
+        with connection.cursor() as cursor:
+            cursor.execute("""SELECT id FROM api_question
+                              WHERE search_vector @@ plainto_tsquery('english', 'rescheduling')""")
+            self.assertEqual(cursor.fetchall(), [(self.exams.pk,)])
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute("""EXPLAIN SELECT id FROM api_question
+                              WHERE search_vector @@ plainto_tsquery('english', 'exams')""")
+            self.assertIn('question_search_idx', '\n'.join(row[0] for row in cursor.fetchall()))
+
+
+class TestScope(TestSetUp):
+
+    def setUp(self):
+        super().setUp()
+        self.author = self.make_user()
+        self.classmate = self.make_user(self.user_data_2)
+        self.senior = self.make_user(self.user_data(1, grad_year='2021'))
+        self.civil = self.make_user(self.user_data(2), department=self.civ_dept)
+
+    def post_questions(self):
+        ids = {}
+        with self.Auth(self.author) as client:
+            for scope in ('college', 'grad_year', 'branch_grad_year'):
+                res = client.post(reverse(self.question_LC), {
+                    'title': scope, 'scope': scope, 'tags': [self.general_tag.slug]})
+                self.assertEqual(res.status_code, 201)
+                ids[scope] = res.data['id']
+        return ids
+
+    def test_scoped_feed(self):
+        ids = self.post_questions()
+        expected = {
+            self.author: {'college', 'grad_year', 'branch_grad_year'},
+            self.classmate: {'college', 'grad_year', 'branch_grad_year'},
+            self.civil: {'college', 'grad_year'},
+            self.senior: {'college'},
+        }
+        for user, scopes in expected.items():
+            with self.Auth(user) as client:
+                res = client.get(reverse(self.question_LC))
+                self.assertEqual(
+                    {q['scope'] for q in res.data['results']}, scopes)
+                res = client.get(
+                    reverse(self.question_RUD, args=(ids['branch_grad_year'],)))
+                self.assertEqual(res.status_code, 200 if 'branch_grad_year' in scopes else 404)
+                res = client.get(
+                    reverse(self.answer_LC, args=(ids['grad_year'],)))
+                self.assertEqual(res.status_code, 200 if 'grad_year' in scopes else 404)
+
+    def test_widened_scope(self):
+        ids = self.post_questions()
+        # widening the scope widens the audience
+        with self.Auth(self.author) as client:
+            res = client.patch(reverse(self.question_RUD, args=(
+                ids['branch_grad_year'],)), {'scope': 'college'})
+            self.assertEqual(res.status_code, 200)
+        with self.Auth(self.senior) as client:
+            res = client.get(
+                reverse(self.question_RUD, args=(ids['branch_grad_year'],)))
+            self.assertEqual(res.status_code, 200)
+
+    def test_scoped_votes(self):
+        question = Question.objects.create(
+            user=self.author, title='q1?', scope='grad_year')
+        answer = Answer.objects.create(
+            question=question, user=self.author, body='nothing much')
+
+        with self.Auth(self.senior) as client:
+            res = client.post(reverse(self.question_vote, args=(question.pk,)),
+                              {'upvote': True}, format='json')
+            self.assertEqual(res.status_code, 404)
+            res = client.post(reverse(self.answer_vote, args=(answer.pk,)),
+                              {'upvote': True}, format='json')
+            self.assertEqual(res.status_code, 404)
+            res = client.post(reverse(self.vote_batch), [
+                {'type': 'question', 'id': question.pk, 'upvote': True},
+                {'type': 'answer', 'id': answer.pk, 'upvote': True}], format='json')
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual([r['status'] for r in res.data['results']],
+                             ['not_found', 'not_found'])
+
+        question.refresh_from_db()
+        answer.refresh_from_db()
+        self.assertEqual((question.vote_count, answer.vote_count), (0, 0))
+
+    def test_scoped_flags(self):
+        question = Question.objects.create(
+            user=self.author, title='q1?', scope='grad_year')
+        answer = Answer.objects.create(
+            question=question, user=self.author, body='nothing much')
+
+        with self.Auth(self.senior) as client:
+            res = client.post(reverse(self.question_flag, args=(question.pk,)), {
+                'question': question.pk, 'reason': 'prom'})
+            self.assertEqual(res.status_code, 400)
+            res = client.post(reverse(self.answer_flag, args=(answer.pk,)), {
+                'answer': answer.pk, 'reason': 'less'})
+            self.assertEqual(res.status_code, 400)
+
+        question.refresh_from_db()
+        answer.refresh_from_db()
+        self.assertEqual((question.flag_count, answer.flag_count), (0, 0))
+        self.assertFalse(question.is_hidden or answer.is_hidden)
+
+    @skipUnless(connection.vendor == 'sqlite', 'reads SQLite query plans')
+    def test_audience_index(self):
+        user = get_user_model()(grad_year=2022, department=self.cse_dept)
+        sql, params = Question.objects.visible_to(user).order_by().values('pk').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = [row[-1] for row in cursor.fetchall()]
+        # one range scan on the audience index per branch
+        self.assertEqual(len([step for step in plan if 'USING INDEX question_audience_idx '
+                              '(audience_grad_year=? AND audience_department_id=?)' in step]), 3, plan)
+
+
+class TestTags(TestSetUp):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.ids = {}
+        with self.Auth(self.user) as client:
+            for name, tags in (('both', ['cse', 'general']), ('cse', ['cse']), ('general', ['general'])):
+                res = client.post(reverse(self.question_LC), {
+                                  'title': name, 'tags': tags})
+                self.assertEqual(res.status_code, 201)
+                self.ids[name] = res.data['id']
+
+    def tag_counts(self, client):
+        res = client.get(reverse(self.tag_L))
+        self.assertEqual(res.status_code, 200)
+        counts = {tag['slug']: tag['question_count'] for tag in res.data}
+        return counts['cse'], counts['general']
+
+    def test_tag_filter(self):
+        with self.Auth(self.user) as client:
+            def titles(params):
+                res = client.get(reverse(self.question_LC), params)
+                self.assertEqual(res.status_code, 200)
+                return {q['title'] for q in res.data['results']}
+
+            self.assertEqual(titles({'tags': 'cse,general'}), {'both'})
+            self.assertEqual(titles({'tags': 'cse,general', 'match': 'any'}), {
+                             'both', 'cse', 'general'})
+            self.assertEqual(titles({'tags': 'cse'}), {'both', 'cse'})
+            self.assertEqual(titles({'tags': 'nope'}), set())
+            res = client.get(reverse(self.question_LC), {
+                             'tags': 'cse', 'match': 'some'})
+            self.assertEqual(res.status_code, 400)
+
+    def test_tag_counts(self):
+        with self.Auth(self.user) as client:
+            self.assertEqual(self.tag_counts(client), (2, 2))
+
+            # retagging moves the count
+            with self.captureOnCommitCallbacks(execute=True):
+                res = client.patch(reverse(self.question_RUD, args=(
+                    self.ids['cse'],)), {'tags': ['general']})
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(self.tag_counts(client), (1, 3))
+
+            # deleted and hidden questions are not counted
+            with self.captureOnCommitCallbacks(execute=True):
+                client.delete(reverse(self.question_RUD, args=(self.ids['both'],)))
+                client.delete(reverse(self.question_RUD, args=(self.ids['both'],)))
+                res = client.post(reverse(self.question_flag, args=(self.ids['general'],)), {
+                    'question': self.ids['general'], 'reason': 'less'})
+            self.assertEqual(res.status_code, 201)
+            self.assertEqual(self.tag_counts(client), (0, 1))
+
+        call_command('rebuild_counters', stdout=StringIO())
+        self.assertEqual(TagCount.objects.get(tag='general').question_count, 1)
+        self.assertEqual(TagCount.objects.get(tag='cse').question_count, 0)
+
+
+class TestReferenceCache(TestSetUp):
+
+    def test_department_etag(self):
+        res = self.client.get(reverse(self.dept_L))
+        self.assertEqual(res.status_code, 200)
+        etag = res['ETag']
+        self.assertTrue(etag.startswith('"departments-'))
+
+        # revalidation costs no query and no serialization
+        with self.assertNumQueries(0):
+            res = self.client.get(reverse(self.dept_L),
+                                  HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 304)
+        with self.assertNumQueries(0):
+            res = self.client.get(reverse(self.dept_L))
+        self.assertEqual(res['ETag'], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Department.objects.create(code='AI', name='Artificial Intelligence')
+        res = self.client.get(reverse(self.dept_L), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res['ETag'], etag)
+        self.assertIn('AI', [dept['code'] for dept in res.data])
+
+
+class TestConditionalGet(TestSetUp):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.other = self.make_user(self.user_data_2)
+        self.question = Question.objects.create(user=self.user, title='q1?')
+        self.detail = reverse(self.question_RUD, args=(self.question.pk,))
+        self.answers = reverse(self.answer_LC, args=(self.question.pk,))
+
+    def test_not_modified(self):
+        with self.Auth(self.user) as client:
+            detail_etag = client.get(self.detail)['ETag']
+            answers_etag = client.get(self.answers)['ETag']
+            self.assertNotEqual(detail_etag, answers_etag)
+
+            # polling an unchanged question is a single indexed lookup
+            with self.assertNumQueries(1):
+                res = client.get(self.detail, HTTP_IF_NONE_MATCH=detail_etag)
+            self.assertEqual(res.status_code, 304)
+            with self.assertNumQueries(1):
+                res = client.get(self.answers, HTTP_IF_NONE_MATCH=answers_etag)
+            self.assertEqual(res.status_code, 304)
+
+        # etags are per user since has_voted is
+        with self.Auth(self.other) as client:
+            res = client.get(self.detail, HTTP_IF_NONE_MATCH=detail_etag)
+            self.assertEqual(res.status_code, 200)
+
+    def test_changes_move_the_etags(self):
+        with self.Auth(self.user) as client:
+            detail_etag = client.get(self.detail)['ETag']
+            answers_etag = client.get(self.answers)['ETag']
+
+        with self.Auth(self.other) as client:
+            res = client.post(self.answers, self.answer_data_1)
+            self.assertEqual(res.status_code, 201)
+            answer_id = res.data['id']
+
+        with self.Auth(self.user) as client:
+            res = client.get(self.answers, HTTP_IF_NONE_MATCH=answers_etag)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(len(res.data['results']), 1)
+            answers_etag = res['ETag']
+
+            res = client.post(reverse(self.answer_vote, args=(
+                answer_id,)), {'upvote': True})
+            self.assertEqual(res.status_code, 200)
+            res = client.get(self.answers, HTTP_IF_NONE_MATCH=answers_etag)
+            self.assertEqual(res.status_code, 200)
+            self.assertTrue(res.data['results'][0]['has_voted'])
+
+            res = client.post(reverse(self.question_vote, args=(
+                self.question.pk,)), {'upvote': True})
+            res = client.get(self.detail, HTTP_IF_NONE_MATCH=detail_etag)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(res.data['votes'], 1)
+
+    def test_expanded_users(self):
+        # expanded users are not covered by the question's version
+        with self.Auth(self.user) as client:
+            res = client.get(self.detail, {'expand': 'user'})
+            self.assertNotIn('ETag', res)
+            res = client.patch(reverse(self.user_RUD, args=(self.user.pk,)), {'user_name': 'renamed'})
+            self.assertEqual(res.status_code, 200)
+            res = client.get(self.detail, {'expand': 'user'}, HTTP_IF_NONE_MATCH=res.get('ETag', '*'))
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(res.data['user']['user_name'], 'renamed')
+            res = client.get(reverse('async-question', args=(self.question.pk,)), {'expand': 'user'})
+            self.assertNotIn('ETag', res)
+            self.assertEqual(res.json()['user']['user_name'], 'renamed')
+
+
+class TestVoteBatch(TestSetUp):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.other = self.make_user(self.user_data_2)
+        self.questions = Question.objects.bulk_create(
+            [Question(user=self.other, title='q%d' % i) for i in range(3)])
+        self.answers = Answer.objects.bulk_create(
+            [Answer(question=self.questions[0], user=self.other, body='a%d' % i) for i in range(3)])
+
+    def test_vote_batch(self):
+        questions, answers = self.questions, self.answers
+        questions[2].votes.add(self.user, self.other)
+        Question.objects.filter(pk=questions[2].pk).update(vote_count=2)
+        Answer.objects.filter(pk=answers[2].pk).update(is_active=False)
+
+        votes = [
+            {'type': 'question', 'id': questions[0].pk, 'upvote': True},
+            {'type': 'question', 'id': questions[1].pk, 'upvote': False},
+            {'type': 'question', 'id': questions[2].pk, 'upvote': False},
+            {'type': 'answer', 'id': answers[0].pk, 'upvote': True},
+            {'type': 'answer', 'id': answers[1].pk, 'upvote': True},
+            {'type': 'answer', 'id': answers[0].pk, 'upvote': False},
+            {'type': 'answer', 'id': answers[2].pk, 'upvote': True},
+            {'type': 'answer', 'id': self.invalid_id, 'upvote': True},
+        ]
+        with self.Auth(self.user) as client:
+            res = client.post(reverse(self.vote_batch), votes[:2])
+            self.assertEqual(res.status_code, 200)
+            res = client.post(reverse(self.vote_batch), votes[2:])
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual([(r['status'], r.get('votes')) for r in res.data['results']], [
+                ('ok', 1), ('ok', 1), ('ok', 1), ('duplicate', None),
+                ('not_found', None), ('not_found', None)])
+        question = Question.objects.get(pk=questions[0].pk)
+        self.assertEqual(question.vote_count, 1)
+        # bumped once by each batch touching the question or its answers
+        self.assertEqual(question.content_version, 3)
+        self.assertEqual(Question.objects.get(
+            pk=questions[2].pk).vote_count, 1)
+        self.assertEqual(
+            set(self.user.answers_upvoted.values_list('pk', flat=True)), {answers[0].pk, answers[1].pk})
+
+    def test_batch_queries(self):
+        # the query count does not grow with the batch size
+        with self.Auth(self.user) as client:
+            with CaptureQueriesContext(connection) as ctx:
+                res = client.post(reverse(self.vote_batch), [
+                    {'type': 'answer', 'id': a.pk, 'upvote': True} for a in self.answers[:2]])
+            self.assertEqual(
+                [r['status'] for r in res.data['results']], ['ok', 'ok'])
+            small = len(ctx.captured_queries)
+            more = Answer.objects.bulk_create(
+                [Answer(question=self.questions[1], user=self.other, body='b%d' % i) for i in range(20)])
+            with CaptureQueriesContext(connection) as ctx:
+                res = client.post(reverse(self.vote_batch), [
+                    {'type': 'answer', 'id': a.pk, 'upvote': True} for a in more])
+            self.assertEqual(len(ctx.captured_queries), small)
+
+    def test_invalid_batches(self):
+        with self.Auth(self.user) as client:
+            res = client.post(reverse(self.vote_batch), [
+                              {'type': 'user', 'id': 1, 'upvote': True}])
+            self.assertEqual(res.status_code, 400)
+
+            # refused by length alone, before the votes are looked at
+            with mock.patch.object(VoteSerializer, 'run_validation') as run_validation:
+                res = client.post(reverse(self.vote_batch), [
+                    {'type': 'answer', 'id': self.answers[0].pk, 'upvote': True}] * (MAX_BATCH + 1))
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(res.data['non_field_errors'][0].code, 'max_length')
+            run_validation.assert_not_called()
+
+
+class TestCachedJWT(TestSetUp):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.auth = authentication.CachedJWTAuthentication()
+
+    def token_client(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer %s' %
+                           AccessToken.for_user(self.user))
+        return client
+
+    def uncached_queries(self, client, url):
+        with CaptureQueriesContext(connection) as ctx:
+            res = client.get(url)
+        self.assertEqual(res.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_cached_user(self):
+        question = Question.objects.create(user=self.user, title='q1?')
+        detail = reverse(self.question_RUD, args=(question.pk,))
+        client = self.token_client()
+        uncached = self.uncached_queries(client, detail)
+        # the user now comes from the cache
+        with self.assertNumQueries(uncached - 1):
+            res = client.get(detail)
+        self.assertEqual(res.status_code, 200)
+        # and the author check needs no user either
+        res = client.patch(detail, {'title': 'q2?'})
+        self.assertEqual(res.status_code, 200)
+
+    def test_saving_drops_the_user(self):
+        question = Question.objects.create(user=self.user, title='q1?')
+        detail = reverse(self.question_RUD, args=(question.pk,))
+        client = self.token_client()
+        uncached = self.uncached_queries(client, detail)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        res = client.get(detail)
+        self.assertEqual(res.status_code, 403)
+
+        with self.settings(AUTH_USER_CACHE_TTL=0):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.is_active = True
+                self.user.save()
+            client.get(detail)
+            with self.assertNumQueries(uncached):
+                res = client.get(detail)
+            self.assertEqual(res.status_code, 200)
+
+    def test_copies(self):
+        token = self.auth.get_validated_token(str(AccessToken.for_user(self.user)))
+
+        # every request gets its own copy, the first one too
+        first, second = self.auth.get_user(token), self.auth.get_user(token)
+        cached = authentication.users.entries[self.user.htno][2]
+        self.assertEqual(first, cached)
+        self.assertIsNot(first, cached)
+        self.assertIsNot(second, cached)
+
+    def test_changes_in_other_workers(self):
+        token = self.auth.get_validated_token(str(AccessToken.for_user(self.user)))
+        self.auth.get_user(token)
+
+        # a worker deactivating the user moves the shared stamp, which
+        # drops the entries of this one
+        get_user_model().objects.filter(pk=self.user.pk).update(is_active=False)
+        stamp = authentication.users.stamp
+        stamp.store.set(stamp.key, 'moved', timeout=None)
+        with self.assertNumQueries(1), self.assertRaises(AuthenticationFailed):
+            self.auth.get_user(token)
+
+    def test_revoked_tokens(self):
+        # simplejwt modules hold on to the settings they imported
+        with mock.patch.object(authentication.api_settings, 'CHECK_REVOKE_TOKEN', True):
+            old = self.auth.get_validated_token(str(AccessToken.for_user(self.user)))
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.set_password('changed')
+                self.user.save()
+            new = self.auth.get_validated_token(str(AccessToken.for_user(self.user)))
+            self.auth.get_user(new)
+            # the user cached for the new token does not vouch for the old one
+            with self.assertNumQueries(0), self.assertRaises(AuthenticationFailed):
+                self.auth.get_user(old)
+            with self.assertNumQueries(0):
+                self.assertEqual(self.auth.get_user(new), self.user)
+
+    def test_pruning(self):
+        users = authentication.users
+        version = users.version()
+        users.set(self.user.htno, self.user, version)
+        users.set('old-htno', self.user, 'old-version')
+        self.assertIsNone(users.get('old-htno', version))
+
+        # dead entries go when a later user is added
+        now = time.monotonic()
+        with mock.patch.object(authentication.time, 'monotonic', return_value=now + 3600):
+            self.assertIsNone(users.get(self.user.htno, version))
+            users.set('new-htno', self.user, version)
+        self.assertEqual(set(users.entries), {'new-htno'})
+
+
+class TestExport(TestSetUp):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.staff = self.make_user(self.user_data_2, is_staff=True)
+        questions = Question.objects.bulk_create(
+            [Question(user=self.user, title='q%d' % i) for i in range(5)])
+        for i, question in enumerate(questions):
+            Question.objects.filter(pk=question.pk).update(
+                created_at='2021-06-%02dT10:00:00Z' % (i + 1))
+        questions[1].tags.add(self.cse_tag, self.general_tag)
+        Answer.objects.create(question=questions[1], user=self.staff, body='a1')
+        Answer.objects.create(question=questions[1], user=self.user, body='a2', is_active=False)
+        Question.objects.filter(pk=questions[1].pk).update(
+            vote_count=3, flag_count=1, is_hidden=True)
+
+    def exported(self, **params):
+        with self.Auth(self.staff) as client:
+            res = client.get(reverse(self.export), params)
+        self.assertEqual(res.status_code, 200)
+        return b''.join(res.streaming_content).decode()
+
+    def test_export(self):
+        with self.Auth(self.user) as client:
+            res = client.get(reverse(self.export))
+            self.assertEqual(res.status_code, 403)
+
+        with self.Auth(self.staff) as client:
+            res = client.get(reverse(self.export))
+            self.assertEqual(res.status_code, 200)
+            self.assertTrue(res.streaming)
+            self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+            lines = [json.loads(line) for line in b''.join(
+                res.streaming_content).decode().splitlines()]
+            self.assertEqual([line['title'] for line in lines], [
+                'q0', 'q1', 'q2', 'q3', 'q4'])
+            self.assertEqual(lines[1]['tags'], ['cse', 'general'])
+            self.assertEqual((lines[1]['votes'], lines[1]['flags'], lines[1]['is_hidden']),
+                             (3, 1, True))
+            self.assertEqual([(a['body'], a['user'], a['is_active']) for a in lines[1]['answers']],
+                             [('a1', self.staff.pk, True), ('a2', self.user.pk, False)])
+
+            res = client.get(reverse(self.export), HTTP_ACCEPT='application/x-ndjson')
+            self.assertEqual(res.status_code, 200)
+
+    def test_export_since(self):
+        self.assertEqual([json.loads(line)['title'] for line in self.exported(
+            since='2021-06-03T10:00:00Z').splitlines()], ['q3', 'q4'])
+        with self.Auth(self.staff) as client:
+            res = client.get(reverse(self.export), {'since': 'yesterday'})
+            self.assertEqual(res.status_code, 400)
+
+    def test_export_command(self):
+        # the command writes the same lines, reading in chunks of any size
+        content = self.exported()
+        out, err = StringIO(), StringIO()
+        with self.assertNumQueries(3 * 3 + 1):
+            call_command('export_qa', chunk_size=2, stdout=out, stderr=err)
+        self.assertEqual(out.getvalue(), content)
+        self.assertEqual(err.getvalue(), 'Exported 5 questions up to 2021-06-05T10:00:00+00:00\n')
+        out = StringIO()
+        call_command('export_qa', since='2021-06-04', stdout=out, stderr=StringIO())
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+
+
+class TestMetrics(TestSetUp):
+
+    def setUp(self):
+        super().setUp()
+        metrics.registry.reset()
+        self.staff = self.make_user(self.user_data_2, is_staff=True)
+
+    def test_metrics(self):
+        user = self.make_user()
+        question = Question.objects.create(user=user, title='q')
+
+        with self.Auth(user) as client:
+            client.get(reverse(self.question_LC))
+            client.get(reverse(self.question_LC))
+            client.get(reverse(self.question_RUD, args=(self.invalid_id,)))
+            client.get('/api/v1/nowhere')
+            with CaptureQueriesContext(connection) as ctx:
+                client.get(reverse(self.question_RUD, args=(question.pk,)))
+            retrieve_queries = len(ctx.captured_queries)
+            self.assertEqual(client.get(reverse(self.metrics)).status_code, 403)
+
+        with self.Auth(self.staff) as client:
+            res = client.get(reverse(self.metrics))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res['Content-Type'], 'text/plain; charset=utf-8')
+        lines = res.content.decode().splitlines()
+        self.assertIn('# TYPE askvce_request_duration_seconds histogram', lines)
+        self.assertIn(
+            'askvce_requests_total{view="questions",method="GET",status="200"} 2', lines)
+        self.assertIn(
+            'askvce_requests_total{view="question",method="GET",status="404"} 1', lines)
+        self.assertIn(
+            'askvce_requests_total{view="<unresolved>",method="GET",status="404"} 1', lines)
+        self.assertIn(
+            'askvce_requests_total{view="metrics",method="GET",status="403"} 1', lines)
+        self.assertIn(
+            'askvce_request_duration_seconds_bucket{view="questions",method="GET",le="+Inf"} 2', lines)
+        self.assertIn(
+            'askvce_request_duration_seconds_count{view="question",method="GET"} 2', lines)
+        # summed over the 404 and the retrieve
+        queries = [line for line in lines if line.startswith(
+            'askvce_db_queries_total{view="question",method="GET"}')]
+        self.assertEqual(len(queries), 1)
+        self.assertGreater(int(queries[0].split()[-1]), retrieve_queries)
+
+    def test_metrics_sum_the_worker_processes(self):
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS_DIR=directory):
+            # a snapshot left by another worker
+            with open(os.path.join(directory, '1.json'), 'w') as f:
+                json.dump([{'view': 'departments', 'method': 'GET', 'statuses': {'200': 5},
+                            'buckets': [5] + [0] * len(metrics.LATENCY_BUCKETS),
+                            'seconds': 0.01, 'queries': 5, 'db_seconds': 0.002}], f)
+            with self.Auth(self.staff) as client:
+                client.get(reverse(self.dept_L))
+                res = client.get(reverse(self.metrics))
+            self.assertTrue(os.path.exists(os.path.join(directory, '%d.json' % os.getpid())))
+        lines = res.content.decode().splitlines()
+        self.assertIn(
+            'askvce_requests_total{view="departments",method="GET",status="200"} 6', lines)
+        self.assertIn(
+            'askvce_request_duration_seconds_count{view="departments",method="GET"} 6', lines)
+
+    async def test_metrics_keep_the_asgi_chain_async(self):
+        # a sync-only middleware would run every ASGI request on one thread
+        with self.settings(DEBUG=True), self.assertLogs('django.request', 'DEBUG') as logs:
+            chain = ASGIHandler()._middleware_chain
+            logging.getLogger('django.request').debug('loaded')
+        self.assertNotIsInstance(chain, SyncToAsync)
+        self.assertFalse([line for line in logs.output if 'adapted' in line])
+        res = await self.async_client.get(reverse('async-departments'))
+        self.assertEqual(res.status_code, 200)
+        series = {(item['view'], item['method']): item for item in metrics.registry.snapshot()}
+        departments = series['async-departments', 'GET']
+        self.assertEqual(departments['statuses'], {200: 1})
+        # counted on the thread running the request's queries
+        self.assertGreater(departments['queries'], 0)
+
+
+class TestProfiling(TestSetUp):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = self.settings(PROFILE_DIR=directory.name, PROFILE_KEEP=2)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.directory = directory.name
+        self.user = self.make_user()
+        self.staff = self.make_user(self.user_data_2, is_staff=True)
+        self.question = Question.objects.create(user=self.user, title='q')
+        self.url = reverse(self.question_RUD, args=(self.question.pk,))
+
+    def test_staff_only(self):
+        # the profiler is not even started for anonymous or non-staff users
+        vote = reverse(self.question_vote, args=(self.question.pk,))
+        with mock.patch.object(profiling, 'Capture') as capture:
+            res = self.client.get(reverse(self.dept_L), HTTP_X_PROFILE='1')
+            self.assertEqual(res.status_code, 200)
+            self.client.get(self.url, HTTP_X_PROFILE='1')
+            with self.Auth(self.user) as client:
+                self.assertNotIn('X-Profile-Id', client.get(self.url, HTTP_X_PROFILE='1'))
+                self.assertEqual(client.get(reverse(self.profiles)).status_code, 403)
+                client.post(vote, {'upvote': True}, HTTP_X_PROFILE='1')
+            capture.assert_not_called()
+        self.assertEqual(os.listdir(self.directory), [])
+
+        with self.Auth(self.staff) as client:
+            self.assertNotIn('X-Profile-Id', client.get(self.url))
+            self.assertNotIn('X-Profile-Id', client.get(self.url, HTTP_X_PROFILE='0'))
+
+    def test_profile(self):
+        with self.Auth(self.staff) as client:
+            with CaptureQueriesContext(connection) as ctx:
+                res = client.get(self.url, HTTP_X_PROFILE='1')
+            self.assertEqual(res.status_code, 200)
+            capture_id = res['X-Profile-Id']
+            queries = len(ctx.captured_queries)
+
+            res = client.get(reverse(self.profile, args=(capture_id,)))
+            self.assertEqual(res.status_code, 200)
+            capture = res.json()
+            self.assertEqual((capture['view'], capture['status'], capture['user']),
+                             ('question', 200, self.staff.pk))
+            self.assertEqual(capture['query_count'], queries)
+            self.assertEqual(len(capture['queries']), queries)
+            self.assertTrue(capture['queries'][0]['sql'].startswith('SELECT'))
+            self.assertIn('function calls', capture['top'])
+
+            res = client.get(reverse(self.profile, args=(capture_id,)), {'download': ''})
+            self.assertEqual(res.status_code, 200)
+            path = os.path.join(self.directory, 'downloaded.prof')
+            with open(path, 'wb') as f:
+                f.write(b''.join(res.streaming_content))
+            pstats.Stats(path)
+
+    def test_function_views(self):
+        with self.Auth(self.staff) as client:
+            res = client.post(reverse(self.question_vote, args=(self.question.pk,)), {'upvote': True},
+                              HTTP_X_PROFILE='1')
+            self.assertEqual(res.status_code, 200)
+            capture = client.get(reverse(self.profile, args=(res['X-Profile-Id'],))).json()
+            self.assertEqual((capture['view'], capture['method']), ('question-vote', 'POST'))
+
+    def test_newest_kept(self):
+        # only the newest PROFILE_KEEP are kept
+        with self.Auth(self.staff) as client:
+            ids = [client.get(self.url, HTTP_X_PROFILE='1')['X-Profile-Id'] for _ in range(3)]
+            res = client.get(reverse(self.profiles))
+            self.assertEqual([capture['id'] for capture in res.json()], ids[:0:-1])
+            self.assertNotIn('queries', res.json()[0])
+            self.assertEqual(client.get(reverse(self.profile, args=(ids[0],))).status_code, 404)
+            self.assertEqual(client.get(reverse(self.profile, args=('..',))).status_code, 404)
+
+
+class TestFastSerializers(TestSetUp):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.other = self.make_user(self.user_data_2)
+        body = 'caf\u00e9 \u201cquoted\u201d \\ "\n\u2028\u2029 \U0001f600 </script>'
+        self.questions = Question.objects.bulk_create(
+            [Question(user=self.other, title='q%d' % i, body=body) for i in range(5)])
+        self.questions[0].tags.add(self.general_tag, self.cse_tag)
+        self.questions[1].tags.add(self.cse_tag)
+        self.questions[0].votes.add(self.user)
+        Question.objects.filter(pk=self.questions[0].pk).update(vote_count=1)
+        self.answers = Answer.objects.bulk_create(
+            [Answer(question=self.questions[0], user=self.other, body=body) for i in range(3)])
+        self.answers[0].votes.add(self.user)
+        Answer.objects.filter(pk=self.answers[0].pk).update(vote_count=1)
+        self.request = types.SimpleNamespace(user=self.user)
+        self.cases = (
+            (fast_serializers.questions, QuestionSerializer,
+             Question.objects.visible_to(self.user).for_display().order_by('-created_at', '-id')),
+            (fast_serializers.answers, AnswerSerializer,
+             Answer.objects.for_display().filter(question=self.questions[0]).order_by('-created_at', '-id')),
+            (fast_serializers.departments, DepartmentSerializer, Department.objects.all()),
+        )
+
+    def assertSameBytes(self):
+        for rows, serializer, queryset in self.cases:
+            expected = JSONRenderer().render(serializer(
+                queryset, many=True, context={'request': self.request}).data)
+            data = rows.serialize(list(rows.values(queryset)), self.request)
+            self.assertEqual(FastJSONRenderer().render(data), expected)
+
+    def test_same_bytes_as_serializers(self):
+        self.assertSameBytes()
+
+    @override_settings(VOTE_WRITE_BEHIND=True)
+    def test_queued_votes(self):
+        vote(Question, self.questions[1].pk, self.other, True)
+        vote(Answer, self.answers[0].pk, self.user, False)
+        self.assertSameBytes()
+        # the queued votes are counted
+        rows, _, queryset = self.cases[0]
+        votes = {item['id']: item['votes'] for item in rows.serialize(
+            list(rows.values(queryset)), self.request)}
+        self.assertEqual((votes[self.questions[0].pk], votes[self.questions[1].pk]), (1, 1))
+
+    def test_renderer(self):
+        data = {
+            'text': 'caf\u00e9 \u2028\u2029 "\\ \x00\x1f\x7f \U0001f600',
+            'when': datetime.datetime(2021, 6, 1, 10, 0, 0, 123456, tzinfo=datetime.timezone.utc),
+            'date': datetime.date(2021, 6, 1),
+            'amount': decimal.Decimal('1.5'),
+            'lazy': gettext_lazy('Not found.'),
+            'nested': [None, True, False, 0, -1, 2 ** 63 - 1, {'a': []}],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        # out of orjson's range
+        data = {'big': 2 ** 64}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render(data, 'application/json; indent=2'),
+                         JSONRenderer().render(data, 'application/json; indent=2'))
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+
+class TestFieldsExpand(TestSetUp):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.other = self.make_user(self.user_data_2)
+        questions = Question.objects.bulk_create(
+            [Question(user=self.other, title='q%d' % i, body='body') for i in range(6)])
+        for question in questions:
+            question.tags.add(self.general_tag, self.cse_tag)
+        Answer.objects.bulk_create(
+            [Answer(question=question, user=self.user if i % 2 else self.other, body='a%d' % i)
+             for question in questions for i in range(3)])
+        self.question = questions[0]
+
+    def test_fields(self):
+        with self.Auth(self.user) as client:
+            # only the fields asked for, the id always, and a narrower SELECT
+            with CaptureQueriesContext(connection) as queries:
+                res = client.get(reverse(self.question_LC), {'fields': 'title,votes'})
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(list(res.data['results'][0]), ['id', 'title', 'votes'])
+            select = queries.captured_queries[0]['sql']
+            self.assertIn('"title"', select)
+            self.assertNotIn('"body"', select)
+            # tags and has_voted were not asked for, so not fetched
+            self.assertEqual(len(queries), 1)
+
+            res = client.get(reverse(self.question_RUD, args=[self.question.pk]), {'fields': 'body'})
+            self.assertEqual(res.data, {'id': self.question.pk, 'body': 'body'})
+            res = client.get(reverse(self.answer_LC, args=[self.question.pk]), {'fields': 'user'})
+            self.assertEqual(sorted(item['user'] for item in res.data['results']),
+                             sorted([self.user.pk, self.other.pk, self.other.pk]))
+
+    def test_unknown_names(self):
+        with self.Auth(self.user) as client:
+            for params in ({'fields': 'title,password'}, {'expand': 'votes'}):
+                res = client.get(reverse(self.question_LC), params)
+                self.assertEqual(res.status_code, 400)
+            res = client.get(reverse(self.answer_LC, args=[self.question.pk]), {'expand': 'answers'})
+            self.assertEqual(res.status_code, 400)
+
+    def test_expand(self):
+        with self.Auth(self.user) as client:
+            # expanded fields are inlined, and shown even if not asked for
+            res = client.get(reverse(self.question_RUD, args=[self.question.pk]),
+                             {'fields': 'title', 'expand': 'answers,tags,user'})
+            self.assertEqual(res.status_code, 200)
+            data = res.data
+            self.assertEqual(list(data), ['id', 'title', 'user', 'tags', 'answers'])
+            # only the public fields of users/<pk>, which is private
+            self.assertEqual(data['user'], {'id': self.other.pk, 'user_name': self.other.user_name})
+            self.assertEqual(data['tags'], [
+                {'slug': tag.slug, 'description': tag.description}
+                for tag in sorted((self.cse_tag, self.general_tag), key=lambda tag: tag.pk)])
+            answers = data['answers']
+            self.assertEqual((answers['next'], answers['previous']), (None, None))
+            self.assertEqual([answer['body'] for answer in answers['results']], ['a2', 'a1', 'a0'])
+            # and so are the users of the inlined answers
+            self.assertEqual([answer['user']['id'] for answer in answers['results']],
+                             [self.other.pk, self.user.pk, self.other.pk])
+
+            res = client.get(reverse(self.answer_LC, args=[self.question.pk]), {'expand': 'user'})
+            self.assertEqual(res.data['results'][0]['user']['id'], self.other.pk)
+
+    def test_inlined_answers(self):
+        # a question's first page of answers is inlined, best voted first,
+        # with a link to the rest
+        more = Answer.objects.bulk_create(
+            [Answer(question=self.question, user=self.user, body='more') for i in range(10)])
+        Answer.objects.filter(pk=more[0].pk).update(vote_count=1)
+        with self.Auth(self.user) as client:
+            pages = []
+            for url in (reverse(self.question_RUD, args=[self.question.pk]), reverse(self.question_LC)):
+                res = client.get(url, {'expand': 'answers'})
+                pages.append(res.data['answers'] if 'answers' in res.data else next(
+                    item for item in res.data['results'] if item['id'] == self.question.pk)['answers'])
+            self.assertEqual(pages[0], pages[1])
+            page = pages[0]
+            self.assertEqual(len(page['results']), TopAnswersPagination.page_size)
+            self.assertEqual(page['results'][0]['id'], more[0].pk)
+            ids = [answer['id'] for answer in page['results']]
+            next_url = page['next']
+            while next_url:
+                res = client.get(next_url)
+                ids += [answer['id'] for answer in res.data['results']]
+                next_url = res.data['next']
+        self.assertEqual(sorted(ids), sorted(self.question.answer_set.values_list('id', flat=True)))
+        self.assertEqual(len(ids), 13)
+
+    def test_expansion_queries(self):
+        # one query per expansion, whatever the page size
+        counts = set()
+        with self.Auth(self.user) as client:
+            for size in (1, 6):
+                with CaptureQueriesContext(connection) as queries:
+                    res = client.get(reverse(self.question_LC), {
+                        'page_size': size, 'expand': 'answers,tags,user'})
+                self.assertEqual(len(res.data['results']), size)
+                counts.add(len(queries))
+        self.assertEqual(len(counts), 1)
+
+
+class TestThread(TestSetUp):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.other = self.make_user(self.user_data_2)
+        self.question = Question.objects.create(user=self.other, title='q', body='body')
+        self.question.tags.add(self.cse_tag)
+        self.answers = Answer.objects.bulk_create(
+            [Answer(question=self.question, user=self.other, body='a%d' % i) for i in range(12)])
+        Answer.objects.create(question=self.question, user=self.other, body='hidden', is_hidden=True)
+        # votes 0, 1, 2, 0, 1, 2, ...
+        for i, answer in enumerate(self.answers):
+            Answer.objects.filter(pk=answer.pk).update(vote_count=i % 3)
+        self.answers[2].votes.add(self.user)
+        self.url = reverse(self.question_thread, args=[self.question.pk])
+        # best voted first, then newest
+        self.expected = [answer for i, answer in sorted(
+            enumerate(self.answers), key=lambda item: (item[0] % 3, item[0]), reverse=True)]
+
+    def test_thread(self):
+        with self.Auth(self.user) as client:
+            res = client.get(self.url)
+        self.assertEqual(res.status_code, 200)
+        data = res.data
+        self.assertEqual((data['id'], data['tags'], data['has_voted']),
+                         (self.question.pk, [self.cse_tag.pk], False))
+        page = data['answers']
+        self.assertEqual([item['id'] for item in page['results']],
+                         [answer.pk for answer in self.expected[:5]])
+        self.assertEqual([item['votes'] for item in page['results']], [2, 2, 2, 2, 1])
+        self.assertEqual([item['has_voted'] for item in page['results']],
+                         [answer.pk == self.answers[2].pk for answer in self.expected[:5]])
+        self.assertIsNone(page['previous'])
+
+    def test_rest_of_the_answers(self):
+        # the rest comes from the answer list, in the same order
+        with self.Auth(self.user) as client:
+            page = client.get(self.url).data['answers']
+            self.assertIn('sort=top', page['next'])
+            seen = [item['id'] for item in page['results']]
+            next_url = page['next']
+            while next_url:
+                res = client.get(next_url)
+                self.assertEqual(res.status_code, 200)
+                seen += [item['id'] for item in res.data['results']]
+                next_url = res.data['next']
+        self.assertEqual(seen, [answer.pk for answer in self.expected])
+
+    def test_thread_queries(self):
+        # as many queries with more answers
+        with self.Auth(self.user) as client:
+            with CaptureQueriesContext(connection) as queries:
+                client.get(self.url)
+            count = len(queries)
+            Answer.objects.bulk_create(
+                [Answer(question=self.question, user=self.user, body='more') for i in range(20)])
+            with CaptureQueriesContext(connection) as queries:
+                res = client.get(self.url, {'page_size': 30})
+        self.assertEqual(len(res.data['answers']['results']), 30)
+        self.assertEqual(len(queries), count)
+
+    def test_errors(self):
+        with self.Auth(self.user) as client:
+            res = client.get(reverse(self.answer_LC, args=[self.question.pk]), {'sort': 'best'})
+            self.assertEqual(res.status_code, 400)
+            self.question.is_active = False
+            self.question.save()
+            self.assertEqual(client.get(self.url).status_code, 404)
+
+
+class TestRanking(TestSetUp):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.other = self.make_user(self.user_data_2)
+
+    def rank(self, *args):
+        out = StringIO()
+        call_command('rank_questions', *args, stdout=out)
+        return out.getvalue().strip()
+
+    def seed(self):
+        now = timezone.now()
+        # (hours old, votes, answers)
+        shapes = [(0, 0, 0), (1, 0, 1), (2, 50, 0), (30, 1000, 0), (48, 3, 3), (5, 2, 0)]
+        questions = []
+        for i, (hours, votes, answers) in enumerate(shapes):
+            question = Question.objects.create(user=self.other, title='q%d' % i)
+            Question.objects.filter(pk=question.pk).update(
+                created_at=now - datetime.timedelta(hours=hours), vote_count=votes)
+            Answer.objects.bulk_create([Answer(question=question, user=self.user, body='a')] * answers)
+            questions.append(question)
+        Answer.objects.create(question=questions[0], user=self.user, body='hidden', is_hidden=True)
+        self.assertEqual(self.rank(), 'Ranked 6 questions, removed 0')
+        return questions
+
+    def expected(self):
+        scores = {}
+        for question in Question.objects.filter(is_active=True, is_hidden=False):
+            answers = question.answer_set.filter(is_active=True, is_hidden=False).count()
+            scores[question.pk] = ranking.hot_score(question.vote_count, answers, question.created_at)
+        return sorted(scores, key=lambda pk: (scores[pk], pk), reverse=True)
+
+    def hot(self, client, **params):
+        ids, url = [], reverse(self.question_LC)
+        params = {'sort': 'hot', **params}
+        while url:
+            res = client.get(url, params)
+            self.assertEqual(res.status_code, 200)
+            ids += [item['id'] for item in res.data['results']]
+            url, params = res.data['next'], None
+        return ids
+
+    def test_hot_questions(self):
+        questions = self.seed()
+        with self.Auth(self.user) as client:
+            order = self.hot(client, page_size=2)
+            self.assertEqual(order, self.expected())
+            # recency wins over a few votes, many votes over recency
+            self.assertLess(order.index(questions[0].pk), order.index(questions[5].pk))
+            self.assertLess(order.index(questions[3].pk), order.index(questions[4].pk))
+            self.assertEqual(client.get(reverse(self.question_LC), {'sort': 'top'}).status_code, 400)
+
+    def test_only_changes_are_ranked(self):
+        questions = self.seed()
+        self.assertEqual(self.rank(), 'Ranked 0 questions, removed 0')
+        with self.Auth(self.user) as client:
+            res = client.post(reverse(self.answer_LC, args=[questions[4].pk]), self.answer_data_1)
+            self.assertEqual(res.status_code, 201)
+            res = client.post(reverse(self.question_vote, args=[questions[1].pk]), {'upvote': True})
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(self.rank(), 'Ranked 2 questions, removed 0')
+            self.assertEqual(self.hot(client), self.expected())
+        self.assertFalse(Question.objects.filter(rank_stale=True).exists())
+
+    def test_changed_while_ranked(self):
+        questions = self.seed()
+
+        # a question changing while it is scored stays stale
+        def score_and_vote(*args):
+            Question.objects.filter(pk=questions[2].pk).update(
+                content_version=F('content_version') + 1, rank_stale=True)
+            return 0.0
+        bump_content_version(questions[2].pk)
+        with mock.patch.object(ranking, 'hot_score', side_effect=score_and_vote):
+            self.assertEqual(self.rank(), 'Ranked 1 questions, removed 0')
+        self.assertEqual(list(ranking.stale_questions()), [questions[2]])
+        self.assertEqual(self.rank(), 'Ranked 1 questions, removed 0')
+        with self.Auth(self.user) as client:
+            self.assertEqual(self.hot(client), self.expected())
+
+    def test_deleted_and_new_questions(self):
+        questions = self.seed()
+        # questions deleted are dropped, new ones wait for the next run
+        with self.Auth(self.other) as author:
+            author.delete(reverse(self.question_RUD, args=[questions[4].pk]))
+        with self.Auth(self.user) as client:
+            res = client.post(reverse(self.question_LC), {**self.question_data_1, 'tags': ['general']})
+            self.assertEqual(res.status_code, 201)
+            self.assertEqual(len(self.hot(client)), 5)
+            self.assertEqual(self.rank(), 'Ranked 1 questions, removed 1')
+            self.assertEqual(self.hot(client), self.expected())
+        self.assertEqual(self.rank('--full'), 'Ranked 6 questions, removed 0')
+        self.assertEqual(QuestionRank.objects.count(), 6)
+
+    def test_tampered_hot_cursor(self):
+        question = Question.objects.create(user=self.user, title='q1?')
+        self.rank()
+        score = QuestionRank.objects.get(question=question).score
+        with self.Auth(self.user) as client:
+            for url in (reverse(self.question_LC), reverse('async-questions')):
+                for position in (['x', 1], [{'a': 1}, 1], [None, 1], [score, 'x']):
+                    with self.subTest(url=url, position=position):
+                        res = client.get(url, {'sort': 'hot', 'cursor': forge_cursor(position)})
+                        self.assertEqual(res.status_code, 404)
+                # scores travel as floats, or strings of them
+                res = client.get(url, {'sort': 'hot', 'cursor': forge_cursor([str(score + 1), 1])})
+                self.assertEqual(res.status_code, 200)
+                self.assertEqual(res.json()['results'][0]['id'], question.pk)
+
+
+class TestReputation(TestSetUp):
+
+    def setUp(self):
+        super().setUp()
+        self.author = self.make_user()
+        self.voter = self.make_user(self.user_data_2)
+        self.questions = [Question.objects.create(user=self.author, title='q%d' % i) for i in range(3)]
+
+    def score(self, user):
+        return get_user_model().objects.values_list('usefullness_score', flat=True).get(pk=user.pk)
+
+    def answer(self):
+        with self.Auth(self.voter) as client:
+            res = client.post(reverse(self.answer_LC, args=[self.questions[0].pk]), self.answer_data_1)
+        self.assertEqual(res.status_code, 201)
+        return Answer.objects.get(pk=res.data['id'])
+
+    def test_answers_and_votes(self):
+        self.assertEqual(self.score(self.author), reputation.BASE)
+        answer = self.answer()
+        self.assertEqual(self.score(self.voter), reputation.BASE + reputation.ANSWER)
+
+        questions = self.questions
+        with self.Auth(self.author) as client:
+            client.post(reverse(self.question_vote, args=[questions[0].pk]), {'upvote': True})
+            client.post(reverse(self.answer_vote, args=[answer.pk]), {'upvote': True})
+            res = client.post(reverse(self.vote_batch), [
+                {'type': 'question', 'id': questions[0].pk, 'upvote': False},
+                {'type': 'question', 'id': questions[1].pk, 'upvote': True},
+            ], format='json')
+            self.assertEqual(res.status_code, 200)
+        with self.Auth(self.voter) as client:
+            res = client.post(reverse(self.vote_batch), [
+                {'type': 'question', 'id': pk, 'upvote': True} for pk in (questions[1].pk, questions[2].pk)
+            ], format='json')
+            self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.score(self.author), reputation.BASE + 3 * reputation.QUESTION_VOTE)
+        self.assertEqual(self.score(self.voter),
+                         reputation.BASE + reputation.ANSWER + reputation.ANSWER_VOTE)
+
+    def test_queued_votes(self):
+        # queued votes count once flushed
+        questions = self.questions
+        with self.Auth(self.voter) as client:
+            client.post(reverse(self.question_vote, args=[questions[2].pk]), {'upvote': True})
+        self.assertEqual(self.score(self.author), reputation.BASE + reputation.QUESTION_VOTE)
+        with self.settings(VOTE_WRITE_BEHIND=True), self.Auth(self.voter) as client:
+            client.post(reverse(self.question_vote, args=[questions[2].pk]), {'upvote': False})
+            client.post(reverse(self.question_vote, args=[questions[0].pk]), {'upvote': True})
+            client.post(reverse(self.question_vote, args=[questions[0].pk]), {'upvote': False})
+            self.assertEqual(self.score(self.author), reputation.BASE + reputation.QUESTION_VOTE)
+            call_command('flush_votes', stdout=StringIO())
+        self.assertEqual(self.score(self.author), reputation.BASE)
+
+    def test_flags(self):
+        answer = self.answer()
+        with self.Auth(self.voter) as client:
+            res = client.post(reverse(self.question_flag, args=[self.questions[1].pk]),
+                              {'reason': 'less', 'question': self.questions[1].pk})
+            self.assertEqual(res.status_code, 201)
+        with self.Auth(self.author) as client:
+            res = client.post(reverse(self.answer_flag, args=[answer.pk]),
+                              {'reason': 'less', 'answer': answer.pk})
+            self.assertEqual(res.status_code, 201)
+        self.assertEqual(self.score(self.author), reputation.BASE + reputation.FLAG)
+        self.assertEqual(self.score(self.voter), reputation.BASE + reputation.ANSWER + reputation.FLAG)
+
+    def test_reconcile(self):
+        # the stored scores are the ones recomputed from the tables
+        self.answer()
+        with self.Auth(self.voter) as client:
+            client.post(reverse(self.question_vote, args=[self.questions[1].pk]), {'upvote': True})
+        out = StringIO()
+        call_command('reconcile_reputation', '--check', stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'User: no usefullness score drifted')
+        get_user_model().objects.filter(pk=self.author.pk).update(usefullness_score=100)
+        with self.assertRaises(CommandError):
+            call_command('reconcile_reputation', '--check', stdout=StringIO())
+        self.assertEqual(self.score(self.author), 100)
+        call_command('reconcile_reputation', stdout=out)
+        self.assertIn('User: fixed 1 usefullness score', out.getvalue())
+        self.assertEqual(self.score(self.author), reputation.BASE + reputation.QUESTION_VOTE)
+
+
+class TestLeaderboard(TestSetUp):
+
+    def test_leaderboard(self):
+        db = get_user_model()
+        users = [self.make_user(self.user_data(i)) for i in range(5)]
+        for user, score in zip(users, (10, 30, 20, 30, 5)):
+            db.objects.filter(pk=user.pk).update(usefullness_score=score)
+        db.objects.filter(pk=users[4].pk).update(is_active=False)
+        db.objects.filter(pk=users[2].pk).update(department=self.civ_dept)
+
+        with self.Auth(users[0]) as client:
+            url = reverse(self.leaderboard, args=[self.cse_dept.pk])
+            res = client.get(url, {'page_size': 2})
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(res.data['results'][0], {
+                'id': users[3].pk, 'user_name': 'user3', 'usefullness_score': 30})
+            ids = [item['id'] for item in res.data['results']]
+            res = client.get(res.data['next'])
+            ids += [item['id'] for item in res.data['results']]
+            self.assertEqual(ids, [users[3].pk, users[1].pk, users[0].pk])
+            self.assertIsNone(res.data['next'])
+
+            res = client.get(reverse(self.leaderboard, args=[self.civ_dept.pk]))
+            self.assertEqual([item['id'] for item in res.data['results']], [users[2].pk])
+            res = client.get(reverse(self.leaderboard, args=[0]))
+            self.assertEqual(res.status_code, 404)
+
+
+class TestAsyncViews(TestSetUp):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        other = self.make_user(self.user_data_2)
+        questions = Question.objects.bulk_create(
+            [Question(user=other, title='q%d' % i) for i in range(25)])
+        questions[0].tags.add(self.cse_tag)
+        questions[0].votes.add(self.user)
+        Question.objects.filter(pk=questions[0].pk).update(vote_count=1)
+        self.answers = Answer.objects.bulk_create(
+            [Answer(question=questions[0], user=other, body='a%d' % i) for i in range(3)])
+        Answer.objects.filter(pk=self.answers[0].pk).update(vote_count=2)
+        call_command('rank_questions', stdout=StringIO())
+        QuestionRank.objects.filter(question=questions[1]).delete()
+        self.pk = questions[0].pk
+
+    def test_async_reads_match_sync(self):
+        pk = self.pk
+
+        def strip(data):
+            # cursors link back to the endpoint they came from
+            return {key: value for key, value in data.items() if key not in ('next', 'previous')}
+
+        pairs = [
+            (reverse(self.dept_L), reverse('async-departments')),
+            (reverse(self.question_LC), reverse('async-questions')),
+            (reverse(self.question_LC) + '?tags=cse', reverse('async-questions') + '?tags=cse'),
+            (reverse(self.question_RUD, args=(pk,)), reverse('async-question', args=(pk,))),
+            (reverse(self.answer_LC, args=(pk,)), reverse('async-question-answers', args=(pk,))),
+            (reverse(self.question_LC) + '?sort=hot', reverse('async-questions') + '?sort=hot'),
+            (reverse(self.answer_LC, args=(pk,)) + '?sort=top',
+             reverse('async-question-answers', args=(pk,)) + '?sort=top'),
+        ]
+        with self.Auth(self.user) as client:
+            for sync_url, async_url in pairs:
+                expected = client.get(sync_url)
+                res = client.get(async_url)
+                self.assertEqual(res.status_code, 200)
+                self.assertEqual(res['Content-Type'], 'application/json')
+                data = json.loads(res.content)
+                if isinstance(data, dict):
+                    self.assertEqual(strip(data), strip(expected.json()))
+                else:
+                    self.assertEqual(data, expected.json())
+                self.assertEqual(res.has_header('ETag'), expected.has_header('ETag'))
+                if res.has_header('ETag'):
+                    res = client.get(async_url, HTTP_IF_NONE_MATCH=res['ETag'])
+                    self.assertEqual(res.status_code, 304)
+
+    def test_async_sorting(self):
+        # sorted like their sync counterparts
+        with self.Auth(self.user) as client:
+            res = client.get(reverse('async-questions'), {'sort': 'hot', 'page_size': 100})
+            results = json.loads(res.content)['results']
+            self.assertEqual(results[0]['id'], self.pk)
+            self.assertEqual(len(results), 24)
+            res = client.get(reverse('async-question-answers', args=(self.pk,)), {'sort': 'top'})
+            self.assertEqual(json.loads(res.content)['results'][0]['id'], self.answers[0].pk)
+            for url in (reverse('async-questions'), reverse('async-question-answers', args=(self.pk,))):
+                res = client.get(url, {'sort': 'old'})
+                self.assertEqual(res.status_code, 400)
+
+    def test_async_query_counts(self):
+        # as many queries as their sync counterparts
+        with self.Auth(self.user) as client:
+            for url, queries in ((reverse('async-questions'), 3),
+                                 (reverse('async-question', args=(self.pk,)), 4),
+                                 (reverse('async-question-answers', args=(self.pk,)), 3)):
+                with self.assertNumQueries(queries):
+                    client.get(url)
+
+    def test_async_cursors_and_errors(self):
+        with self.Auth(self.user) as client:
+            res = client.get(reverse('async-questions'))
+            res = client.get(json.loads(res.content)['next'])
+            self.assertEqual(len(json.loads(res.content)['results']), 5)
+
+            res = client.get(reverse('async-question', args=(self.invalid_id,)))
+            self.assertEqual(res.status_code, 404)
+            res = client.get(reverse('async-questions') + '?cursor=bad')
+            self.assertEqual(res.status_code, 404)
+            res = client.get(reverse('async-questions') + '?tags=cse&match=some')
+            self.assertEqual(res.status_code, 400)
+            res = client.post(reverse('async-questions'), self.question_data_1)
+            self.assertEqual(res.status_code, 405)
+
+    def test_async_anonymous(self):
+        res = self.client.get(reverse('async-questions'))
+        self.assertEqual(res.status_code, self.client.get(
+            reverse(self.question_LC)).status_code)
+        res = self.client.get(reverse('async-departments'))
+        self.assertEqual(res.status_code, 200)
+
+    def test_forged_cursors(self):
+        urls = [reverse('async-questions'), reverse('async-question-answers', args=(self.pk,))]
+        with self.Auth(self.user) as client:
+            for url in urls:
+                for position in FORGED_POSITIONS:
+                    with self.subTest(url=url, position=position):
+                        res = client.get(url, {'cursor': forge_cursor(position)})
+                        self.assertEqual(res.status_code, 404)
+                        self.assertEqual(res.json(), {'detail': 'Invalid cursor'})
+
+    async def test_invalid_input(self):
+        @async_views.read_view(authenticated=False)
+        async def view(request):
+            raise DjangoValidationError('“x” value must be an integer.')
+
+        res = await view(RequestFactory().get('/'))
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(json.loads(res.content), ['“x” value must be an integer.'])
+
+
+@override_settings(VOTE_WRITE_BEHIND=True)
+class TestWriteBehindVotes(TestSetUp):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.other = self.make_user(self.user_data_2)
+        self.question = Question.objects.create(user=self.other, title='q1?')
+        self.answer = Answer.objects.create(
+            question=self.question, user=self.other, body='a1')
+        self.question.votes.add(self.other)
+        Question.objects.filter(pk=self.question.pk).update(vote_count=1)
+        self.detail = reverse(self.question_RUD, args=(self.question.pk,))
+
+    def queue_votes(self, client):
+        question_vote = reverse(self.question_vote, args=(self.question.pk,))
+        answer_vote = reverse(self.answer_vote, args=(self.answer.pk,))
+        res = client.post(question_vote, {'upvote': True})
+        self.assertEqual(res.data['votes'], 2)
+        res = client.post(question_vote, {'upvote': True})
+        self.assertEqual(res.status_code, 400)
+        res = client.post(answer_vote, {'upvote': True})
+        self.assertEqual(res.data['votes'], 1)
+        res = client.post(answer_vote, {'upvote': False})
+        self.assertEqual(res.data['votes'], 0)
+
+    def test_queued_votes(self):
+        with self.Auth(self.user) as client:
+            etag = client.get(self.detail)['ETag']
+            self.queue_votes(client)
+
+            # acknowledged without touching the counters
+            self.question.refresh_from_db()
+            self.assertEqual((self.question.vote_count, self.question.content_version), (1, 1))
+            self.assertEqual(PendingVote.objects.count(), 3)
+
+            # but visible to readers, and to conditional GETs
+            res = client.get(self.detail, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual((res.data['votes'], res.data['has_voted']), (2, True))
+            res = client.get(reverse(self.question_LC))
+            self.assertEqual(res.data['results'][0]['votes'], 2)
+            res = client.get(reverse(self.answer_LC, args=(self.question.pk,)))
+            self.assertEqual(res.data['results'][0]['votes'], 0)
+            self.assertFalse(res.data['results'][0]['has_voted'])
+
+    def test_flush(self):
+        with self.Auth(self.user) as client:
+            self.queue_votes(client)
+            etag = client.get(self.detail)['ETag']
+        with self.Auth(self.other) as client:
+            res = client.post(reverse(self.vote_batch), [
+                {'type': 'question', 'id': self.question.pk, 'upvote': False},
+                {'type': 'answer', 'id': self.answer.pk, 'upvote': True}])
+            self.assertEqual([(r['status'], r['votes']) for r in res.data['results']], [
+                ('ok', 1), ('ok', 1)])
+
+        out = StringIO()
+        call_command('flush_votes', batch_size=2, stdout=out)
+        self.assertEqual(out.getvalue(), 'Flushed 5 votes\n')
+        self.assertFalse(PendingVote.objects.exists())
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.vote_count, 1)
+        self.assertEqual(set(self.question.votes.values_list('pk', flat=True)), {self.user.pk})
+        self.answer.refresh_from_db()
+        self.assertEqual(self.answer.vote_count, 1)
+        self.assertEqual(set(self.answer.votes.values_list('pk', flat=True)), {self.other.pk})
+
+        with self.Auth(self.user) as client:
+            res = client.get(self.detail, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual((res.data['votes'], res.data['has_voted']), (1, True))
+
+
+@skipIf(connection.vendor == 'sqlite' and connection.settings_dict['OPTIONS'].get('transaction_mode') != 'IMMEDIATE',
+        'SQLite fails concurrent deferred transactions instead of waiting for locks')
+class TestVoteConcurrency(TransactionTestCase):
+    serialized_rollback = True
+    threads = 16
+
+    def test_parallel_votes(self):
+        db = get_user_model()
+        users = db.objects.bulk_create([db(
+            email='1602-18-733-%03d@vce.ac.in' % i, user_name='user%d' % i, first_name='Foo',
+            last_name='Bar', dob='2000-10-19', grad_year=2022, htno='1602-18-733-%03d' % i,
+            phone='98765432%02d' % i, is_active=True) for i in range(self.threads)])
+        question = Question.objects.create(user=users[0], title='q1?')
+        url = reverse('question-vote', args=(question.pk,))
+        barrier = threading.Barrier(self.threads)
+        statuses = []
+
+        def double_tap(user):
+            client = APIClient()
+            client.force_authenticate(user=user)
+            try:
+                barrier.wait()
+                for _ in range(2):
+                    statuses.append(client.post(
+                        url, {'upvote': True}, format='json').status_code)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=double_tap, args=(user,))
+                   for user in users]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        # every user gets exactly one accepted vote and one rejection
+        self.assertEqual(sorted(statuses), [200] *
+                         self.threads + [400] * self.threads)
+        question.refresh_from_db()
+        self.assertEqual(question.vote_count, self.threads)
+        self.assertEqual(question.votes.count(), self.threads)
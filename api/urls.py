@@ -1,20 +1,40 @@
 from django.urls import path
 from .views import *
+from . import async_views
 
 urlpatterns = [
     path('departments', DepartmentList.as_view(), name="departments"),
+    path('departments/<int:pk>/leaderboard', DepartmentLeaderboard.as_view(),
+         name="department-leaderboard"),
+    path('tags', TagList.as_view(), name="tags"),
     path('users', UserCreate.as_view(), name="users"),
     path('users/<int:pk>', UserRetrieveUpdateDestory.as_view(), name="user"),
     path('questions', QuestionListCreate.as_view(), name="questions"),
     path('questions/<int:pk>', QuestionRetrieveUpdateDestroy.as_view(),
          name="question"),
+    path('questions/<int:pk>/thread', QuestionThread.as_view(), name="question-thread"),
     path('questions/<int:pk>/answers',
          AnswerListCreate.as_view(), name="question-answers"),
     path('questions/<int:pk>/answers/<int:val>',
          AnswerRetrieveUpdateDestroy.as_view(), name="question-answer"),
     path('questions/<int:pk>/vote', vote_question, name="question-vote"),
     path('answers/<int:pk>/vote', vote_answer, name="answer-vote"),
+    path('votes:batch', vote_batch, name="votes-batch"),
     path('questions/<int:pk>/flag',
          QuestionFlagsCreate.as_view(), name="question-flag"),
     path('answers/<int:pk>/flag', AnswerFlagsCreate.as_view(), name="answer-flag"),
+    path('search', SearchList.as_view(), name="search"),
+    path('export', Export.as_view(), name="export"),
+]
+
+# async variants of the read endpoints, for ASGI deployments
+urlpatterns += [
+    path('async/departments', async_views.department_list,
+         name="async-departments"),
+    path('async/questions', async_views.question_list,
+         name="async-questions"),
+    path('async/questions/<int:pk>', async_views.question_detail,
+         name="async-question"),
+    path('async/questions/<int:pk>/answers', async_views.answer_list,
+         name="async-question-answers"),
 ]
@@ -3,42 +3,175 @@ from django.shortcuts import get_object_or_404
 from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.auth import get_user_model
 from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.urls import reverse
 from rest_framework import generics, status
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 from api.serializers import *
-from api.models import Department, Question, Answer
+from api import cache, export, fast_serializers, metrics, profiling, reputation, search
+from api.cache import QuestionVersionMixin, ReferenceListMixin
+from api.counters import bump_content_version, deactivate_question, flag_answer, flag_question
+from api.models import Department, Question, Answer, Tag
+from api.pagination import KeysetPagination, TopAnswersPagination
+from api.renderers import FastJSONRenderer, NDJSONRenderer, PrometheusRenderer
+from api.votes import MAX_BATCH, add_pending_votes, apply_votes, vote
 from api.permissions import EditPermission, UserEditPermission
+from api.profiling import ProfilingMixin, profiled
+
+
+def filter_tags(queryset, query_params):
+    """
+    Restricts to questions carrying all (?match=all, the default) or any
+    (?match=any) of the comma separated ?tags=.
+    """
+    tags = {tag for tag in query_params.get('tags', '').split(',') if tag}
+    if not tags:
+        return queryset
+    match = query_params.get('match', 'all')
+    if match not in ('all', 'any'):
+        raise ValidationError({'match': 'Must be one of all, any.'})
+    return queryset.tagged(tags, match_all=match == 'all')
+
+
+QUESTION_SORTS = {
+    'new': KeysetPagination.ordering,
+    # the scores of api.ranking, questions not scored yet are left out
+    'hot': ('-rank__score', '-id'),
+}
+
+
+ANSWER_SORTS = {
+    'new': KeysetPagination.ordering,
+    'top': TopAnswersPagination.ordering,
+}
+
+
+def sort_ordering(sorts, query_params):
+    """
+    Returns the keyset ordering `sorts` maps ?sort= to, 'new' by default.
+    """
+    sort = query_params.get('sort', 'new')
+    if sort not in sorts:
+        raise ValidationError({'sort': ['Choose from %s.' % ', '.join(sorts)]})
+    return sorts[sort]
+
+
+def filter_ranked(queryset, query_params):
+    """
+    Leaves out the questions not scored yet when sorting by ?sort=hot.
+    """
+    if query_params.get('sort') == 'hot':
+        return queryset.filter(rank__isnull=False)
+    return queryset
+
+
+class RowSerializerMixin:
+    """
+    Lists and retrieves through a fast_serializers.RowSerializer, which
+    returns the same data as the view's serializer_class, restricted to
+    ?fields= and with ?expand= inlined.
+    """
+    row_serializer = None
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def list(self, request, *args, **kwargs):
+        plan = self.row_serializer.plan_for(request)
+        ordering = [name.lstrip('-') for name in self.paginator.get_ordering(self)]
+        rows = self.paginate_queryset(self.row_serializer.values(
+            self.filter_queryset(self.get_queryset()), *ordering, plan=plan))
+        return self.get_paginated_response(self.row_serializer.serialize(rows, request, plan))
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Needs a get_queryset() matching only the requested object.
+        """
+        plan = self.row_serializer.plan_for(request)
+        rows = list(self.row_serializer.values(
+            self.filter_queryset(self.get_queryset()), plan=plan))
+        if not rows:
+            raise Http404
+        return Response(self.row_serializer.serialize(rows, request, plan)[0])
 
 
-class UserCreate(generics.CreateAPIView):
+class UserCreate(ProfilingMixin, generics.CreateAPIView):
     queryset = get_user_model().objects.all()
     serializer_class = UserSerializer
 
 
-class UserRetrieveUpdateDestory(generics.RetrieveUpdateDestroyAPIView):
+class UserRetrieveUpdateDestory(ProfilingMixin, generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAuthenticated, UserEditPermission]
     queryset = get_user_model().objects.all()
     serializer_class = UserSerializer
 
 
-class DepartmentList(generics.ListAPIView):
+class DepartmentList(ProfilingMixin, ReferenceListMixin, generics.ListAPIView):
+    reference_cache = cache.departments
+    row_serializer = fast_serializers.departments
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
     queryset = Department.objects.all()
     serializer_class = DepartmentSerializer
 
 
-class QuestionListCreate(generics.ListCreateAPIView):
+class DepartmentLeaderboard(ProfilingMixin, RowSerializerMixin, generics.ListAPIView):
+    """
+    The department's active users by usefullness_score, best first.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = LeaderSerializer
+    row_serializer = fast_serializers.leaders
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-usefullness_score', '-id')
+
+    def get_queryset(self):
+        get_object_or_404(Department.objects.only('id'), pk=self.kwargs['pk'])
+        return get_user_model().objects.filter(department_id=self.kwargs['pk'], is_active=True)
+
+
+class TagList(ProfilingMixin, ReferenceListMixin, generics.ListAPIView):
+    """
+    Tags with their question counts. The counts are part of the cached
+    list, so it is invalidated by every question asked, flagged, deleted
+    or retagged (api.counters.adjust_tag_counts) and only saves the work
+    between those writes.
+    """
+    permission_classes = [IsAuthenticated]
+    reference_cache = cache.tags
+    queryset = Tag.objects.annotate(question_count=Coalesce(
+        F('counter__question_count'), 0)).order_by('slug')
+    serializer_class = TagSerializer
+
+
+class QuestionListCreate(ProfilingMixin, RowSerializerMixin, generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated]
-    queryset = Question.objects.filter(is_active=True, users_flagged=None)
     serializer_class = QuestionSerializer
+    row_serializer = fast_serializers.questions
+    pagination_class = KeysetPagination
+
+    @property
+    def keyset_ordering(self):
+        return sort_ordering(QUESTION_SORTS, self.request.query_params)
+
+    def get_queryset(self):
+        queryset = Question.objects.visible_to(self.request.user).for_display()
+        if self.request.method == 'GET':
+            queryset = filter_ranked(filter_tags(
+                queryset, self.request.query_params), self.request.query_params)
+        return queryset
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
 
-class QuestionRetrieveUpdateDestroy(generics.RetrieveUpdateDestroyAPIView):
+class QuestionRetrieveUpdateDestroy(ProfilingMixin, QuestionVersionMixin, RowSerializerMixin, generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAuthenticated, EditPermission]
+    row_serializer = fast_serializers.questions
 
     def get_queryset(self):
         """
@@ -46,23 +179,26 @@ class QuestionRetrieveUpdateDestroy(generics.RetrieveUpdateDestroyAPIView):
         if is_active field is set to True
         """
         q_id = self.kwargs['pk']
-        return Question.objects.filter(id=q_id, is_active=True, users_flagged=None)
+        return Question.objects.visible_to(self.request.user).for_display().filter(id=q_id)
     serializer_class = QuestionSerializer
 
+    def perform_update(self, serializer):
+        serializer.save()
+        bump_content_version(serializer.instance.pk)
+
     def update(self, request, *args, **kwargs):
-        question = get_object_or_404(Question, pk=kwargs['pk'])
-        if question.answer_set.filter(is_active=True).count() > 0:
+        question = get_object_or_404(Question.objects.only('id'), pk=kwargs['pk'])
+        if question.answer_set.filter(is_active=True).exists():
             return Response({"detail": "Answered questions cannot be updated"}, status=status.HTTP_400_BAD_REQUEST)
-        return super().update(request, args, kwargs)
+        return super().update(request, *args, **kwargs)
 
     def delete(self, request, *args, **kwargs):
-        question = get_object_or_404(Question, pk=kwargs['pk'])
-        question.is_active = False
-        question.save()
+        question = get_object_or_404(Question.objects.only('id'), pk=kwargs['pk'])
+        deactivate_question(question.pk)
         return Response({"detail": "Question deleted"}, status=status.HTTP_204_NO_CONTENT)
 
 
-class QuestionFlagsCreate(generics.CreateAPIView):
+class QuestionFlagsCreate(ProfilingMixin, generics.CreateAPIView):
     def get_queryset(self):
         """
         This view should return the question with given id
@@ -76,15 +212,18 @@ class QuestionFlagsCreate(generics.CreateAPIView):
     # maybe use restframework exception handler instead of overriding.
     def create(self, request, *args, **kwargs):
         try:
-            return super(QuestionFlagsCreate, self).create(request, *args, **kwargs)
+            with transaction.atomic():
+                return super(QuestionFlagsCreate, self).create(request, *args, **kwargs)
         except IntegrityError:
             return Response({"detail": "Bad request"}, status=status.HTTP_400_BAD_REQUEST)
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        flag = serializer.save(user=self.request.user)
+        flag_question(flag.question_id)
+        reputation.credit_author(Question, flag.question_id, reputation.FLAG)
 
 
-class AnswerFlagsCreate(generics.CreateAPIView):
+class AnswerFlagsCreate(ProfilingMixin, generics.CreateAPIView):
     def get_queryset(self):
         """
         This view should return the answer with given id
@@ -98,29 +237,45 @@ class AnswerFlagsCreate(generics.CreateAPIView):
     # maybe use restframework exception handler instead of overriding.
     def create(self, request, *args, **kwargs):
         try:
-            return super(AnswerFlagsCreate, self).create(request, *args, **kwargs)
+            with transaction.atomic():
+                return super(AnswerFlagsCreate, self).create(request, *args, **kwargs)
         except IntegrityError:
             return Response({"detail": "Bad request"}, status=status.HTTP_400_BAD_REQUEST)
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        flag = serializer.save(user=self.request.user)
+        flag_answer(flag.answer_id)
+        reputation.credit_author(Answer, flag.answer_id, reputation.FLAG)
 
 
-class AnswerListCreate(generics.ListCreateAPIView):
+class AnswerListCreate(ProfilingMixin, QuestionVersionMixin, RowSerializerMixin, generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated]
+    row_serializer = fast_serializers.answers
+    pagination_class = KeysetPagination
+
+    @property
+    def keyset_ordering(self):
+        return sort_ordering(ANSWER_SORTS, self.request.query_params)
 
     def get_queryset(self):
-        question = Question.objects.get(pk=self.kwargs['pk'])
-        return question.answer_set.all().filter(is_active=True, users_flagged=None)
+        if not self.question_visible:
+            get_object_or_404(Question.objects.visible_to(
+                self.request.user).only('id'), pk=self.kwargs['pk'])
+        return Answer.objects.for_display().filter(
+            question_id=self.kwargs['pk'], is_active=True, is_hidden=False)
     serializer_class = AnswerSerializer
 
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user,
-                        question=Question.objects.get(pk=self.kwargs['pk']))
+        answer = serializer.save(user=self.request.user,
+                                 question=get_object_or_404(Question.objects.visible_to(self.request.user).only('id'), pk=self.kwargs['pk']))
+        bump_content_version(answer.question_id)
+        reputation.adjust({answer.user_id: reputation.ANSWER})
 
 
-class AnswerRetrieveUpdateDestroy(generics.RetrieveUpdateDestroyAPIView):
+class AnswerRetrieveUpdateDestroy(ProfilingMixin, RowSerializerMixin, generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAuthenticated, EditPermission]
+    row_serializer = fast_serializers.answers
     lookup_url_kwarg = 'val'
 
     def get_queryset(self):
@@ -128,50 +283,168 @@ class AnswerRetrieveUpdateDestroy(generics.RetrieveUpdateDestroyAPIView):
         This view should return the question with given id
         if is_active field is set to True
         """
-        question = Question.objects.get(pk=self.kwargs['pk'])
-        return Answer.objects.filter(pk=self.kwargs['val'], question=question, is_active=True, users_flagged=None)
+        return Answer.objects.for_display().filter(
+            pk=self.kwargs['val'], question_id=self.kwargs['pk'], is_active=True, is_hidden=False,
+            question__in=Question.objects.visible_to(self.request.user).values('pk'))
     serializer_class = AnswerSerializer
 
+    def perform_update(self, serializer):
+        answer = serializer.save()
+        bump_content_version(answer.question_id)
+
     def delete(self, request, *args, **kwargs):
         answer = get_object_or_404(Answer, pk=kwargs['val'])
         answer.is_active = False
         answer.save()
+        bump_content_version(answer.question_id)
         return Response({"detail": "Answer deleted"}, status=status.HTTP_204_NO_CONTENT)
 
 
+class QuestionThread(ProfilingMixin, QuestionVersionMixin, generics.RetrieveAPIView):
+    """
+    A question with its best voted answers, in the same number of queries
+    however many answers it has. The answers' `next` link continues with
+    the answer list sorted the same way. Votes still queued when they are
+    written behind count in `votes` but not yet in the order.
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    pagination_class = TopAnswersPagination
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs['pk']
+        rows = list(fast_serializers.questions.values(
+            Question.objects.visible_to(request.user).filter(pk=pk)))
+        if not rows:
+            raise Http404
+        thread = fast_serializers.questions.serialize(rows, request)[0]
+
+        paginator = self.paginator
+        ordering = [name.lstrip('-') for name in paginator.get_ordering(self)]
+        page = paginator.get_page_queryset(fast_serializers.answers.values(
+            Answer.objects.filter(question_id=pk, is_active=True, is_hidden=False),
+            *ordering), request, self)
+        paginator.base_url = replace_query_param(replace_query_param(
+            request.build_absolute_uri(reverse('question-answers', args=[pk])),
+            'sort', 'top'), paginator.page_size_query_param, paginator.size)
+        answers = fast_serializers.answers.serialize(paginator.paginate_results(page), request)
+        thread['answers'] = paginator.get_paginated_response(answers).data
+        return Response(thread)
+
+
+class SearchList(ProfilingMixin, generics.GenericAPIView):
+    """
+    Ranked full-text search over visible questions and answers.
+    """
+    permission_classes = [IsAuthenticated]
+    page_size = 20
+    max_page = 50
+
+    def get(self, request, *args, **kwargs):
+        terms = search.tokenize(request.query_params.get('q', ''))
+        if not terms:
+            return Response({"detail": "Missing required paramter"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            page = int(request.query_params.get('page', 1))
+        except ValueError:
+            page = 0
+        if not 1 <= page <= self.max_page:
+            return Response({"detail": "Invalid page"}, status=status.HTTP_404_NOT_FOUND)
+
+        hits = add_pending_votes(search.search(
+            terms, request.user, self.page_size + 1, (page - 1) * self.page_size))
+        url = request.build_absolute_uri()
+        next_url = previous_url = None
+        if len(hits) > self.page_size and page < self.max_page:
+            next_url = replace_query_param(url, 'page', page + 1)
+        if page > 2:
+            previous_url = replace_query_param(url, 'page', page - 1)
+        elif page == 2:
+            previous_url = remove_query_param(url, 'page')
+        return Response({
+            'next': next_url,
+            'previous': previous_url,
+            'results': hits[:self.page_size],
+        })
+
+
+class Export(ProfilingMixin, generics.GenericAPIView):
+    """
+    Streams every question with its answers, tags and counters as NDJSON,
+    optionally only those created after ?since=.
+    """
+    permission_classes = [IsAdminUser]
+    renderer_classes = [JSONRenderer, NDJSONRenderer]
+
+    def get(self, request, *args, **kwargs):
+        since = request.query_params.get('since')
+        if since is not None:
+            try:
+                since = export.parse_since(since)
+            except ValueError as e:
+                return Response({"since": [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
+        return StreamingHttpResponse(export.export_lines(since),
+                                     content_type=NDJSONRenderer.media_type)
+
+
+class Metrics(ProfilingMixin, generics.GenericAPIView):
+    """
+    Request, latency and SQL metrics of all the worker processes, in the
+    Prometheus text format.
+    """
+    permission_classes = [IsAdminUser]
+    renderer_classes = [PrometheusRenderer]
+
+    def get(self, request, *args, **kwargs):
+        response = Response(metrics.exposition(metrics.registry.collect()))
+        response['Cache-Control'] = 'no-store'
+        return response
+
+
+class ProfileList(ProfilingMixin, generics.GenericAPIView):
+    """
+    Lists the saved X-Profile captures, newest first.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(profiling.captures())
+
+
+class ProfileRetrieve(ProfilingMixin, generics.GenericAPIView):
+    """
+    A saved X-Profile capture with its SQL statements, or with ?download
+    its pstats file.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            if 'download' in request.query_params:
+                return FileResponse(open(profiling.profile_path(kwargs['capture']), 'rb'),
+                                    as_attachment=True, filename=kwargs['capture'] + '.prof',
+                                    content_type='application/octet-stream')
+            return Response(profiling.load(kwargs['capture']))
+        except FileNotFoundError:
+            raise Http404
+
+
 def do_vote(request, model_text, model, kwargs):
     try:
-        id = kwargs['pk']
         upvote = request.data['upvote'] == True
-        if upvote:
-            with transaction.atomic():
-                question_or_answer = model.objects.get(
-                    is_active=True, id=id)
-                if request.user in question_or_answer.votes.all():
-                    return Response({"detail": "Invalid %s vote" % (model_text)}, status=status.HTTP_400_BAD_REQUEST)
-                question_or_answer.votes.add(request.user)
-                question_or_answer.save()
-                return Response({"votes": question_or_answer.votes.count()}, status=status.HTTP_200_OK)
-        else:
-            with transaction.atomic():
-                question_or_answer = model.objects.get(
-                    is_active=True, id=id)
-                if request.user not in question_or_answer.votes.all():
-                    return Response({"detail": "Invalid %s vote" % (model_text)}, status=status.HTTP_400_BAD_REQUEST)
-                question_or_answer.votes.remove(request.user)
-                question_or_answer.save()
-                return Response({"votes": question_or_answer.votes.count()}, status=status.HTTP_200_OK)
+        votes = vote(model, kwargs['pk'], request.user, upvote)
     except (MultiValueDictKeyError, KeyError):
         return Response({"detail": "Missing required paramter"}, status=status.HTTP_400_BAD_REQUEST)
-    except IntegrityError:
-        return Response({"detail": "Something went wrong"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     except ObjectDoesNotExist:
         return Response({"detail": "%s does not exist" % (model_text)}, status=status.HTTP_404_NOT_FOUND)
-    except Exception:
-        return Response({"detail": "Something went wrong"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    if votes is None:
+        return Response({"detail": "Invalid %s vote" % (model_text)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({"votes": votes}, status=status.HTTP_200_OK)
+
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@profiled
 @transaction.atomic
 def vote_question(request, **kwargs):
     return do_vote(request, "Question", Question, kwargs)
@@ -179,6 +452,19 @@ def vote_question(request, **kwargs):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@profiled
 @transaction.atomic
 def vote_answer(request, **kwargs):
     return do_vote(request, "Answer", Answer, kwargs)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@profiled
+@transaction.atomic
+def vote_batch(request, **kwargs):
+    # oversized batches are refused before any vote is validated
+    serializer = VoteSerializer(data=request.data, many=True, max_length=MAX_BATCH)
+    serializer.is_valid(raise_exception=True)
+    results = apply_votes(request.user, serializer.validated_data)
+    return Response({"results": results}, status=status.HTTP_200_OK)
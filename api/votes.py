@@ -0,0 +1,323 @@
+"""
+Vote bookkeeping shared by the vote endpoints.
+
+Votes are toggled with an insert-if-absent and a delete-returning on the
+through table, both served by its unique (object, user) index. The rows
+a statement reports back are the only ones counted, so a vote costs the
+same few queries however popular the post is, and concurrent double
+taps cannot double count or raise an IntegrityError.
+
+With VOTE_WRITE_BEHIND on, a vote is instead appended to the PendingVote
+queue and acknowledged, and flush_pending later applies queued votes in
+batches with one counter update per post. Until then reads add the
+pending deltas to the stored counts, so voters see their vote at once.
+Applying a vote also moves its author's reputation, see api.reputation.
+"""
+from collections import Counter
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, Exists, F, Max, OuterRef, Sum, When
+from api import reputation
+from api.models import Question, Answer, PendingVote
+
+MAX_BATCH = 100
+
+VOTABLE = {
+    'question': Question,
+    'answer': Answer,
+}
+
+
+def _through_columns(model):
+    through = model.votes.through
+    fk = model._meta.model_name
+    qn = connection.ops.quote_name
+    return (qn(through._meta.db_table),
+            qn(through._meta.get_field('user').column),
+            qn(through._meta.get_field(fk).column))
+
+
+def add_vote_pairs(model, pairs):
+    """
+    Inserts the (user_id, object_id) votes that do not exist yet and
+    returns the set of pairs actually inserted.
+    """
+    if not pairs:
+        return set()
+    table, user_column, fk_column = _through_columns(model)
+    sql = 'INSERT INTO %s (%s, %s) VALUES %s ON CONFLICT DO NOTHING RETURNING %s, %s' % (
+        table, user_column, fk_column, ', '.join(['(%s, %s)'] * len(pairs)), user_column, fk_column)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [value for pair in pairs for value in pair])
+        return {tuple(row) for row in cursor.fetchall()}
+
+
+def remove_vote_pairs(model, pairs):
+    """
+    Deletes the (user_id, object_id) votes and returns the set of pairs
+    that actually existed.
+    """
+    if not pairs:
+        return set()
+    table, user_column, fk_column = _through_columns(model)
+    sql = 'DELETE FROM %s WHERE (%s, %s) IN (VALUES %s) RETURNING %s, %s' % (
+        table, user_column, fk_column, ', '.join(['(%s, %s)'] * len(pairs)), user_column, fk_column)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [value for pair in pairs for value in pair])
+        return {tuple(row) for row in cursor.fetchall()}
+
+
+def add_votes(model, user_id, ids):
+    """
+    Inserts the user's votes for `ids` that do not exist yet and returns
+    the set of ids actually inserted.
+    """
+    return {pk for _, pk in add_vote_pairs(model, [(user_id, pk) for pk in ids])}
+
+
+def remove_votes(model, user_id, ids):
+    """
+    Deletes the user's votes for `ids` and returns the set of ids that
+    actually had one.
+    """
+    return {pk for _, pk in remove_vote_pairs(model, [(user_id, pk) for pk in ids])}
+
+
+def write_behind():
+    return getattr(settings, 'VOTE_WRITE_BEHIND', False)
+
+
+def _latest_pending(model, ids, user_id=None):
+    """
+    Ids of the newest pending vote per (object, user) among `ids`; only
+    the newest one says what the user's vote will be once flushed.
+    """
+    pending = PendingVote.objects.filter(
+        kind=model._meta.model_name, object_id__in=ids)
+    if user_id is not None:
+        pending = pending.filter(user_id=user_id)
+    return pending.order_by().values('object_id', 'user_id').annotate(
+        last=Max('id')).values('last')
+
+
+def pending_deltas(model, ids):
+    """
+    Returns {id: delta}, the change the unflushed votes will make to the
+    vote counts of `ids`, in one query.
+    """
+    if not ids:
+        return {}
+    voted = Exists(model.votes.through.objects.filter(
+        user_id=OuterRef('user_id'), **{model._meta.model_name: OuterRef('object_id')}))
+    return dict(PendingVote.objects.filter(id__in=_latest_pending(model, ids)).annotate(
+        voted=voted).order_by().values('object_id').annotate(delta=Sum(Case(
+            When(upvote=True, voted=False, then=1),
+            When(upvote=False, voted=True, then=-1),
+            default=0))).values_list('object_id', 'delta'))
+
+
+def voted_ids(model, user, ids):
+    """
+    Returns the subset of `ids` the user has voted for, counting queued
+    votes when write-behind is on.
+    """
+    if not user.is_authenticated or not ids:
+        return set()
+    fk = model._meta.model_name + '_id'
+    voted = set(model.votes.through.objects.filter(
+        user_id=user.pk, **{fk + '__in': ids}).values_list(fk, flat=True))
+    if write_behind():
+        for pk, upvote in PendingVote.objects.filter(
+                id__in=_latest_pending(model, ids, user.pk)).values_list('object_id', 'upvote'):
+            if upvote:
+                voted.add(pk)
+            else:
+                voted.discard(pk)
+    return voted
+
+
+def vote_counts(model, ids):
+    """
+    Returns {id: votes} for the given ids, including pending deltas when
+    write-behind is on.
+    """
+    counts = dict(model.objects.filter(
+        id__in=ids).values_list('id', 'vote_count'))
+    if write_behind():
+        for pk, delta in pending_deltas(model, list(counts)).items():
+            counts[pk] += delta
+    return counts
+
+
+def add_pending_votes(hits):
+    """
+    Adds the pending deltas to the `votes` of `{type, id, votes}` dicts,
+    such as search hits, when write-behind is on.
+    """
+    if write_behind():
+        for kind, model in VOTABLE.items():
+            deltas = pending_deltas(
+                model, [hit['id'] for hit in hits if hit['type'] == kind])
+            for hit in hits:
+                if hit['type'] == kind:
+                    hit['votes'] += deltas.get(hit['id'], 0)
+    return hits
+
+
+def _parent_field(model):
+    return 'id' if model is Question else 'question_id'
+
+
+def vote(model, pk, user, upvote):
+    """
+    Adds (`upvote`) or removes the user's vote on one question or answer.
+    Returns the new vote count, or None if the user had already voted
+    (or had no vote to remove). Raises model.DoesNotExist for missing or
+    inactive objects and those the user may not see.
+    """
+    question_id = model.objects.visible_to(user).filter(id=pk).values_list(
+        _parent_field(model), flat=True).get()
+    if write_behind():
+        if (pk in voted_ids(model, user, [pk])) == upvote:
+            return None
+        PendingVote.objects.create(kind=model._meta.model_name, object_id=pk,
+                                   question_id=question_id, user=user, upvote=upvote)
+        return vote_counts(model, [pk])[pk]
+    changed = (add_votes if upvote else remove_votes)(model, user.pk, [pk])
+    if not changed:
+        return None
+    delta = 1 if upvote else -1
+    reputation.credit_author(model, pk, reputation.VOTE_WEIGHTS[model] * delta)
+    if model is Question:
+        model.objects.filter(id=pk).update(
+            vote_count=F('vote_count') + delta, content_version=F('content_version') + 1,
+            rank_stale=True)
+    else:
+        model.objects.filter(id=pk).update(vote_count=F('vote_count') + delta)
+        Question.objects.filter(id=question_id).update(
+            content_version=F('content_version') + 1, rank_stale=True)
+    return model.objects.filter(id=pk).values_list('vote_count', flat=True).get()
+
+
+def apply_votes(user, items):
+    """
+    Applies a batch of `{type, id, upvote}` votes by `user` with a fixed
+    number of queries per votable type, and returns a result per item.
+
+    An upvote of something already voted for, or removing a vote that
+    does not exist, is reported as invalid; only the first vote on a
+    given object in the batch is considered. Must run inside a transaction.
+    """
+    queue = write_behind()
+    results = [{'type': item['type'], 'id': item['id']} for item in items]
+    seen = set()
+    touched_questions = set()
+    scores = {}
+    for kind, model in VOTABLE.items():
+        indexes = []
+        for i, item in enumerate(items):
+            if item['type'] != kind:
+                continue
+            if (kind, item['id']) in seen:
+                results[i]['status'] = 'duplicate'
+                continue
+            seen.add((kind, item['id']))
+            indexes.append(i)
+        if not indexes:
+            continue
+
+        ids = [items[i]['id'] for i in indexes]
+        questions, authors = {}, {}
+        for pk, question_id, user_id in model.objects.visible_to(user).filter(
+                id__in=ids).values_list('id', _parent_field(model), 'user_id'):
+            questions[pk], authors[pk] = question_id, user_id
+        if queue:
+            voted = voted_ids(model, user, list(questions))
+            queued = [items[i] for i in indexes if items[i]['id'] in questions
+                      and items[i]['upvote'] != (items[i]['id'] in voted)]
+            PendingVote.objects.bulk_create([PendingVote(
+                kind=kind, object_id=item['id'], question_id=questions[item['id']],
+                user=user, upvote=item['upvote']) for item in queued])
+            adds = {item['id'] for item in queued if item['upvote']}
+            removes = {item['id'] for item in queued if not item['upvote']}
+        else:
+            adds = add_votes(model, user.pk, [
+                items[i]['id'] for i in indexes if items[i]['upvote'] and items[i]['id'] in questions])
+            removes = remove_votes(model, user.pk, [
+                items[i]['id'] for i in indexes if not items[i]['upvote'] and items[i]['id'] in questions])
+
+        for i in indexes:
+            pk = items[i]['id']
+            if pk not in questions:
+                results[i]['status'] = 'not_found'
+            elif pk in adds or pk in removes:
+                results[i]['status'] = 'ok'
+                touched_questions.add(questions[pk])
+            else:
+                results[i]['status'] = 'invalid'
+
+        if adds and not queue:
+            model.objects.filter(id__in=adds).update(
+                vote_count=F('vote_count') + 1)
+        if removes and not queue:
+            model.objects.filter(id__in=removes).update(
+                vote_count=F('vote_count') - 1)
+        if not queue:
+            reputation.add_vote_deltas(scores, model, authors, {
+                **{pk: 1 for pk in adds}, **{pk: -1 for pk in removes}})
+
+        counts = vote_counts(model, list(questions))
+        for i in indexes:
+            if items[i]['id'] in counts:
+                results[i]['votes'] = counts[items[i]['id']]
+
+    # queued votes move the question etags by themselves, see
+    # QuestionVersionMixin
+    if touched_questions and not queue:
+        Question.objects.filter(id__in=touched_questions).update(
+            content_version=F('content_version') + 1, rank_stale=True)
+    reputation.adjust(scores)
+    return results
+
+
+def flush_pending(limit=1000):
+    """
+    Applies up to `limit` of the oldest queued votes to the vote tables
+    and counters, with one counter update per distinct delta, and returns
+    how many were consumed. Must run inside a transaction.
+    """
+    batch = list(PendingVote.objects.select_for_update(skip_locked=True).order_by('id').values_list(
+        'id', 'kind', 'object_id', 'question_id', 'user_id', 'upvote')[:limit])
+    if not batch:
+        return 0
+    latest = {}
+    for _, kind, pk, _, user_id, upvote in batch:
+        latest[kind, pk, user_id] = upvote
+    scores = {}
+
+    for kind, model in VOTABLE.items():
+        deltas = Counter()
+        for _, pk in add_vote_pairs(model, [(user_id, pk) for (k, pk, user_id), upvote
+                                            in latest.items() if k == kind and upvote]):
+            deltas[pk] += 1
+        for _, pk in remove_vote_pairs(model, [(user_id, pk) for (k, pk, user_id), upvote
+                                               in latest.items() if k == kind and not upvote]):
+            deltas[pk] -= 1
+        by_delta = {}
+        for pk, delta in deltas.items():
+            if delta:
+                by_delta.setdefault(delta, []).append(pk)
+        for delta, ids in by_delta.items():
+            model.objects.filter(id__in=ids).update(
+                vote_count=F('vote_count') + delta)
+        if by_delta:
+            authors = dict(model.objects.filter(id__in=deltas).values_list('id', 'user_id'))
+            reputation.add_vote_deltas(scores, model, authors, deltas)
+    reputation.adjust(scores)
+
+    # dropping the queued rows changes what the question pages show just
+    # like the vote itself did
+    Question.objects.filter(id__in={row[3] for row in batch}).update(
+        content_version=F('content_version') + 1, rank_stale=True)
+    PendingVote.objects.filter(id__in=[row[0] for row in batch]).delete()
+    return len(batch)
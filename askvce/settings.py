@@ -15,6 +15,7 @@ try:
 except ImportError:
     raise Exception("A local_settings.py file is required to run this project")
 
+import tempfile
 from pathlib import Path
 from datetime import timedelta
 
@@ -51,6 +52,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -134,6 +136,55 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# The version stamps of api.cache must be visible to every worker process,
+# so REFERENCE_CACHE_ALIAS names a shared backend of its own (file based
+# on a single host, memcached when running on several).
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'reference': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': Path(tempfile.gettempdir()) / 'askvce-reference',
+    },
+}
+
+REFERENCE_CACHE_ALIAS = 'reference'
+
+# Votes
+# With write-behind on, votes are queued and acknowledged, and applied to
+# the counters in batches by `manage.py flush_votes --loop`, which must be
+# kept running. Meant for bursts of votes on a few hot posts.
+
+VOTE_WRITE_BEHIND = False
+
+# Ranking
+# `?sort=hot` serves the scores `manage.py rank_questions --loop` keeps
+# current (api.ranking). A question's votes count as much as HOT_DECAY
+# seconds of age per power of ten, and each answer as HOT_ANSWER_WEIGHT
+# votes.
+
+HOT_DECAY = 45000
+HOT_ANSWER_WEIGHT = 2
+
+# Metrics
+# Each worker process writes its request metrics (api.metrics) to
+# METRICS_DIR every METRICS_FLUSH_INTERVAL seconds, for /metrics to sum.
+# Set it, to a directory emptied on deploy, when running several workers;
+# with None /metrics only reports the process answering it.
+
+METRICS_DIR = None
+METRICS_FLUSH_INTERVAL = 5
+
+# Requests staff send with `X-Profile: 1` are profiled and saved here
+# (api.profiling), keeping the newest PROFILE_KEEP.
+
+PROFILE_DIR = BASE_DIR / '.profiles'
+PROFILE_KEEP = 50
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -141,12 +192,20 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'api.User'
 
 REST_FRAMEWORK = {
-    # 'DEFAULT_AUTHENTICATION_CLASSES': (
-    #     'rest_framework_simplejwt.authentication.JWTAuthentication',
-    # ),
+    'DEFAULT_AUTHENTICATION_CLASSES': (
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+        'api.authentication.CachedJWTAuthentication',
+    ),
     'TEST_REQUEST_DEFAULT_FORMAT': 'json'
 }
 
+# Seconds a JWT authenticated user is served from the in-process cache
+# (api.authentication) without a query. Saved users are dropped at once
+# through a version stamp in the reference cache; bulk updates only after
+# this long.
+AUTH_USER_CACHE_TTL = 30
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=5),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=2),
@@ -23,6 +23,7 @@ from rest_framework_simplejwt.views import (
 )
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
+from api.views import Metrics, ProfileList, ProfileRetrieve
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -41,6 +42,9 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api-auth/', include('rest_framework.urls')),
     path('api/v1/', include('api.urls')),
+    path('metrics', Metrics.as_view(), name='metrics'),
+    path('profiles', ProfileList.as_view(), name='profiles'),
+    path('profiles/<str:capture>', ProfileRetrieve.as_view(), name='profile'),
     path('api/v1/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/v1/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/token/verify/', TokenVerifyView.as_view(), name='token_verify'),
@@ -0,0 +1,195 @@
+"""
+Compares the sync read endpoints served over WSGI with their async
+variants served over ASGI, under sustained concurrent load.
+
+Start both servers against the same, seeded database, e.g.
+
+    gunicorn askvce.wsgi -w 4 -k gthread --threads 8 -b 127.0.0.1:8001
+    uvicorn askvce.asgi:application --workers 4 --port 8002
+
+then run
+
+    python benchmarks/asgi_vs_wsgi.py --user 1602-18-733-010 --password secret \\
+        --wsgi http://127.0.0.1:8001 --asgi http://127.0.0.1:8002 -c 256 -d 30
+
+Every endpoint is hit by `--concurrency` keep-alive connections for
+`--duration` seconds on each server, the WSGI one on /api/v1/... and the
+ASGI one on /api/v1/async/.... The report has requests per second, p50
+and p99 latency and the number of failed requests. The load generator is
+a single asyncio process; run it from another machine if it saturates a
+core before the servers do.
+"""
+import argparse
+import asyncio
+import http.cookiejar
+import json
+import math
+import re
+import time
+import urllib.parse
+import urllib.request
+from urllib.parse import urlsplit
+
+ENDPOINTS = (
+    ('departments', 'departments'),
+    ('questions', 'questions'),
+    ('question', 'questions/{question}'),
+    ('answers', 'questions/{question}/answers'),
+)
+
+
+def login(url, user, password):
+    """
+    Logs in through the browsable API login form and returns the session
+    cookie. Basic auth would hash the password on every request and drown
+    out what is being measured.
+    """
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(
+        urllib.request.HTTPCookieProcessor(jar))
+    form = opener.open(url + '/api-auth/login/').read().decode()
+    token = re.search(
+        r'name="csrfmiddlewaretoken" value="([^"]+)"', form).group(1)
+    opener.open(urllib.request.Request(
+        url + '/api-auth/login/', headers={'Referer': url + '/api-auth/login/'},
+        data=urllib.parse.urlencode({
+            'username': user, 'password': password,
+            'csrfmiddlewaretoken': token, 'next': '/api/v1/departments',
+        }).encode()))
+    for cookie in jar:
+        if cookie.name == 'sessionid':
+            return 'sessionid=%s' % cookie.value
+    raise SystemExit('Login failed')
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[max(math.ceil(p / 100 * len(values)) - 1, 0)]
+
+
+async def request(reader, writer, host, path, cookie):
+    """
+    Sends one GET on the connection and reads the response. Returns the
+    status code, the body and whether the server keeps the connection.
+    """
+    writer.write((
+        'GET %s HTTP/1.1\r\nHost: %s\r\nCookie: %s\r\n'
+        'Accept: application/json\r\n\r\n' % (path, host, cookie)).encode('latin-1'))
+    await writer.drain()
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed')
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if 'chunked' in headers.get('transfer-encoding', ''):
+        body = b''
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            chunk = await reader.readexactly(size + 2)
+            if not size:
+                break
+            body += chunk[:-2]
+    else:
+        body = await reader.readexactly(int(headers.get('content-length', 0)))
+    keep_alive = headers.get('connection', '').lower() != 'close'
+    return status, body, keep_alive
+
+
+async def connect(url):
+    parts = urlsplit(url)
+    return await asyncio.open_connection(parts.hostname, parts.port or 80)
+
+
+async def get(url, path, cookie):
+    reader, writer = await connect(url)
+    try:
+        return await request(reader, writer, urlsplit(url).netloc, path, cookie)
+    finally:
+        writer.close()
+
+
+async def client(url, path, cookie, deadline, latencies, failures):
+    host = urlsplit(url).netloc
+    connection = None
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            if connection is None:
+                connection = await connect(url)
+            status, _, keep_alive = await request(*connection, host, path, cookie)
+        except (ConnectionError, OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+            failures.append(path)
+            connection = None
+            continue
+        latencies.append(time.perf_counter() - start)
+        if status != 200:
+            failures.append(path)
+        if not keep_alive:
+            connection[1].close()
+            connection = None
+    if connection is not None:
+        connection[1].close()
+
+
+async def run(url, path, cookie, concurrency, duration):
+    latencies, failures = [], []
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*[client(url, path, cookie, deadline, latencies, failures)
+                           for _ in range(concurrency)])
+    return {
+        'requests': len(latencies),
+        'rps': len(latencies) / duration,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'failures': len(failures),
+    }
+
+
+async def main(options):
+    cookie = login(options.wsgi, options.user, options.password)
+    question = options.question
+    if question is None:
+        status, body, _ = await get(options.wsgi, '/api/v1/questions', cookie)
+        if status != 200 or not json.loads(body)['results']:
+            raise SystemExit('Could not pick a question, pass --question')
+        question = json.loads(body)['results'][0]['id']
+
+    report = []
+    for name, template in ENDPOINTS:
+        path = template.format(question=question)
+        for server, url, prefix in (('wsgi', options.wsgi, '/api/v1/'),
+                                    ('asgi', options.asgi, '/api/v1/async/')):
+            result = await run(url, prefix + path, cookie,
+                               options.concurrency, options.duration)
+            result.update(endpoint=name, server=server)
+            report.append(result)
+            print('%-12s %-5s %9.1f req/s  p50 %8.1f ms  p99 %8.1f ms  %d failed' % (
+                name, server, result['rps'], result['p50_ms'], result['p99_ms'], result['failures']))
+    if options.json:
+        with open(options.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--wsgi', required=True,
+                        help='Base URL of the WSGI server.')
+    parser.add_argument('--asgi', required=True,
+                        help='Base URL of the ASGI server.')
+    parser.add_argument('--user', required=True, help='htno to log in with.')
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--question', type=int,
+                        help='Question to read, defaults to the newest one.')
+    parser.add_argument('-c', '--concurrency', type=int, default=256)
+    parser.add_argument('-d', '--duration', type=float, default=30.0,
+                        help='Seconds per endpoint and server.')
+    parser.add_argument('--json', help='Also write the report to this file.')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,304 @@
+"""
+Latency and query count benchmark of every route in api/urls.py, at
+configurable data volumes.
+
+A separate test database is created (and dropped afterwards unless
+--keepdb is given), seeded by benchmarks.seed and hit in-process through
+the test client, so neither a server nor the network is measured. Runs
+against the database configured in the settings, usually a local
+PostgreSQL, or with --sqlite against a SQLite file:
+
+    python benchmarks/endpoints.py --sqlite --questions 20000 -o before.json
+    python benchmarks/endpoints.py --sqlite --keepdb -o after.json --compare before.json
+
+Write requests run in a transaction that is rolled back afterwards, so
+every iteration sees the same data. Savepoint statements are left out of
+the query counts, since in production those views run in the outermost
+transaction and do not need them.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+SQLITE_PATH = Path(__file__).resolve().parent / 'benchmark.sqlite3'
+
+
+def setup_django(options):
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'askvce.settings')
+    from django.conf import settings
+    if options.sqlite:
+        settings.DATABASES = {'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': str(SQLITE_PATH),
+            'TEST': {'NAME': str(SQLITE_PATH)},
+        }}
+    import django
+    django.setup()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[max(int(round(p / 100 * len(values) + 0.5)) - 1, 0)]
+
+
+class Fixtures:
+    """
+    The users and objects the requests are made with, created on top of
+    the seeded data.
+    """
+
+    def __init__(self):
+        from django.contrib.auth import get_user_model
+        from api.models import Answer, Department, Question
+        User = get_user_model()
+        self.department = department = Department.objects.get(code='CSE')
+
+        def user(i, **fields):
+            user, _ = User.objects.get_or_create(htno='BENCH-%d' % i, defaults=dict(
+                email='bench%d@seed.invalid' % i, user_name='bench%d' % i, first_name='Bench',
+                last_name=str(i), dob='2000-01-01', grad_year=2022, phone='9%09d' % i,
+                department=department, is_active=True, **fields))
+            return user
+
+        self.reader = user(1)
+        self.author = user(2)
+        self.staff = user(3, is_staff=True)
+        # the most answered visible question everyone can see
+        self.question = Question.objects.visible().filter(audience_grad_year=None).order_by(
+            '-answer__id').first() or Question.objects.create(user=self.author, title='hot?')
+        self.answer, _ = Answer.objects.get_or_create(
+            question=self.question, user=self.author, body='benchmark answer')
+        self.unanswered, _ = Question.objects.get_or_create(
+            user=self.author, title='benchmark question?')
+        self.other_answer = Answer.objects.filter(
+            question=self.question, is_active=True, is_hidden=False).exclude(
+            user=self.author).first() or self.answer
+        self.search = 'exam result'
+
+
+def routes(f):
+    """
+    Requests per URL name: (label, method, url args, query or body, user).
+    """
+    q, a = f.question.pk, f.answer.pk
+    return {
+        'departments': [('list', 'get', (), None, None)],
+        'department-leaderboard': [('list', 'get', (f.department.pk,), None, f.reader)],
+        'tags': [('list', 'get', (), None, f.reader)],
+        'users': [('create', 'post', (), {
+            'email': '1602-18-733-999@vce.ac.in', 'user_name': 'newbie', 'first_name': 'New',
+            'last_name': 'Bie', 'dob': '2001-01-01', 'grad_year': 2023, 'htno': '1602-18-733-999',
+            'phone': '9999999999', 'department': f.department.pk, 'password': 'secret123'}, None)],
+        'user': [('retrieve', 'get', (f.reader.pk,), None, f.reader)],
+        'questions': [
+            ('list', 'get', (), None, f.reader),
+            ('list tagged', 'get', (), {'tags': 'cse,general', 'match': 'any'}, f.reader),
+            ('list hot', 'get', (), {'sort': 'hot'}, f.reader),
+            ('create', 'post', (), {'title': 'new question?', 'body': 'body',
+                                    'scope': 'college', 'tags': ['general']}, f.reader),
+        ],
+        'question': [
+            ('retrieve', 'get', (q,), None, f.reader),
+            ('update', 'patch', (f.unanswered.pk,), {'title': 'changed?'}, f.author),
+            ('destroy', 'delete', (f.unanswered.pk,), None, f.author),
+        ],
+        'question-thread': [('retrieve', 'get', (q,), None, f.reader)],
+        'question-answers': [
+            ('list', 'get', (q,), None, f.reader),
+            ('create', 'post', (q,), {'body': 'new answer'}, f.reader),
+        ],
+        'question-answer': [
+            ('retrieve', 'get', (q, a), None, f.reader),
+            ('update', 'patch', (q, a), {'body': 'changed'}, f.author),
+            ('destroy', 'delete', (q, a), None, f.author),
+        ],
+        'question-vote': [('vote', 'post', (q,), {'upvote': True}, f.reader)],
+        'answer-vote': [('vote', 'post', (a,), {'upvote': True}, f.reader)],
+        'votes-batch': [('20 votes', 'post', (), [
+            {'type': 'answer', 'id': pk, 'upvote': True}
+            for pk in f.question.answer_set.values_list('pk', flat=True)[:20]], f.reader)],
+        'question-flag': [('flag', 'post', (q,), {'reason': 'less', 'question': q}, f.reader)],
+        'answer-flag': [('flag', 'post', (f.other_answer.pk,), {
+            'reason': 'less', 'answer': f.other_answer.pk}, f.reader)],
+        'search': [('search', 'get', (), {'q': f.search}, f.reader)],
+        'export': [('since', 'get', (), {'since': (
+            datetime.date.today() - datetime.timedelta(days=1)).isoformat()}, f.staff)],
+        'async-departments': [('list', 'get', (), None, None)],
+        'async-questions': [('list', 'get', (), None, f.reader)],
+        'async-question': [('retrieve', 'get', (q,), None, f.reader)],
+        'async-question-answers': [('list', 'get', (q,), None, f.reader)],
+    }
+
+
+def measure(client, method, url, data, iterations, warmup):
+    from django.db import connection, transaction
+    from django.test.utils import CaptureQueriesContext
+
+    timings, queries, statuses = [], [], set()
+    for i in range(warmup + iterations):
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                if method == 'get':
+                    res = client.get(url, data)
+                else:
+                    res = getattr(client, method)(url, data, format='json')
+                if res.streaming:
+                    for _ in res.streaming_content:
+                        pass
+                elapsed = time.perf_counter() - start
+            transaction.set_rollback(True)
+        if i < warmup:
+            continue
+        timings.append(elapsed * 1000)
+        queries.append(sum(1 for query in ctx.captured_queries
+                           if 'SAVEPOINT' not in query['sql']))
+        statuses.add(res.status_code)
+    return {
+        'status': sorted(statuses),
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p90_ms': round(percentile(timings, 90), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'mean_ms': round(statistics.mean(timings), 3),
+        'queries': max(queries),
+        'queries_min': min(queries),
+    }
+
+
+def run(options):
+    from django.db import connection
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+    import django
+    from api import urls
+
+    fixtures = Fixtures()
+    table = routes(fixtures)
+    names = [pattern.name for pattern in urls.urlpatterns if pattern.name]
+    results = {}
+    for name in names:
+        for label, method, args, data, user in table.get(name, ()):
+            client = APIClient()
+            if user is not None:
+                client.force_authenticate(user)
+            key = '%s %s' % (name, label)
+            if options.only and not any(part in key for part in options.only):
+                continue
+            result = measure(client, method, reverse(name, args=args), data,
+                             options.iterations, options.warmup)
+            result.update(route=name, method=method.upper())
+            results[key] = result
+            print('%-36s %-6s p50 %8.2f ms  p99 %8.2f ms  %3d queries  %s' % (
+                key, method.upper(), result['p50_ms'], result['p99_ms'], result['queries'],
+                ','.join(map(str, result['status']))))
+
+    missing = sorted(set(names) - set(table))
+    for name in missing:
+        print('no benchmark for route %s' % name)
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BASE_DIR, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'meta': {
+            'commit': commit,
+            'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'volumes': {name: getattr(options, name) for name in VOLUMES},
+            'iterations': options.iterations,
+        },
+        'missing': missing,
+        'results': results,
+    }
+
+
+def compare(report, baseline, threshold):
+    """
+    Prints the change against a previous report. Returns True if any
+    request now runs more queries.
+    """
+    worse = False
+    print('\n%-36s %19s %19s' % ('', 'p50 ms', 'queries'))
+    for key, result in report['results'].items():
+        old = baseline['results'].get(key)
+        if old is None:
+            continue
+        ratio = result['p50_ms'] / old['p50_ms'] if old['p50_ms'] else 1
+        flags = []
+        if ratio > threshold:
+            flags.append('slower')
+        if result['queries'] > old['queries']:
+            flags.append('more queries')
+            worse = True
+        print('%-36s %8.2f -> %8.2f %8d -> %8d  %s' % (
+            key, old['p50_ms'], result['p50_ms'], old['queries'], result['queries'], ' '.join(flags)))
+    return worse
+
+
+VOLUMES = ('users', 'questions', 'answers', 'votes', 'flags')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sqlite', action='store_true',
+                        help='Use a SQLite file instead of the configured database.')
+    parser.add_argument('--keepdb', action='store_true',
+                        help='Keep the benchmark database, and reuse it if already seeded.')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--questions', type=int, default=10000)
+    parser.add_argument('--answers', type=int, default=30000)
+    parser.add_argument('--votes', type=int, default=100000)
+    parser.add_argument('--flags', type=int, default=200)
+    parser.add_argument('-n', '--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--only', nargs='*',
+                        help='Only requests whose "route label" contains one of these.')
+    parser.add_argument('-o', '--output', help='Write the JSON report here.')
+    parser.add_argument('--compare', help='Previous JSON report to compare with.')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='p50 ratio over which a request is reported slower.')
+    options = parser.parse_args()
+
+    setup_django(options)
+    from django.test.utils import (setup_databases, setup_test_environment,
+                                   teardown_databases, teardown_test_environment)
+    from api.models import Question
+    from benchmarks.seed import seed
+
+    setup_test_environment()
+    databases = setup_databases(verbosity=0, interactive=False, keepdb=options.keepdb)
+    try:
+        if not Question.objects.exists():
+            start = time.perf_counter()
+            seed(**{name: getattr(options, name) for name in VOLUMES},
+                 log=lambda line: print('seeding %s' % line))
+            print('seeded in %.1fs' % (time.perf_counter() - start))
+        report = run(options)
+    finally:
+        if not options.keepdb:
+            teardown_databases(databases, verbosity=0)
+        teardown_test_environment()
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if options.compare:
+        with open(options.compare) as f:
+            if compare(report, json.load(f), options.threshold):
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Synthetic data at production-like volumes for the endpoint benchmarks.
+
+Everything is written with bulk_create, so model validators and save
+signals do not run. The denormalized counters (votes, flags, tag counts)
+are rebuilt from the seeded rows at the end. Popularity is skewed
+towards a small share of the questions, as it is in practice, and text
+comes from a small vocabulary so searches have realistic hit counts.
+"""
+import io
+import random
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from api.models import (Answer, AnswerFlag, Department, Question, QuestionFlag,
+                        QuestionTag, Tag)
+
+BATCH_SIZE = 2000
+GRAD_YEARS = (2021, 2022, 2023, 2024)
+SCOPES = (('college', 60), ('grad_year', 25), ('branch_grad_year', 15))
+VOCABULARY = (
+    'exam', 'syllabus', 'lab', 'record', 'internal', 'marks', 'attendance',
+    'placement', 'interview', 'resume', 'project', 'guide', 'semester',
+    'backlog', 'revaluation', 'hostel', 'canteen', 'library', 'fees',
+    'scholarship', 'sports', 'fest', 'club', 'coding', 'contest', 'python',
+    'java', 'database', 'network', 'compiler', 'circuit', 'signals',
+    'machine', 'drawing', 'survey', 'concrete', 'thermodynamics', 'fluid',
+    'timetable', 'holiday', 'bus', 'parking', 'wifi', 'portal', 'faculty',
+    'notes', 'assignment', 'deadline', 'elective', 'minor', 'honours',
+    'internship', 'certificate', 'hall', 'ticket', 'result', 'grade',
+)
+
+
+def words(rng, count):
+    return ' '.join(rng.choice(VOCABULARY) for _ in range(count))
+
+
+def skewed(rng, items):
+    """
+    Picks from `items` favouring the front: a fifth of the items get
+    about half of the picks.
+    """
+    return items[int(len(items) * rng.random() ** 2.3)]
+
+
+def seed(users=1000, questions=10000, answers=30000, votes=100000, flags=200,
+         tags=40, random_seed=0, log=print):
+    """
+    Seeds the given volumes on top of the departments and tags created by
+    the migrations. `votes` is split evenly between questions and answers,
+    and so is `flags`; duplicates are dropped, so the final counts may be
+    slightly lower.
+    """
+    rng = random.Random(random_seed)
+    User = get_user_model()
+    departments = list(Department.objects.values_list('id', flat=True))
+
+    log('users: %d' % users)
+    password = make_password('benchmark')
+    User.objects.bulk_create([User(
+        email='user%d@seed.invalid' % i, user_name='seed%d' % i,
+        first_name='Seed', last_name=str(i), dob='2000-01-01',
+        grad_year=rng.choice(GRAD_YEARS), htno='SEED-%07d' % i,
+        phone='%010d' % i, department_id=rng.choice(departments),
+        password=password, is_active=True) for i in range(users)], batch_size=BATCH_SIZE)
+    authors = list(User.objects.filter(htno__startswith='SEED-').values_list(
+        'id', 'grad_year', 'department_id'))
+    user_ids = [author[0] for author in authors]
+
+    Tag.objects.bulk_create([Tag(slug='topic-%d' % i, description='Topic %d' % i)
+                             for i in range(tags)], ignore_conflicts=True)
+    tag_ids = list(Tag.objects.values_list('slug', flat=True))
+
+    log('questions: %d' % questions)
+    scopes, weights = zip(*SCOPES)
+    batch = []
+    for i in range(questions):
+        author_id, grad_year, department_id = rng.choice(authors)
+        scope = rng.choices(scopes, weights)[0]
+        batch.append(Question(
+            user_id=author_id, title=words(rng, 8) + '?', body=words(rng, 40), scope=scope,
+            audience_grad_year=None if scope == 'college' else grad_year,
+            audience_department_id=department_id if scope == 'branch_grad_year' else None))
+        if len(batch) == BATCH_SIZE:
+            Question.objects.bulk_create(batch)
+            batch = []
+    Question.objects.bulk_create(batch)
+    # newest first, so the popular ones are also the recent ones
+    question_ids = list(Question.objects.order_by(
+        '-created_at', '-id').values_list('id', flat=True))
+
+    QuestionTag.objects.bulk_create([
+        QuestionTag(question_id=question_id, tag_id=tag_id)
+        for question_id in question_ids
+        for tag_id in rng.sample(tag_ids, rng.randint(1, 3))], batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+    log('answers: %d' % answers)
+    batch = []
+    for i in range(answers):
+        batch.append(Answer(question_id=skewed(rng, question_ids),
+                            user_id=rng.choice(user_ids), body=words(rng, 30)))
+        if len(batch) == BATCH_SIZE:
+            Answer.objects.bulk_create(batch)
+            batch = []
+    Answer.objects.bulk_create(batch)
+    answer_ids = list(Answer.objects.order_by(
+        '-created_at', '-id').values_list('id', flat=True))
+
+    log('votes: %d' % votes)
+    QuestionVote, AnswerVote = Question.votes.through, Answer.votes.through
+    if question_ids:
+        QuestionVote.objects.bulk_create([
+            QuestionVote(question_id=skewed(rng, question_ids), user_id=rng.choice(user_ids))
+            for _ in range(votes // 2)], batch_size=BATCH_SIZE, ignore_conflicts=True)
+    if answer_ids:
+        AnswerVote.objects.bulk_create([
+            AnswerVote(answer_id=skewed(rng, answer_ids), user_id=rng.choice(user_ids))
+            for _ in range(votes - votes // 2)], batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+    log('flags: %d' % flags)
+    reasons = [reason for reason, _ in QuestionFlag.reasons]
+    if question_ids:
+        QuestionFlag.objects.bulk_create([
+            QuestionFlag(question_id=rng.choice(question_ids), user_id=rng.choice(user_ids),
+                         reason=rng.choice(reasons)) for _ in range(flags // 2)], ignore_conflicts=True)
+    if answer_ids:
+        AnswerFlag.objects.bulk_create([
+            AnswerFlag(answer_id=rng.choice(answer_ids), user_id=rng.choice(user_ids),
+                       reason=rng.choice(reasons)) for _ in range(flags - flags // 2)], ignore_conflicts=True)
+    # a flag hides what it flags
+    Question.objects.filter(id__in=QuestionFlag.objects.values(
+        'question_id')).update(is_hidden=True)
+    Answer.objects.filter(id__in=AnswerFlag.objects.values(
+        'answer_id')).update(is_hidden=True)
+
+    log('counters')
+    call_command('rebuild_counters', stdout=io.StringIO())
+    call_command('rank_questions', stdout=io.StringIO())
+    call_command('reconcile_reputation', stdout=io.StringIO())
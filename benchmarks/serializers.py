@@ -0,0 +1,88 @@
+"""
+Objects per second serialized and rendered by the ModelSerializer path
+and by the fast_serializers row path, for question and answer pages.
+
+Seeds a SQLite file like benchmarks/endpoints.py does (or reuses it with
+--keepdb) and times, per page of --page-size objects, the query, the
+serialization and the JSON rendering:
+
+    python benchmarks/serializers.py --page-size 100 -n 200
+"""
+import argparse
+import statistics
+import sys
+import time
+import types
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def timed(function, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--keepdb', action='store_true')
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('-n', '--iterations', type=int, default=100)
+    options = parser.parse_args()
+
+    from benchmarks.endpoints import setup_django
+    setup_django(types.SimpleNamespace(sqlite=True))
+    from django.contrib.auth import get_user_model
+    from django.db.models import Count
+    from django.test.utils import (setup_databases, setup_test_environment,
+                                   teardown_databases, teardown_test_environment)
+    from rest_framework.renderers import JSONRenderer
+    from api import fast_serializers
+    from api.models import Answer, Question
+    from api.renderers import FastJSONRenderer, orjson
+    from api.serializers import AnswerSerializer, QuestionSerializer
+    from benchmarks.seed import seed
+
+    setup_test_environment()
+    databases = setup_databases(verbosity=0, interactive=False, keepdb=options.keepdb)
+    try:
+        if not Question.objects.exists():
+            seed(users=200, questions=2000, answers=20000, votes=20000, flags=0, log=lambda line: None)
+        request = types.SimpleNamespace(user=get_user_model().objects.filter(
+            htno__startswith='SEED-').first())
+        # the most answered question
+        question = Answer.objects.values('question_id').annotate(
+            count=Count('id')).order_by('-count')[0]['question_id']
+        pages = (
+            ('questions', QuestionSerializer, fast_serializers.questions,
+             Question.objects.visible_to(request.user).for_display()),
+            ('answers', AnswerSerializer, fast_serializers.answers,
+             Answer.objects.for_display().filter(question_id=question, is_active=True, is_hidden=False)),
+        )
+        print('orjson %s' % ('installed' if orjson else 'not installed, rendering falls back to json'))
+        for name, serializer, rows, queryset in pages:
+            queryset = queryset.order_by('-created_at', '-id')[:options.page_size]
+            size = len(queryset)
+
+            def model_path():
+                JSONRenderer().render(serializer(
+                    queryset.all(), many=True, context={'request': request}).data)
+
+            def row_path():
+                FastJSONRenderer().render(rows.serialize(list(rows.values(queryset.all())), request))
+
+            before, after = timed(model_path, options.iterations), timed(row_path, options.iterations)
+            print('%-10s %4d per page  ModelSerializer %9.0f objects/s  rows %9.0f objects/s  %.1fx' % (
+                name, size, size / before, size / after, before / after))
+    finally:
+        if not options.keepdb:
+            teardown_databases(databases, verbosity=0)
+        teardown_test_environment()
+
+
+if __name__ == '__main__':
+    main()